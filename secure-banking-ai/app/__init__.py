@@ -2,37 +2,68 @@ import os
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
-from flask_session import Session
+from .replica import RoutingSession
 
 # ----------------------------
 # Extensions (single instances)
 # ----------------------------
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})   # see app/replica.py
 migrate = Migrate()
 
 # ----------------------------
 # Application Factory
 # ----------------------------
-def create_app():
-    app = Flask(__name__)
-    app.config['SECRET_KEY'] = 'supersecretkey'
+def create_app(test_config=None, config_name=None):
+    from config import CONFIGS
 
-    # Always use absolute path for SQLite DB
-    basedir = os.path.abspath(os.path.dirname(__file__))
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, '..', 'securebank.db')
+    app = Flask(__name__)
 
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Settings come from config.py: SECUREBANK_CONFIG picks the profile
+    # (development, production or testing); test_config overrides on top.
+    config_name = config_name or os.environ.get('SECUREBANK_CONFIG', 'default')
+    if config_name not in CONFIGS:
+        raise ValueError(f"Unknown config {config_name!r}; expected one of {sorted(CONFIGS)}")
+    app.config.from_object(CONFIGS[config_name])
 
-    # Session settings
-    app.config['SESSION_TYPE'] = 'filesystem'
-    Session(app)
+    if test_config:
+        app.config.update(test_config)
 
     # Init extensions
+    from .replica import init_replica
+    init_replica(app)   # adds the replica bind, so before db.init_app
+
     db.init_app(app)
     migrate.init_app(app, db)
 
+    from .database import init_database
+    init_database(app)
+
+    from .sessions import init_sessions
+    init_sessions(app)
+
+    from .hashing import init_hashing
+    init_hashing(app)
+
+    from .metrics import init_metrics
+    init_metrics(app)
+
+    from .dashboard import init_dashboard
+    init_dashboard(app)
+
+    from .recipients import init_recipients
+    init_recipients(app)
+
+    from .idempotency import init_idempotency
+    init_idempotency(app)
+
     # Import and register blueprints
     from .routes import main
     app.register_blueprint(main)
 
+    from .api import api
+    app.register_blueprint(api)   # /api/v1
+
+    from .commands import register_commands
+    register_commands(app)
+
     return app
@@ -0,0 +1,81 @@
+import functools
+import operator
+from collections import namedtuple
+from datetime import timedelta
+from sqlalchemy import func, select
+from .ledger import CREDIT_TYPES, DEBIT_TYPES
+from .models.models import db, CounterpartyRollup, DailyRollup
+
+# Spending analytics for the dashboard charts (GET /api/v1/analytics/...).
+#
+# Everything is read from the rollups kept by app/rollups.py, never from
+# transactions: a chart over N days reads at most N daily rows of the
+# account through the (account_id, day) primary key, and the monthly
+# figures are summed from those same rows. Series are dense: days and months
+# without activity are included with zeros.
+
+MAX_DAYS = 366
+MAX_MONTHS = 12
+
+MonthSpend = namedtuple('MonthSpend', ['month', 'total', 'count', 'by_type'])
+CashFlowDay = namedtuple('CashFlowDay', ['day', 'inflow', 'outflow'])
+CounterpartyTotal = namedtuple('CounterpartyTotal', ['counterparty', 'total', 'count'])
+
+_daily, _counterparties = DailyRollup.__table__, CounterpartyRollup.__table__
+DIRECTIONS = {'out': DEBIT_TYPES, 'in': CREDIT_TYPES}
+
+
+def _added(types, measure):
+    return functools.reduce(operator.add, (_daily.c[f'{txn_type}_{measure}'] for txn_type in types))
+
+
+def _days(account_id, first, last):
+    return (_daily.c.account_id == account_id) & (_daily.c.day >= first) & (_daily.c.day <= last)
+
+
+def month_start(day, months_back=0):
+    """First day of the month `months_back` calendar months before `day`'s."""
+    year, month = divmod(day.year * 12 + day.month - 1 - months_back, 12)
+    return day.replace(year=year, month=month + 1, day=1)
+
+
+def monthly_spend(account_id, months, today):
+    """MonthSpend for each of the `months` calendar months up to `today`, oldest first."""
+    first = month_start(today, months - 1)
+    month = func.strftime('%Y-%m', _daily.c.day)
+    query = select(month, *(func.sum(_daily.c[f'{txn_type}_total']) for txn_type in DEBIT_TYPES),
+                   func.sum(_added(DEBIT_TYPES, 'count'))) \
+        .where(_days(account_id, first, today)).group_by(month)
+    found = {row[0]: row[1:] for row in db.session.execute(query)}
+
+    result = []
+    for back in range(months - 1, -1, -1):
+        key = f"{month_start(today, back):%Y-%m}"
+        *totals, count = found.get(key, (0.0,) * len(DEBIT_TYPES) + (0,))
+        by_type = {txn_type: round(total, 2) for txn_type, total in zip(DEBIT_TYPES, totals)}
+        result.append(MonthSpend(key, round(sum(totals), 2), count, by_type))
+    return result
+
+
+def cash_flow(account_id, first, last):
+    """CashFlowDay for every day from `first` to `last` inclusive."""
+    query = select(_daily.c.day, _added(CREDIT_TYPES, 'total'), _added(DEBIT_TYPES, 'total')) \
+        .where(_days(account_id, first, last))
+    found = {row[0]: row[1:] for row in db.session.execute(query)}
+    days = []
+    for offset in range((last - first).days + 1):
+        day = first + timedelta(days=offset)
+        inflow, outflow = found.get(day, (0.0, 0.0))
+        days.append(CashFlowDay(day, round(inflow, 2), round(outflow, 2)))
+    return days
+
+
+def top_counterparties(account_id, direction, since, limit):
+    """CounterpartyTotal for the largest counterparties of one direction ('out' or 'in') since `since`."""
+    total = func.sum(_counterparties.c.total)
+    query = select(_counterparties.c.counterparty, total, func.sum(_counterparties.c.count)) \
+        .where(_counterparties.c.account_id == account_id, _counterparties.c.month >= month_start(since),
+               _counterparties.c.txn_type.in_(DIRECTIONS[direction])) \
+        .group_by(_counterparties.c.counterparty).order_by(total.desc()).limit(limit)
+    return [CounterpartyTotal(counterparty, round(amount, 2), count)
+            for counterparty, amount, count in db.session.execute(query)]
@@ -0,0 +1,464 @@
+import hashlib
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional
+import msgspec
+from flask import Blueprint, current_app, request, session
+from werkzeug.exceptions import BadRequest, HTTPException, NotFound
+from sqlalchemy import bindparam, select, tuple_
+from .models.models import db, Account, AccountFeatures, Card, Subscription, Transaction, Upi
+from . import analytics, balances, ledger
+from .idempotency import DuplicateRequest, claim, fingerprint, lookup, request_key
+from .ml.scoring import FRAUD_THRESHOLD, get_scorer, transfer_features
+from .pagination import decode_cursor, decode_id_cursor, encode_cursor, encode_id_cursor
+from .recipients import forget, resolve
+from .replica import read_only
+from .routes import TRANSACTION_TYPES
+
+# JSON API, version 1, for mobile and partner clients.
+#
+# Authenticated by the same session cookie as the pages. Rows are selected
+# as plain tuples and turned into msgspec Structs, which encode to JSON
+# without a dict per row. Listings are keyset paginated (`limit`, `cursor`;
+# the response carries `next_cursor` until the last page) and answer with
+# an ETag of their body, so a client sending If-None-Match for unchanged
+# data gets an empty 304.
+#
+# The statement builders and page makers below take plain arguments so that
+# the async server (app/asgi.py) serves /balance and /transactions from the
+# same code.
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+# ---------------- Schemas ----------------
+class Error(msgspec.Struct):
+    error: str
+
+
+class Balance(msgspec.Struct):
+    account_number: str
+    balance: float
+
+
+class BalanceAt(msgspec.Struct):
+    account_number: str
+    at: datetime
+    balance: float
+
+
+class BalancePoint(msgspec.Struct):
+    day: date
+    balance: float
+
+
+class BalanceHistory(msgspec.Struct):
+    account_number: str
+    start: date
+    end: date
+    days: List[BalancePoint]
+
+
+class TransactionItem(msgspec.Struct):
+    id: int
+    txn_id: str
+    type: str
+    amount: float
+    counterparty: Optional[str]
+    remarks: Optional[str]
+    date: Optional[datetime]
+
+
+class TransactionPage(msgspec.Struct):
+    items: List[TransactionItem]
+    next_cursor: Optional[str]
+
+
+class CardItem(msgspec.Struct):
+    id: int
+    card_type: Optional[str]
+    last4: str
+    expiry: Optional[str]
+    blocked: Optional[bool]
+    limit: Optional[float]
+
+
+class CardPage(msgspec.Struct):
+    items: List[CardItem]
+    next_cursor: Optional[str]
+
+
+class UpiItem(msgspec.Struct):
+    id: int
+    upi_id: str
+    verified: Optional[bool]
+
+
+class UpiPage(msgspec.Struct):
+    items: List[UpiItem]
+    next_cursor: Optional[str]
+
+
+class SubscriptionItem(msgspec.Struct):
+    id: int
+    name: str
+    amount: float
+    frequency: str
+    active: Optional[bool]
+    next_billing_date: Optional[datetime]
+
+
+class SubscriptionPage(msgspec.Struct):
+    items: List[SubscriptionItem]
+    next_cursor: Optional[str]
+
+
+class TransferRequest(msgspec.Struct, forbid_unknown_fields=True):
+    amount: float
+    account_number: Optional[str] = None
+    upi_id: Optional[str] = None
+    remarks: str = ''
+
+
+class TransferResult(msgspec.Struct):
+    txn_id: str
+    message: str
+
+
+class MonthSpend(msgspec.Struct):
+    month: str   # YYYY-MM
+    total: float
+    count: int
+    by_type: Dict[str, float]
+
+
+class MonthlySpend(msgspec.Struct):
+    months: List[MonthSpend]
+
+
+class CashFlowDay(msgspec.Struct):
+    day: date
+    inflow: float
+    outflow: float
+
+
+class CashFlow(msgspec.Struct):
+    start: date
+    end: date
+    inflow: float
+    outflow: float
+    days: List[CashFlowDay]
+
+
+class CounterpartyTotal(msgspec.Struct):
+    counterparty: str
+    total: float
+    count: int
+
+
+class TopCounterparties(msgspec.Struct):
+    direction: str
+    since: date
+    items: List[CounterpartyTotal]
+
+
+_encoder = msgspec.json.Encoder()
+_transfer_decoder = msgspec.json.Decoder(TransferRequest)
+
+_accounts, _txns, _cards, _upis, _subs = (model.__table__ for model in
+                                          (Account, Transaction, Card, Upi, Subscription))
+ACCOUNT = select(_accounts.c.id, _accounts.c.account_number, _accounts.c.balance) \
+    .where(_accounts.c.user_id == bindparam('b_user_id')).limit(1)
+
+
+# ---------------- Shared with the async server ----------------
+def encode(obj):
+    return _encoder.encode(obj)
+
+
+def etag(body):
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def page_limit(args):
+    return min(max(args.get('limit', DEFAULT_LIMIT, type=int), 1), MAX_LIMIT)
+
+
+def _day(args, name):
+    value = args.get(name)
+    return datetime.strptime(value, '%Y-%m-%d') if value else None
+
+
+def transactions_statement(user_id, args):
+    """(statement, limit) for a page of the user's history; BadRequest for bad arguments.
+
+    Newest first; optional `type`, and `start`/`end` days (YYYY-MM-DD, inclusive).
+    """
+    query = select(_txns.c.id, _txns.c.txn_id, _txns.c.txn_type, _txns.c.amount, _txns.c.counterparty,
+                   _txns.c.remarks, _txns.c.date).where(_txns.c.user_id == user_id)
+    txn_type = args.get('type')
+    if txn_type:
+        if txn_type not in TRANSACTION_TYPES:
+            raise BadRequest(f"type must be one of {', '.join(TRANSACTION_TYPES)}.")
+        query = query.where(_txns.c.txn_type == txn_type)
+    try:
+        start, end = _day(args, 'start'), _day(args, 'end')
+    except ValueError:
+        raise BadRequest('start and end must be dates (YYYY-MM-DD).') from None
+    if start:
+        query = query.where(_txns.c.date >= start)
+    if end:
+        query = query.where(_txns.c.date < end + timedelta(days=1))
+    position = decode_cursor(args.get('cursor'))
+    if position:
+        query = query.where(tuple_(_txns.c.date, _txns.c.id) < tuple_(*position))
+    limit = page_limit(args)
+    return query.order_by(_txns.c.date.desc(), _txns.c.id.desc()).limit(limit + 1), limit
+
+
+def transaction_page(rows, limit):
+    """TransactionPage from the rows of transactions_statement."""
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].date, rows[-1].id)
+    return TransactionPage([TransactionItem(*row) for row in rows], next_cursor)
+
+
+# ---------------- Helpers ----------------
+def _respond(obj, status=200, conditional=False):
+    response = current_app.response_class(encode(obj), status=status, mimetype='application/json')
+    if conditional:
+        response.set_etag(etag(response.get_data()))
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.make_conditional(request)
+    return response
+
+
+def _error(message, status):
+    return _respond(Error(message), status)
+
+
+def _account():
+    return db.session.execute(ACCOUNT, {'b_user_id': session['user_id']}).first()
+
+
+def _id_page(query, id_col, make, page_type):
+    """Page of `query` in ascending `id_col` order after the request's cursor."""
+    after, limit = decode_id_cursor(request.args.get('cursor')), page_limit(request.args)
+    if after is not None:
+        query = query.where(id_col > after)
+    rows = db.session.execute(query.order_by(id_col).limit(limit + 1)).all()
+    next_cursor = encode_id_cursor(rows[limit - 1][0]) if len(rows) > limit else None
+    return _respond(page_type([make(row) for row in rows[:limit]], next_cursor), conditional=True)
+
+
+@api.before_request
+def _require_login():
+    if 'user_id' not in session:
+        return _error('Authentication required.', 401)
+    return None
+
+
+@api.errorhandler(HTTPException)
+def _http_error(exc):
+    return _error(exc.description, exc.code)
+
+
+# ---------------- Balance ----------------
+@api.route('/balance')
+@read_only
+def balance_endpoint():
+    account = _account()
+    if account is None:
+        return _error('Account not found.', 404)
+    return _respond(Balance(account.account_number, account.balance), conditional=True)
+
+
+@api.route('/balance/at')
+@read_only
+def balance_at_endpoint():
+    """The balance just before `time` (ISO 8601, UTC unless it has an offset)."""
+    try:
+        when = datetime.fromisoformat(request.args['time'])
+    except (KeyError, ValueError):
+        raise BadRequest('time must be an ISO 8601 date and time.') from None
+    if when.tzinfo is not None:
+        when = when.astimezone(timezone.utc).replace(tzinfo=None)
+    account = _account()
+    if account is None:
+        return _error('Account not found.', 404)
+    return _respond(BalanceAt(account.account_number, when, balances.balance_at(account.id, when)),
+                    conditional=True)
+
+
+@api.route('/balance/history')
+@read_only
+def balance_history_endpoint():
+    """End-of-day balance for each day from `start` to `end` (YYYY-MM-DD; default the last 30 days)."""
+    start, end = _date_range(request.args)
+    account = _account()
+    if account is None:
+        return _error('Account not found.', 404)
+    series = balances.balance_series([account.id], start, end)[account.id]
+    return _respond(BalanceHistory(account.account_number, start, end,
+                                   [BalancePoint(day.date(), balance) for day, balance in series.items()]),
+                    conditional=True)
+
+
+# ---------------- Transactions ----------------
+@api.route('/transactions')
+@read_only
+def transactions_endpoint():
+    statement, limit = transactions_statement(session['user_id'], request.args)
+    return _respond(transaction_page(db.session.execute(statement).all(), limit), conditional=True)
+
+
+# ---------------- Cards, UPI ids, subscriptions ----------------
+@api.route('/cards')
+@read_only
+def cards_endpoint():
+    query = select(_cards.c.id, _cards.c.card_type, _cards.c.card_number, _cards.c.expiry,
+                   _cards.c.blocked, _cards.c.limit) \
+        .join_from(_cards, _accounts, _cards.c.account_id == _accounts.c.id) \
+        .where(_accounts.c.user_id == session['user_id'])
+    # never the full number, CVV or PIN
+    return _id_page(query, _cards.c.id,
+                    lambda row: CardItem(row.id, row.card_type, (row.card_number or '')[-4:], row.expiry,
+                                         row.blocked, row.limit), CardPage)
+
+
+@api.route('/upis')
+@read_only
+def upis_endpoint():
+    query = select(_upis.c.id, _upis.c.upi_id, _upis.c.verified) \
+        .join_from(_upis, _accounts, _upis.c.account_id == _accounts.c.id) \
+        .where(_accounts.c.user_id == session['user_id'])
+    return _id_page(query, _upis.c.id, lambda row: UpiItem(*row), UpiPage)
+
+
+@api.route('/subscriptions')
+@read_only
+def subscriptions_endpoint():
+    query = select(_subs.c.id, _subs.c.name, _subs.c.amount, _subs.c.frequency, _subs.c.active,
+                   _subs.c.next_billing_date).where(_subs.c.user_id == session['user_id'])
+    return _id_page(query, _subs.c.id, lambda row: SubscriptionItem(*row), SubscriptionPage)
+
+
+# ---------------- Analytics ----------------
+# Read from the daily and monthly rollups (app/analytics.py), so a year of
+# data is at most 366 rows whatever the account's volume.
+def _analytics_account_id():
+    account = _account()
+    if account is None:
+        raise NotFound('Account not found.')
+    return account.id
+
+
+def _months(args):
+    return min(max(args.get('months', analytics.MAX_MONTHS, type=int), 1), analytics.MAX_MONTHS)
+
+
+@api.route('/analytics/monthly-spend')
+@read_only
+def monthly_spend_endpoint():
+    """Outflow per calendar month by type, for the last `months` months (default and at most 12)."""
+    months = analytics.monthly_spend(_analytics_account_id(), _months(request.args), datetime.utcnow().date())
+    return _respond(MonthlySpend([MonthSpend(*month) for month in months]), conditional=True)
+
+
+def _date_range(args):
+    """(start, end) days from `start` and `end` (YYYY-MM-DD); default the last 30 days, at most MAX_DAYS."""
+    try:
+        start, end = _day(args, 'start'), _day(args, 'end')
+    except ValueError:
+        raise BadRequest('start and end must be dates (YYYY-MM-DD).') from None
+    end = end.date() if end else datetime.utcnow().date()
+    start = start.date() if start else end - timedelta(days=29)
+    if start > end or (end - start).days >= analytics.MAX_DAYS:
+        raise BadRequest(f'start must be on or before end, at most {analytics.MAX_DAYS} days apart.')
+    return start, end
+
+
+@api.route('/analytics/cash-flow')
+@read_only
+def cash_flow_endpoint():
+    """Inflow and outflow per day from `start` to `end` (YYYY-MM-DD; default the last 30 days)."""
+    start, end = _date_range(request.args)
+    days = analytics.cash_flow(_analytics_account_id(), start, end)
+    inflow, outflow = sum(day.inflow for day in days), sum(day.outflow for day in days)
+    return _respond(CashFlow(start, end, round(inflow, 2), round(outflow, 2),
+                             [CashFlowDay(*day) for day in days]), conditional=True)
+
+
+@api.route('/analytics/top-counterparties')
+@read_only
+def top_counterparties_endpoint():
+    """Largest counterparties over the last `months` months; `direction` is out (default) or in."""
+    direction = request.args.get('direction', 'out')
+    if direction not in analytics.DIRECTIONS:
+        raise BadRequest(f"direction must be one of {', '.join(analytics.DIRECTIONS)}.")
+    since = analytics.month_start(datetime.utcnow().date(), _months(request.args) - 1)
+    items = analytics.top_counterparties(_analytics_account_id(), direction, since,
+                                         min(max(request.args.get('limit', 10, type=int), 1), 50))
+    return _respond(TopCounterparties(direction, since, [CounterpartyTotal(*item) for item in items]),
+                    conditional=True)
+
+
+# ---------------- Transfers ----------------
+@api.route('/transfers', methods=['POST'])
+def create_transfer_endpoint():
+    """Pay an account number or UPI id; honours the Idempotency-Key header (app/idempotency.py)."""
+    # a cross-site form can only post text/plain, urlencoded or multipart bodies
+    if not request.is_json:
+        return _error('Send the transfer as application/json.', 415)
+    user_id = session['user_id']
+    key = request_key()
+    stored = lookup(user_id, key)
+    if stored is not None:
+        if stored.fingerprint != fingerprint():
+            return _error('That Idempotency-Key was already used for a different request.', 409)
+        response = _respond(TransferResult(stored.txn_id, stored.message), 201)
+        response.headers['Idempotent-Replayed'] = 'true'
+        return response
+
+    try:
+        body = _transfer_decoder.decode(request.get_data())
+    except msgspec.DecodeError as exc:   # ValidationError included
+        return _error(f"Invalid request: {exc}", 400)
+    if not body.amount > 0:
+        return _error('amount must be greater than zero.', 400)
+    if bool(body.account_number) == bool(body.upi_id):
+        return _error('Give exactly one of account_number and upi_id.', 400)
+
+    sender_account = Account.query.filter_by(user_id=user_id).first()
+    if sender_account is None:
+        return _error('Account not found.', 404)
+    if body.amount > sender_account.balance:
+        return _error('Insufficient balance.', 422)
+    recipient_key = ('account_number', body.account_number) if body.account_number \
+        else ('upi_id', body.upi_id)
+    recipient = resolve(*recipient_key)
+    if recipient is None:
+        return _error('Recipient not found.', 404)
+
+    features = db.session.get(AccountFeatures, sender_account.id)
+    risk = get_scorer().score(transfer_features(sender_account, recipient, body.amount, features))
+    if risk is not None and risk >= current_app.config.get('FRAUD_THRESHOLD', FRAUD_THRESHOLD):
+        return _error('Transfer blocked: it was flagged as potentially fraudulent.', 403)
+
+    message = f'Transferred ${body.amount} successfully!'
+    try:
+        txn_id = ledger.transfer(sender_account, recipient, body.amount, body.remarks,
+                                 recipient_label=recipient_key[1], idempotency=claim(user_id, key, message))
+    except DuplicateRequest:
+        stored = lookup(user_id, key)
+        return _respond(TransferResult(stored.txn_id, stored.message), 201)
+    except ledger.InsufficientFunds:
+        return _error('Insufficient balance.', 422)
+    except ledger.AccountNotFound:
+        forget(*recipient_key)
+        return _error('Recipient not found.', 404)
+    return _respond(TransferResult(txn_id, message), 201)
@@ -0,0 +1,140 @@
+import time
+from urllib.parse import parse_qsl
+from a2wsgi import WSGIMiddleware
+from flask.sessions import SecureCookieSessionInterface
+from itsdangerous import BadSignature
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import HTTPException, NotFound
+from werkzeug.http import parse_cookie, parse_etags
+from . import create_app
+from .api import ACCOUNT, Balance, Error, encode, etag, transaction_page, transactions_statement
+from .database import apply_pragmas
+from .metrics import REQUEST_LATENCY, REQUESTS
+from .sessions import SqliteSessionInterface
+
+# ASGI serving mode (serve.py --mode asgi).
+#
+# GET /api/v1/balance and /api/v1/transactions, the read-heavy JSON
+# endpoints, run as coroutines on an async SQLAlchemy engine (aiosqlite),
+# so a request waiting on the database holds no thread. They share their
+# statements and page builders with the Flask versions in app/api.py and
+# answer identically, ETags included. Everything else is the Flask app on
+# a2wsgi's thread pool (WSGI_THREADS threads per worker); asgiref's
+# WsgiToAsgi is not used because it runs every request on one thread.
+#
+# The async endpoints read the session like the Flask app does, from the
+# sqlite or cookie backend, and always read the primary database. With the
+# filesystem session backend or a non-file database, all requests go to
+# Flask.
+
+WSGI_THREADS = 16
+
+
+def _async_engine(app):
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() != 'sqlite' or url.database in (None, '', ':memory:'):
+        return None
+    engine = create_async_engine(url.set(drivername='sqlite+aiosqlite'),
+                                 **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    if app.config.get('SQLITE_PRAGMAS'):
+        apply_pragmas(engine.sync_engine, app.config['SQLITE_PRAGMAS'])
+    return engine
+
+
+class AsyncServer:
+    """ASGI application: async JSON reads, the Flask app for everything else."""
+
+    def __init__(self, app):
+        self.app = app
+        self.wsgi = WSGIMiddleware(app, workers=app.config.setdefault('WSGI_THREADS', WSGI_THREADS))
+        self.engine = _async_engine(app)
+        self.metrics = app.config.get('METRICS_ENABLED', True)
+        self.routes = {}
+        if self.engine is not None and isinstance(app.session_interface, (SqliteSessionInterface,
+                                                                          SecureCookieSessionInterface)):
+            self.routes = {
+                '/api/v1/balance': ('api.balance_endpoint', self.balance),
+                '/api/v1/transactions': ('api.transactions_endpoint', self.transactions),
+            }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        route = self.routes.get(scope['path']) \
+            if scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD') else None
+        if route is None:
+            return await self.wsgi(scope, receive, send)
+        return await self._serve(scope, send, *route)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.engine is not None:
+                    await self.engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _user_id(self, cookie, connection):
+        interface = self.app.session_interface
+        if isinstance(interface, SqliteSessionInterface):
+            session = await interface.open_session_async(self.app, cookie, connection)
+            return session.get('user_id')
+        if not cookie:
+            return None
+        try:
+            data = interface.get_signing_serializer(self.app).loads(
+                cookie, max_age=int(self.app.permanent_session_lifetime.total_seconds()))
+        except BadSignature:
+            return None
+        return data.get('user_id')
+
+    async def _serve(self, scope, send, endpoint, handler):
+        started = time.perf_counter()
+        headers = {name.decode('latin-1'): value.decode('latin-1') for name, value in scope['headers']}
+        cookie = parse_cookie(headers.get('cookie', '')).get(self.app.config['SESSION_COOKIE_NAME'])
+        async with self.engine.connect() as connection:
+            user_id = await self._user_id(cookie, connection)
+            if user_id is None:
+                status, body = 401, encode(Error('Authentication required.'))
+            else:
+                args = MultiDict(parse_qsl(scope['query_string'].decode('latin-1')))
+                try:
+                    status, body = 200, encode(await handler(connection, user_id, args))
+                except HTTPException as exc:
+                    status, body = exc.code, encode(Error(exc.description))
+
+        response_headers = [(b'content-type', b'application/json'), (b'vary', b'Cookie')]
+        if status == 200:
+            tag = etag(body)
+            response_headers += [(b'etag', f'"{tag}"'.encode()), (b'cache-control', b'private, no-cache')]
+            if parse_etags(headers.get('if-none-match')).contains(tag):
+                status, body = 304, b''
+        if status != 304:
+            response_headers.append((b'content-length', str(len(body)).encode()))
+        await send({'type': 'http.response.start', 'status': status, 'headers': response_headers})
+        await send({'type': 'http.response.body', 'body': b'' if scope['method'] == 'HEAD' else body})
+
+        if self.metrics:
+            REQUEST_LATENCY.labels(endpoint, scope['method']).observe(time.perf_counter() - started)
+            REQUESTS.labels(endpoint, scope['method'], str(status)).inc()
+
+    # ---------------- Endpoints ----------------
+    async def balance(self, connection, user_id, args):
+        account = (await connection.execute(ACCOUNT, {'b_user_id': user_id})).first()
+        if account is None:
+            raise NotFound('Account not found.')
+        return Balance(account.account_number, account.balance)
+
+    async def transactions(self, connection, user_id, args):
+        statement, limit = transactions_statement(user_id, args)
+        return transaction_page((await connection.execute(statement)).all(), limit)
+
+
+def create_asgi_app(test_config=None, config_name=None):
+    """ASGI entry point; takes the same arguments as create_app."""
+    return AsyncServer(create_app(test_config, config_name))
@@ -0,0 +1,200 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta, timezone
+import numpy as np
+import pandas as pd
+from sqlalchemy import Integer, bindparam, case, cast, delete, func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from .models.models import db, Account, BalanceSnapshot, Transaction
+
+# Historical balances.
+#
+# balance_snapshot holds each account's balance at the start of every UTC
+# month: the signed sum of all its transactions dated before that instant.
+# The balance at any other time is the nearest earlier snapshot plus the
+# transactions between the two, at most a month of them, read through
+# ix_transactions_account_date. Without a snapshot the whole history is summed.
+#
+# `flask snapshot-balances` takes the latest month's snapshot (schedule it
+# monthly); --backfill retakes every earlier one too, oldest first, so each
+# month is summed from the one before. A snapshot is always taken from the
+# snapshot strictly before it, never from its own old value, so retaking one
+# repairs it. A month is only snapshotted
+# SNAPSHOT_GRACE after it ends, so a write dated just before the boundary
+# has committed by then. A write dated before an existing
+# snapshot (billing run with --now in the past) drops the account's later
+# snapshots in ledger.record(); the next run takes them again.
+#
+# Amounts are summed in whole cents with numpy, as in app/reconcile.py.
+
+IN_CHUNK = 500
+SNAPSHOT_CHUNK = 5000   # accounts per commit
+SNAPSHOT_GRACE = timedelta(minutes=5)
+MAX_SERIES_DAYS = 3660
+
+_snaps, _txns = BalanceSnapshot.__table__, Transaction.__table__
+_store = sqlite_insert(_snaps)
+STORE = _store.on_conflict_do_update(index_elements=['account_id', 'as_of'],
+                                     set_={'balance': _store.excluded.balance})
+
+
+def _latest(before):
+    # SQLite takes the bare balance column from the row holding max(as_of)
+    return select(_snaps.c.account_id, func.max(_snaps.c.as_of), _snaps.c.balance) \
+        .where(_snaps.c.account_id.in_(bindparam('b_ids', expanding=True)), before) \
+        .group_by(_snaps.c.account_id)
+
+
+LATEST = _latest(_snaps.c.as_of <= bindparam('b_when'))
+LATEST_BEFORE = _latest(_snaps.c.as_of < bindparam('b_when'))   # when retaking the snapshot at b_when
+
+
+def _signed():
+    from .ledger import CREDIT_TYPES, DEBIT_TYPES   # the ledger imports this module
+
+    return case((_txns.c.txn_type.in_(CREDIT_TYPES), _txns.c.amount),
+                (_txns.c.txn_type.in_(DEBIT_TYPES), -_txns.c.amount), else_=0.0)
+
+
+def _naive_utc(when):
+    if when.tzinfo is not None:
+        when = when.astimezone(timezone.utc).replace(tzinfo=None)
+    return when
+
+
+def _cents(values):
+    return np.rint(np.asarray(values, dtype=np.float64) * 100)
+
+
+def _chunks(values):
+    for first in range(0, len(values), IN_CHUNK):
+        yield values[first:first + IN_CHUNK]
+
+
+def snapshot_boundary(when):
+    """Start of the UTC month containing `when`."""
+    return _naive_utc(when).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _latest_snapshots(account_ids, when, strict=False):
+    """{account_id: (as_of, balance)} of each account's latest snapshot at or before `when`
+    (strictly before it with `strict`)."""
+    latest = {}
+    for chunk in _chunks(account_ids):
+        rows = db.session.execute(LATEST_BEFORE if strict else LATEST, {'b_ids': chunk, 'b_when': when})
+        latest.update((row[0], row[1:]) for row in rows)
+    return latest
+
+
+def _add(totals, ids, account_ids, amounts, days=None):
+    """Add signed amounts into `totals` (flat, one cell per account or per account and day)."""
+    positions = np.searchsorted(ids, np.asarray(account_ids, dtype=np.int64))
+    if days is not None:
+        positions = positions * (len(totals) // len(ids)) + np.asarray(days, dtype=np.int64)
+    totals += np.bincount(positions, weights=_cents(amounts), minlength=len(totals))
+
+
+def _balances_in_cents(ids, when, strict=False):
+    cents = np.zeros(len(ids))
+    by_snapshot = defaultdict(list)
+    latest = _latest_snapshots(ids.tolist(), when, strict)
+    for position, account_id in enumerate(ids.tolist()):
+        as_of, balance = latest.get(account_id, (None, 0.0))
+        cents[position] = round(balance * 100)
+        by_snapshot[as_of].append(account_id)
+
+    signed = _signed()
+    for since, group in by_snapshot.items():
+        for chunk in _chunks(group):
+            query = select(_txns.c.account_id, signed) \
+                .where(_txns.c.account_id.in_(chunk), _txns.c.date < when)
+            if since is not None:
+                query = query.where(_txns.c.date >= since)
+            rows = db.session.execute(query).all()
+            if rows:
+                account_ids, amounts = zip(*rows)
+                _add(cents, ids, account_ids, amounts)
+    return cents
+
+
+def balances_at(account_ids, when):
+    """Balance of each account just before `when` (UTC), as a Series indexed by account id."""
+    ids = np.unique(np.asarray(account_ids, dtype=np.int64))
+    when = _naive_utc(when)
+    return pd.Series(_balances_in_cents(ids, when) / 100, index=pd.Index(ids, name='account_id'))
+
+
+def balance_at(account_id, when):
+    """Balance of one account just before `when` (UTC)."""
+    return float(_balances_in_cents(np.array([account_id], dtype=np.int64), _naive_utc(when))[0] / 100)
+
+
+def balance_series(account_ids, start, end):
+    """End-of-day balances from `start` to `end` (dates, inclusive) for many accounts at once.
+
+    A DataFrame with one row per UTC day and one column per account id. The
+    opening balances come from balances_at(); each day's transactions are
+    then binned per (account, day) and accumulated along the days.
+    """
+    days = (end - start).days + 1
+    if not 0 < days <= MAX_SERIES_DAYS:
+        raise ValueError(f'end must be on or after start, at most {MAX_SERIES_DAYS} days apart')
+    ids = np.unique(np.asarray(account_ids, dtype=np.int64))
+    first = datetime.combine(start, time())
+    stop = first + timedelta(days=days)
+    opening = _balances_in_cents(ids, first)
+
+    deltas = np.zeros(len(ids) * days)
+    day = cast(func.julianday(func.date(_txns.c.date)) - func.julianday(start.isoformat()), Integer)
+    signed = _signed()
+    for chunk in _chunks(ids.tolist()):
+        rows = db.session.execute(select(_txns.c.account_id, day, signed)
+                                  .where(_txns.c.account_id.in_(chunk), _txns.c.date >= first,
+                                         _txns.c.date < stop)).all()
+        if rows:
+            account_ids, offsets, amounts = zip(*rows)
+            _add(deltas, ids, account_ids, amounts, offsets)
+
+    curves = np.cumsum(deltas.reshape(len(ids), days), axis=1) + opening[:, None]
+    return pd.DataFrame(curves.T / 100, index=pd.date_range(start, periods=days, freq='D', name='day'),
+                        columns=pd.Index(ids, name='account_id'))
+
+
+# ---------------- Snapshots ----------------
+def take_snapshots(as_of, chunk_size=SNAPSHOT_CHUNK):
+    """Store every account's balance at `as_of`; returns the number of accounts."""
+    as_of = _naive_utc(as_of)
+    taken, last_id = 0, 0
+    while True:
+        ids = db.session.execute(select(Account.id).where(Account.id > last_id)
+                                 .order_by(Account.id).limit(chunk_size)).scalars().all()
+        if not ids:
+            return taken
+        balances = np.round(_balances_in_cents(np.asarray(ids, dtype=np.int64), as_of, strict=True) / 100, 2)
+        db.session.execute(STORE, [{'account_id': account_id, 'as_of': as_of, 'balance': float(balance)}
+                                   for account_id, balance in zip(ids, balances)])
+        db.session.commit()
+        taken += len(ids)
+        last_id = ids[-1]
+
+
+def due_boundaries(now=None, backfill=False):
+    """Month starts to snapshot, oldest first: the latest one past the grace period and,
+    with `backfill`, every earlier one since the first transaction."""
+    latest = snapshot_boundary((now or datetime.utcnow()) - SNAPSHOT_GRACE)
+    first = db.session.execute(select(func.min(Transaction.date))).scalar() if backfill else None
+    if first is None:
+        return [latest]
+    boundaries, boundary = [], snapshot_boundary(first)
+    while boundary < latest:
+        boundary = snapshot_boundary(boundary + timedelta(days=32))
+        boundaries.append(boundary)
+    return boundaries or [latest]
+
+
+def invalidate_snapshots(rows):
+    """Drop the snapshots newly recorded Transaction rows (dicts) land before, in the caller's transaction."""
+    earliest = min(_naive_utc(row['date']) for row in rows)
+    if earliest >= snapshot_boundary(datetime.utcnow()):
+        return   # the usual case: no snapshot is later than the current month's start
+    db.session.execute(delete(_snaps).where(_snaps.c.account_id.in_({row['account_id'] for row in rows}),
+                                            _snaps.c.as_of > earliest))
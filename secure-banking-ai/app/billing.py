@@ -0,0 +1,170 @@
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import bindparam, func, select, tuple_, update
+from .models.models import db, Account, Subscription
+from . import ledger
+
+# Schedule with cron (or any job runner) as `flask bill-subscriptions`;
+# every run bills whatever is due at that moment, so missed runs catch up.
+
+BILLING_PERIODS = {
+    'Weekly': timedelta(weeks=1),
+    'Monthly': timedelta(days=30),
+    'Yearly': timedelta(days=365),
+}
+BILLING_CHUNK = 500
+
+_subscriptions = Subscription.__table__
+# Claims a due subscription for this run: matches only while it is still
+# active and still due from the date this run read, so a concurrent run or a
+# cancellation in between leaves it alone.
+CLAIM = update(_subscriptions) \
+    .where(_subscriptions.c.id == bindparam('b_id'),
+           _subscriptions.c.next_billing_date == bindparam('b_old'),
+           _subscriptions.c.active.is_(True)) \
+    .values(next_billing_date=bindparam('b_next'), last_billed_date=bindparam('b_billed'))
+# Moves a claimed subscription back to its first unpaid period.
+SETTLE = update(_subscriptions) \
+    .where(_subscriptions.c.id == bindparam('b_id')) \
+    .values(next_billing_date=bindparam('b_next'), last_billed_date=bindparam('b_billed'))
+
+
+def next_billing_date(frequency, start):
+    period = BILLING_PERIODS.get(frequency)
+    return start + period if period else None
+
+
+def _due_chunk(now, cursor, chunk_size, user_range):
+    # Served by ix_subscription_due (active, next_billing_date); the
+    # implicit rowid in the index keeps (next_billing_date, id) order.
+    query = select(Subscription.id, Subscription.user_id, Subscription.name,
+                   Subscription.amount, Subscription.frequency,
+                   Subscription.next_billing_date, Subscription.last_billed_date) \
+        .where(Subscription.active.is_(True), Subscription.next_billing_date <= now)
+    if user_range:
+        query = query.where(Subscription.user_id >= user_range[0],
+                            Subscription.user_id < user_range[1])
+    if cursor:
+        query = query.where(tuple_(Subscription.next_billing_date, Subscription.id) > cursor)
+    query = query.order_by(Subscription.next_billing_date, Subscription.id).limit(chunk_size)
+    return db.session.execute(query).all()
+
+
+def _primary_accounts(user_ids):
+    rows = db.session.execute(
+        select(Account.user_id, func.min(Account.id))
+        .where(Account.user_id.in_(user_ids))
+        .group_by(Account.user_id))
+    return dict(rows.all())
+
+
+def _bill_chunk(due, now):
+    accounts = _primary_accounts({sub.user_id for sub in due})
+
+    def work():
+        counts, rows = Counter(), []
+        for sub in due:
+            account_id = accounts.get(sub.user_id)
+            if account_id is None:
+                counts['no_account'] += 1
+                continue
+            periods, next_date = [], sub.next_billing_date
+            while next_date is not None and next_date <= now:
+                periods.append(next_date)
+                next_date = next_billing_date(sub.frequency, next_date)
+            # the claim is this transaction's first write, so it holds the write lock from here on
+            claimed = db.session.execute(CLAIM, {'b_id': sub.id, 'b_old': sub.next_billing_date,
+                                                 'b_next': next_date, 'b_billed': now})
+            if claimed.rowcount != 1:
+                counts['changed_since_read'] += 1
+                continue
+            charged = 0
+            for due_date in periods:
+                try:
+                    ledger.debit(account_id, sub.amount)
+                except ledger.InsufficientFunds:
+                    # left due from the first unpaid period; the next run retries
+                    counts['insufficient_funds'] += 1
+                    break
+                except ledger.InvalidAmount:
+                    counts['invalid_amount'] += 1
+                    break
+                rows.append({
+                    'user_id': sub.user_id,
+                    'account_id': account_id,
+                    'txn_id': ledger.new_txn_id(),
+                    'txn_type': 'subscription',
+                    'amount': sub.amount,
+                    'counterparty': sub.name,
+                    'remarks': f"{sub.name} ({sub.frequency}) due {due_date:%Y-%m-%d}",
+                    'date': now,
+                })
+                charged += 1
+            if charged < len(periods):
+                db.session.execute(SETTLE, {'b_id': sub.id, 'b_next': periods[charged],
+                                            'b_billed': now if charged else sub.last_billed_date})
+            if charged:
+                counts['billed'] += 1
+                counts['charges'] += charged
+        ledger.record(rows)
+        return counts
+
+    return ledger.run_in_transaction(work)
+
+
+def bill_due_subscriptions(now=None, chunk_size=BILLING_CHUNK, user_range=None):
+    """Bill every active subscription due at `now`, one commit per chunk.
+
+    Chunks are walked by keyset on (next_billing_date, id). A subscription
+    that is several periods behind is charged once per missed period and
+    moved past `now` in the same pass, so no row is visited twice. Rows read
+    before the chunk's transaction are only charged if their claim still
+    matches inside it, so overlapping runs cannot bill a period twice.
+    """
+    now = now or datetime.utcnow()
+    counts, cursor = Counter(), None
+    while True:
+        due = _due_chunk(now, cursor, chunk_size, user_range)
+        if not due:
+            return counts
+        cursor = (due[-1].next_billing_date, due[-1].id)
+        counts.update(_bill_chunk(due, now))
+
+
+def _bill_user_range(uri, lo, hi, now, chunk_size):
+    from . import create_app
+
+    with create_app({'SQLALCHEMY_DATABASE_URI': uri}).app_context():
+        return bill_due_subscriptions(now, chunk_size, (lo, hi))
+
+
+def run_billing(now=None, chunk_size=BILLING_CHUNK, workers=1):
+    """Bill due subscriptions, optionally fanned out by user-id range.
+
+    Returns (counts, elapsed seconds). Each worker process owns a disjoint
+    user-id range, so no subscription or account is touched by two workers.
+    """
+    now = now or datetime.utcnow()
+    started = time.perf_counter()
+    if workers <= 1:
+        return bill_due_subscriptions(now, chunk_size), time.perf_counter() - started
+
+    lo, hi = db.session.execute(
+        select(func.min(Subscription.user_id), func.max(Subscription.user_id))
+        .where(Subscription.active.is_(True), Subscription.next_billing_date <= now)).one()
+    counts = Counter()
+    if lo is None:
+        return counts, time.perf_counter() - started
+
+    step = (hi - lo) // workers + 1
+    bounds = [(start, start + step) for start in range(lo, hi + 1, step)]
+    uri = db.engine.url.render_as_string(hide_password=False)
+    db.session.remove()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_bill_user_range, uri, start, end, now, chunk_size)
+                   for start, end in bounds]
+        for future in futures:
+            counts.update(future.result())
+    return counts, time.perf_counter() - started
@@ -0,0 +1,252 @@
+import hmac
+import math
+import threading
+from collections import deque, namedtuple
+from datetime import datetime, timedelta, timezone
+from flask import current_app
+from sqlalchemy import bindparam, case, func, select, update
+from .cache import TTLCache
+from .hashing import hash_secret, verify_secret
+from .models.models import db, Account, Card, Transaction
+from . import ledger
+
+# Card authorization.
+#
+# Callers (merchants, acquirers) authenticate with one of CARD_AUTH_API_KEYS.
+# An unknown card number and a wrong PIN get the same 'invalid_card_or_pin'
+# decline, after the same PIN verification work, so card numbers cannot be
+# probed; anything more specific is only said once the PIN has matched.
+#
+# Both limits are enforced in the database, so they hold across worker
+# processes and restarts. A wrong PIN adds to card.failed_pins, and the card
+# is blocked at MAX_PIN_ATTEMPTS; a correct one sets it back to zero. An
+# approval is one transaction that re-checks the card row (so a block or PIN
+# change made by another process is never missed), debits the account, sums
+# the card's payments of the last 24 hours through ix_transactions_card_date
+# while holding the write lock, and records a 'card_payment' transaction.
+#
+# Memory only makes declines fast: CardIndex maps a card number to what
+# authorization needs, and SpendWindow keeps this process's view of each
+# card's 24h spend. The window misses payments made through other workers, so
+# it can only under-count: a limit decline it gives is always right, and an
+# approval is left to the database. A window the database overrules is
+# dropped and seeded again from the card's payments. Windows sit in a bounded
+# cache until the card has been idle for SPEND_WINDOW.
+
+SPEND_WINDOW = timedelta(hours=24)
+INDEX_SIZE = 100000
+INDEX_TTL_SECONDS = 60
+STATE_TTL_SECONDS = SPEND_WINDOW.total_seconds()
+MAX_PIN_ATTEMPTS = 3
+
+CardEntry = namedtuple('CardEntry', ['card_id', 'account_id', 'user_id', 'blocked', 'limit', 'pin',
+                                     'failed_pins'])
+Decision = namedtuple('Decision', ['approved', 'reason', 'txn_id', 'remaining'])
+
+_cards = Card.__table__
+CARD_STATE = select(_cards.c.id).where(
+    _cards.c.id == bindparam('b_id'), _cards.c.blocked.is_not(True),
+    _cards.c.pin == bindparam('b_pin'), _cards.c.limit == bindparam('b_limit'))
+# SET expressions read the row's values from before the update
+FAILED_PIN = update(_cards).where(_cards.c.id == bindparam('b_id')).values(
+    failed_pins=_cards.c.failed_pins + 1,
+    blocked=case((_cards.c.failed_pins + 1 >= MAX_PIN_ATTEMPTS, True), else_=_cards.c.blocked))
+RESET_PINS = update(_cards).where(_cards.c.id == bindparam('b_id'), _cards.c.failed_pins != 0) \
+    .values(failed_pins=0)
+_txns = Transaction.__table__
+SPENT = select(func.coalesce(func.sum(_txns.c.amount), 0.0)).where(
+    _txns.c.card_id == bindparam('b_id'), _txns.c.date > bindparam('b_since'))
+
+
+_dummy_pin = None
+
+
+class CardChanged(ledger.LedgerError):
+    """The card row no longer matches the cached entry."""
+
+
+class LimitExceeded(ledger.LedgerError):
+    """The card's payments of the last 24 hours leave less than the amount."""
+
+    def __init__(self, remaining):
+        super().__init__(remaining)
+        self.remaining = remaining
+
+
+def valid_api_key(presented):
+    """True if `presented` is one of the configured CARD_AUTH_API_KEYS."""
+    keys = current_app.config.get('CARD_AUTH_API_KEYS') or ()
+    return bool(presented) and any(hmac.compare_digest(presented.encode(), key.encode()) for key in keys)
+
+
+def _verify_unknown(pin):
+    # spend the same KDF time as a real card's PIN check, then decline
+    global _dummy_pin
+    if _dummy_pin is None:
+        _dummy_pin = hash_secret('0000')
+    verify_secret(_dummy_pin, pin)
+    return Decision(False, 'invalid_card_or_pin', None, None)
+
+
+def card_remarks(card_number, merchant):
+    return f"Card ending {card_number[-4:]} - {merchant}"
+
+
+class SpendWindow:
+    """Exact sliding-window sum of one card's approved amounts."""
+
+    def __init__(self, events=()):
+        self.events = deque(events)   # (naive UTC datetime, amount), oldest first
+        self.total = sum(amount for _, amount in self.events)
+
+    def spent(self, now):
+        cutoff = now - SPEND_WINDOW
+        while self.events and self.events[0][0] <= cutoff:
+            self.total -= self.events.popleft()[1]
+        return max(self.total, 0.0)
+
+    def add(self, when, amount):
+        event = (when, amount)
+        self.events.append(event)
+        self.total += amount
+        return event
+
+    def discard(self, event):
+        try:
+            self.events.remove(event)
+        except ValueError:
+            return
+        self.total -= event[1]
+
+
+class CardState:
+    """One card's spend window, guarded by `lock`."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.window = None   # seeded on first use
+
+
+class CardIndex:
+    """Hot map of card number to CardEntry, kept in sync by the card views."""
+
+    def __init__(self, maxsize=INDEX_SIZE, ttl=INDEX_TTL_SECONDS):
+        self.entries = TTLCache(maxsize, ttl)
+        self.states = TTLCache(maxsize, STATE_TTL_SECONDS)
+        self._lock = threading.Lock()
+
+    def get(self, card_number):
+        entry = self.entries.get(card_number, False)
+        if entry is False:
+            row = db.session.execute(
+                select(Card.id, Card.account_id, Account.user_id, Card.blocked, Card.limit, Card.pin,
+                       Card.failed_pins)
+                .join(Account, Account.id == Card.account_id)
+                .where(Card.card_number == card_number)).first()
+            entry = CardEntry(row.id, row.account_id, row.user_id, bool(row.blocked),
+                              row.limit or 0.0, row.pin, row.failed_pins) if row else None
+            self.entries.set(card_number, entry)   # unknown numbers are cached too
+        return entry
+
+    def invalidate(self, card_number):
+        self.entries.pop(card_number)
+        self.states.pop(card_number)   # a card deleted and added again must not keep the old window
+
+    def state(self, card_number):
+        with self._lock:
+            state = self.states.get(card_number)
+            if state is None:
+                state = CardState()
+            self.states.set(card_number, state)   # every use restarts its expiry
+        return state
+
+    @staticmethod
+    def window(state, entry, now):
+        """The card's SpendWindow; call with state.lock held."""
+        if state.window is None:
+            rows = db.session.execute(
+                select(Transaction.date, Transaction.amount)
+                .where(Transaction.card_id == entry.card_id, Transaction.date > now - SPEND_WINDOW)
+                .order_by(Transaction.date)).all()
+            state.window = SpendWindow((date.replace(tzinfo=None), amount) for date, amount in rows)
+        return state.window
+
+
+card_index = CardIndex()
+
+
+def _pin_failed(card_number, entry):
+    ledger.run_in_transaction(lambda: db.session.execute(FAILED_PIN, {'b_id': entry.card_id}))
+    card_index.invalidate(card_number)   # reloads failed_pins and blocked
+    return Decision(False, 'invalid_card_or_pin', None, None)
+
+
+def _charge(card_number, entry, amount, merchant, now):
+    row = {
+        'user_id': entry.user_id,
+        'account_id': entry.account_id,
+        'txn_id': ledger.new_txn_id(),
+        'txn_type': 'card_payment',
+        'amount': amount,
+        'counterparty': merchant or None,
+        'card_id': entry.card_id,
+        'remarks': card_remarks(card_number, merchant or 'card payment'),
+        'date': now,
+    }
+
+    def work():
+        state = {'b_id': entry.card_id, 'b_pin': entry.pin, 'b_limit': entry.limit}
+        if db.session.execute(CARD_STATE, state).first() is None:
+            raise CardChanged(entry.card_id)
+        ledger.debit(entry.account_id, amount)   # takes the write lock before the sum
+        spent = db.session.execute(SPENT, {'b_id': entry.card_id, 'b_since': now - SPEND_WINDOW}).scalar()
+        if spent + amount > entry.limit:
+            raise LimitExceeded(max(entry.limit - spent, 0.0))
+        ledger.record([row])
+        return row['txn_id'], entry.limit - spent - amount
+
+    return ledger.run_in_transaction(work)
+
+
+def authorize(card_number, amount, pin, merchant='', retry=True):
+    """Approve or decline a card payment; returns a Decision."""
+    if not (isinstance(amount, (int, float)) and math.isfinite(amount) and amount > 0):
+        return Decision(False, 'invalid_amount', None, None)
+    entry = card_index.get(card_number)
+    if entry is None:
+        return _verify_unknown(pin)
+    if not verify_secret(entry.pin, pin):
+        return _pin_failed(card_number, entry)
+    if entry.blocked:
+        return Decision(False, 'card_blocked', None, None)
+    if entry.failed_pins:
+        ledger.run_in_transaction(lambda: db.session.execute(RESET_PINS, {'b_id': entry.card_id}))
+
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    state = card_index.state(card_number)
+    with state.lock:
+        window = card_index.window(state, entry, now)
+        remaining = entry.limit - window.spent(now)
+        if amount > remaining:
+            return Decision(False, 'limit_exceeded', None, remaining)
+        # reserve before committing so concurrent payments in this process see each other
+        reservation = window.add(now, amount)
+
+    try:
+        txn_id, remaining = _charge(card_number, entry, amount, merchant, now)
+    except Exception as exc:
+        with state.lock:
+            window.discard(reservation)
+        if isinstance(exc, LimitExceeded):
+            with state.lock:
+                state.window = None   # other workers spent on the card; seed again next time
+            return Decision(False, 'limit_exceeded', None, exc.remaining)
+        if isinstance(exc, ledger.InsufficientFunds):
+            return Decision(False, 'insufficient_funds', None, remaining)
+        if not isinstance(exc, CardChanged):
+            raise
+        card_index.invalidate(card_number)
+        if retry:
+            return authorize(card_number, amount, pin, merchant, retry=False)
+        return Decision(False, 'card_changed', None, None)
+    return Decision(True, 'approved', txn_id, remaining)
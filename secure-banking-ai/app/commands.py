@@ -0,0 +1,225 @@
+import sys
+from datetime import datetime
+import click
+from flask.cli import with_appcontext
+
+
+def register_commands(app):
+    app.cli.add_command(audit_queries_command)
+    app.cli.add_command(bill_subscriptions_command)
+    app.cli.add_command(fraud_latency_command)
+    app.cli.add_command(rebuild_features_command)
+    app.cli.add_command(rebuild_payees_command)
+    app.cli.add_command(rebuild_rollups_command)
+    app.cli.add_command(export_statements_command)
+    app.cli.add_command(sweep_sessions_command)
+    app.cli.add_command(sweep_idempotency_keys_command)
+    app.cli.add_command(refresh_replica_command)
+    app.cli.add_command(reconcile_command)
+    app.cli.add_command(snapshot_balances_command)
+
+
+# ---------------- Query plan audit ----------------
+@click.command('audit-queries')
+@click.option('--verbose', '-v', is_flag=True, help='Print the full plan of every query.')
+@with_appcontext
+def audit_queries_command(verbose):
+    """Fail if any route query falls back to a full table scan."""
+    from .query_audit import audit_query_plans
+
+    failures = 0
+    for name, plan, scans in audit_query_plans():
+        status = 'FULL SCAN on ' + ', '.join(scans) if scans else 'ok'
+        click.echo(f"{name:45} {status}")
+        if verbose or scans:
+            for line in plan:
+                click.echo(f"    {line}")
+        failures += bool(scans)
+
+    if failures:
+        click.echo(f"{failures} quer{'y' if failures == 1 else 'ies'} scan a full table.", err=True)
+        sys.exit(1)
+    click.echo('All route queries use an index.')
+
+
+# ---------------- Subscription billing ----------------
+@click.command('bill-subscriptions')
+@click.option('--chunk-size', default=500, show_default=True, help='Subscriptions per commit.')
+@click.option('--workers', default=1, show_default=True, help='Processes, each billing a user-id range.')
+@click.option('--now', 'now', type=click.DateTime(), default=None, help='Bill as of this time (UTC).')
+@with_appcontext
+def bill_subscriptions_command(chunk_size, workers, now):
+    """Charge every active subscription whose next billing date has passed."""
+    from .billing import run_billing
+
+    counts, elapsed = run_billing(now or datetime.utcnow(), chunk_size, workers)
+    billed = counts['billed']
+    click.echo(f"Billed {billed} subscriptions ({counts['charges']} charges) in {elapsed:.2f}s "
+               f"({billed / elapsed if elapsed else 0:.0f} subscriptions/s).")
+    for reason in ('insufficient_funds', 'no_account', 'changed_since_read'):
+        if counts[reason]:
+            click.echo(f"Skipped {counts[reason]}: {reason.replace('_', ' ')}.")
+
+
+# ---------------- Fraud scoring ----------------
+@click.command('fraud-latency')
+@click.option('--requests', 'total', default=5000, show_default=True)
+@click.option('--concurrency', default=32, show_default=True, help='Concurrent scoring threads.')
+@with_appcontext
+def fraud_latency_command(total, concurrency):
+    """Measure the latency fraud scoring adds to a transfer."""
+    import random
+    from concurrent.futures import ThreadPoolExecutor
+    from .ml.scoring import FEATURES, get_scorer
+
+    scorer = get_scorer()
+    if not scorer.enabled:
+        click.echo('Fraud scoring is disabled: no usable model.', err=True)
+        sys.exit(1)
+
+    rows = [[random.uniform(0, 5000) for _ in FEATURES] for _ in range(total)]
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(scorer.score, rows))
+
+    sizes = scorer.batcher.batch_sizes
+    click.echo(f"{total} scores, mean batch {sum(sizes) / len(sizes):.1f}, "
+               f"{scorer.timeouts} timed out")
+    for percentile, millis in scorer.latency_percentiles().items():
+        click.echo(f"p{percentile}: {millis:.2f} ms")
+
+
+@click.command('rebuild-features')
+@click.option('--chunk-size', default=1000, show_default=True, help='Accounts per commit.')
+@with_appcontext
+def rebuild_features_command(chunk_size):
+    """Backfill the per-account fraud feature store from transaction history."""
+    import time
+    from .features import rebuild_features
+
+    started = time.perf_counter()
+    rebuilt = rebuild_features(chunk_size)
+    click.echo(f"Rebuilt features for {rebuilt} accounts in {time.perf_counter() - started:.2f}s.")
+
+
+# ---------------- Recent payees ----------------
+@click.command('rebuild-payees')
+@with_appcontext
+def rebuild_payees_command():
+    """Backfill every user's recent payees from transfer history."""
+    import time
+    from .recipients import rebuild_payees
+
+    started = time.perf_counter()
+    payees = rebuild_payees()
+    click.echo(f"Rebuilt {payees} recent payees in {time.perf_counter() - started:.2f}s.")
+
+
+# ---------------- Spending rollups ----------------
+@click.command('rebuild-rollups')
+@click.option('--chunk-size', default=1000, show_default=True, help='Accounts per commit.')
+@with_appcontext
+def rebuild_rollups_command(chunk_size):
+    """Backfill the daily and counterparty spending rollups from transaction history."""
+    import time
+    from .rollups import rebuild_rollups
+
+    started = time.perf_counter()
+    rebuilt = rebuild_rollups(chunk_size)
+    click.echo(f"Rebuilt rollups for {rebuilt} accounts in {time.perf_counter() - started:.2f}s.")
+
+
+# ---------------- Statements ----------------
+@click.command('export-statements')
+@click.option('--out', 'out_dir', default='statements', show_default=True, type=click.Path(file_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['pdf', 'csv']), default='pdf', show_default=True)
+@click.option('--start', type=click.DateTime(['%Y-%m-%d']), default=None, help='First day (inclusive).')
+@click.option('--end', type=click.DateTime(['%Y-%m-%d']), default=None, help='Last day (inclusive).')
+@click.option('--workers', default=1, show_default=True, help='Processes, each exporting an account-id range.')
+@with_appcontext
+def export_statements_command(out_dir, fmt, start, end, workers):
+    """Write a statement file for every account."""
+    import time
+    from .statements import export_statements
+
+    started = time.perf_counter()
+    written = export_statements(out_dir, fmt, start, end, workers)
+    click.echo(f"Wrote {written} {fmt.upper()} statements to {out_dir} in {time.perf_counter() - started:.2f}s.")
+
+
+# ---------------- Sessions ----------------
+@click.command('sweep-sessions')
+@with_appcontext
+def sweep_sessions_command():
+    """Delete expired rows from the session table now."""
+    from .sessions import sweep_expired_sessions
+
+    click.echo(f"Removed {sweep_expired_sessions()} expired sessions.")
+
+
+@click.command('sweep-idempotency-keys')
+@with_appcontext
+def sweep_idempotency_keys_command():
+    """Delete expired idempotency keys now."""
+    from .idempotency import sweep_expired_keys
+
+    click.echo(f"Removed {sweep_expired_keys()} expired idempotency keys.")
+
+
+# ---------------- Read replica ----------------
+@click.command('refresh-replica')
+@with_appcontext
+def refresh_replica_command():
+    """Copy the primary database over the read replica now."""
+    import time
+    from flask import current_app
+
+    replica = current_app.extensions.get('replica')
+    if replica is None:
+        click.echo('No replica configured: set REPLICA_DATABASE_URL.', err=True)
+        sys.exit(1)
+    started = time.perf_counter()
+    replica.refresh(force=True)
+    click.echo(f"Replica refreshed in {time.perf_counter() - started:.2f}s.")
+
+
+# ---------------- Reconciliation ----------------
+@click.command('reconcile')
+@click.option('--incremental', is_flag=True, help='Only accounts with transactions since the last run.')
+@click.option('--workers', default=1, show_default=True, help='Processes, each checking account-id ranges.')
+@click.option('--range-size', default=20000, show_default=True, help='Accounts per worker task.')
+@click.option('--report', type=click.Path(dir_okay=False), default=None, help='Write the drifts to this CSV file.')
+@with_appcontext
+def reconcile_command(incremental, workers, range_size, report):
+    """Compare every stored balance with the signed sum of its transactions."""
+    from .reconcile import reconcile, write_drift_report
+
+    run, drifts = reconcile(incremental, workers, range_size)
+    click.echo(f"Checked {run.accounts_checked} accounts up to transaction {run.watermark} "
+               f"in {run.seconds:.2f}s: {run.accounts_drifted} drifted, total drift {run.total_drift:.2f}.")
+    for drift in drifts[:20]:
+        click.echo(f"  account {drift.account_id}: stored {drift.stored:.2f}, ledger {drift.ledger:.2f}, "
+                   f"drift {drift.drift:+.2f}" + (f", {drift.unknown_rows} rows of unknown type"
+                                                  if drift.unknown_rows else ''))
+    if len(drifts) > 20:
+        click.echo(f"  ... and {len(drifts) - 20} more" + ('' if report else ' (use --report)'))
+    if report:
+        write_drift_report(report, drifts)
+        click.echo(f"Drift report written to {report}.")
+    if drifts:
+        sys.exit(1)
+
+
+# ---------------- Balance snapshots ----------------
+@click.command('snapshot-balances')
+@click.option('--backfill', is_flag=True, help='Also retake every earlier month since the first transaction.')
+@click.option('--chunk-size', default=5000, show_default=True, help='Accounts per commit.')
+@with_appcontext
+def snapshot_balances_command(backfill, chunk_size):
+    """Checkpoint every account's balance at the start of the latest month."""
+    import time
+    from .balances import due_boundaries, take_snapshots
+
+    for boundary in due_boundaries(backfill=backfill):
+        started = time.perf_counter()
+        taken = take_snapshots(boundary, chunk_size)
+        click.echo(f"Snapshot {boundary:%Y-%m-%d}: {taken} accounts in {time.perf_counter() - started:.2f}s.")
@@ -0,0 +1,134 @@
+import time
+from collections import namedtuple
+from prometheus_client import Counter
+from sqlalchemy import event, func, select
+from .cache import TTLCache
+from .models.models import db, Login, Account, Transaction, Card, Upi, Subscription
+from .replica import RoutingSession, last_write_at
+
+# Per-user dashboard view models, cached in process.
+#
+# Entries are plain namedtuples, never ORM objects, so they outlive the
+# session that loaded them. They are dropped:
+#   - after commit, for every user whose transactions a ledger write
+#     recorded (both sides of a transfer, billing, card payments);
+#   - by the views that add or remove cards and subscriptions and by the
+#     admin views, after their commits (PINs and blocking are not shown);
+#   - when older than the user's last write in any worker (the write time
+#     kept in the session, see app/replica.py), so a redirect to another
+#     worker never shows a pre-write dashboard;
+#   - after DASHBOARD_CACHE_TTL seconds, which bounds how long a change made
+#     by another process (a transfer received there, the billing command)
+#     can go unseen.
+#
+# Deposits and withdrawals are kept as a total, a count and the latest
+# RECENT_TXNS rows, so an entry's size does not grow with the user's history;
+# the full list is on the transactions page.
+
+CACHE_SIZE = 5000
+CACHE_TTL_SECONDS = 60
+RECENT_TXNS = 10
+
+DashboardUser = namedtuple('DashboardUser', ['id', 'fullname', 'email', 'username', 'is_admin'])
+DashboardAccount = namedtuple('DashboardAccount', ['id', 'account_number', 'balance'])
+DashboardTxn = namedtuple('DashboardTxn', ['txn_id', 'amount', 'date', 'remarks'])
+DashboardActivity = namedtuple('DashboardActivity', ['total', 'count', 'recent'])
+DashboardSubscription = namedtuple('DashboardSubscription',
+                                   ['id', 'name', 'amount', 'frequency', 'next_billing_date', 'active'])
+DashboardCard = namedtuple('DashboardCard', ['card_type', 'card_number', 'expiry'])
+DashboardUpi = namedtuple('DashboardUpi', ['upi_id'])
+Dashboard = namedtuple('Dashboard', ['user', 'account', 'deposits', 'withdrawals', 'subscriptions',
+                                     'cards', 'upis', 'built_at'])
+
+LOOKUPS = Counter('securebank_dashboard_cache_lookups_total', 'Dashboard cache lookups by result.', ['result'])
+
+dashboard_cache = TTLCache(CACHE_SIZE, CACHE_TTL_SECONDS)
+_hit, _miss, _stale = (LOOKUPS.labels(result) for result in ('hit', 'miss', 'stale'))
+NO_ACTIVITY = DashboardActivity(0.0, 0, ())
+ACTIVITY_TYPES = ('deposit', 'withdrawal')
+
+
+def _activity(user_id):
+    """{txn_type: DashboardActivity} for deposits and withdrawals."""
+    totals = dict.fromkeys(ACTIVITY_TYPES, (0.0, 0))
+    totals.update((row[0], row[1:]) for row in db.session.execute(
+        select(Transaction.txn_type, func.sum(Transaction.amount), func.count())
+        .where(Transaction.user_id == user_id, Transaction.txn_type.in_(ACTIVITY_TYPES))
+        .group_by(Transaction.txn_type)))
+    activity = {}
+    for txn_type, (total, count) in totals.items():
+        recent = tuple(DashboardTxn(*row) for row in db.session.execute(
+            select(Transaction.txn_id, Transaction.amount, Transaction.date, Transaction.remarks)
+            .where(Transaction.user_id == user_id, Transaction.txn_type == txn_type)
+            .order_by(Transaction.date.desc()).limit(RECENT_TXNS))) if count else ()
+        activity[txn_type] = DashboardActivity(round(total, 2), count, recent)
+    return activity
+
+
+def build_dashboard(user_id):
+    """Load the view model from the database; None if the user does not exist."""
+    built_at = time.time()   # before reading, so a write committed meanwhile makes it stale
+    row = db.session.execute(select(Login.id, Login.fullname, Login.email, Login.username, Login.is_admin)
+                             .where(Login.id == user_id)).first()
+    if row is None:
+        return None
+    user = DashboardUser(*row[:4], bool(row.is_admin))
+    if user.is_admin:
+        # the admin dashboard lists users instead
+        return Dashboard(user, None, NO_ACTIVITY, NO_ACTIVITY, (), (), (), built_at)
+
+    row = db.session.execute(select(Account.id, Account.account_number, Account.balance)
+                             .where(Account.user_id == user_id).limit(1)).first()
+    account = DashboardAccount(*row) if row else None
+    subscriptions = tuple(DashboardSubscription(*row) for row in db.session.execute(
+        select(Subscription.id, Subscription.name, Subscription.amount, Subscription.frequency,
+               Subscription.next_billing_date, Subscription.active)
+        .where(Subscription.user_id == user_id)))
+    cards, upis = (), ()
+    if account:
+        cards = tuple(DashboardCard(*row) for row in db.session.execute(
+            select(Card.card_type, Card.card_number, Card.expiry).where(Card.account_id == account.id)))
+        upis = tuple(DashboardUpi(*row) for row in db.session.execute(
+            select(Upi.upi_id).where(Upi.account_id == account.id)))
+    activity = _activity(user_id)
+    return Dashboard(user, account, activity['deposit'], activity['withdrawal'],
+                     subscriptions, cards, upis, built_at)
+
+
+def get_dashboard(user_id):
+    """The cached view model for `user_id`, rebuilt when missing, expired or stale."""
+    dashboard = dashboard_cache.get(user_id)
+    if dashboard is not None and dashboard.built_at > last_write_at():
+        _hit.inc()
+        return dashboard
+    (_miss if dashboard is None else _stale).inc()
+    dashboard = build_dashboard(user_id)
+    if dashboard is not None:
+        dashboard_cache.set(user_id, dashboard)
+    return dashboard
+
+
+def invalidate_dashboard(*user_ids):
+    for user_id in user_ids:
+        dashboard_cache.pop(user_id)
+
+
+def dashboards_changed(user_ids):
+    """Drop these users' dashboards once the current transaction commits."""
+    db.session.info.setdefault('changed_dashboards', set()).update(user_ids)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _drop_committed(session):
+    invalidate_dashboard(*session.info.pop('changed_dashboards', ()))
+
+
+@event.listens_for(RoutingSession, 'after_soft_rollback')
+def _forget_rolled_back(session, previous_transaction):
+    if previous_transaction.parent is None:   # the outermost transaction ended
+        session.info.pop('changed_dashboards', None)
+
+
+def init_dashboard(app):
+    dashboard_cache.maxsize = app.config.setdefault('DASHBOARD_CACHE_SIZE', CACHE_SIZE)
+    dashboard_cache.ttl = app.config.setdefault('DASHBOARD_CACHE_TTL', CACHE_TTL_SECONDS)
@@ -0,0 +1,52 @@
+from sqlalchemy import event
+from . import db
+
+# SQLite connection setup.
+#
+# SQLITE_PRAGMAS (see config.py) is applied to every connection as it is
+# opened, for each engine the app configures, so pooled connections, worker
+# processes and any extra binds all run with the same settings. journal_mode
+# is stored in the database file; the rest are per connection.
+#
+# pysqlite only opens a transaction at the first INSERT/UPDATE/DELETE, so a
+# write transaction takes the write lock when it starts rather than trying to
+# upgrade a read snapshot. Contention therefore shows up as a wait of up to
+# busy_timeout, and ledger.run_in_transaction retries the rare timeouts.
+
+
+def _pragma_listener(pragmas):
+    statements = [f"PRAGMA {name}={value}" for name, value in pragmas.items()]
+
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
+
+    return set_pragmas
+
+
+def apply_pragmas(engine, pragmas):
+    """Run `pragmas` on every new connection of `engine` (for an async engine, its sync_engine)."""
+    event.listen(engine, 'connect', _pragma_listener(pragmas))
+
+
+def sqlite_pragmas(connection):
+    """Effective values of the configured pragmas on `connection`, for checks and benchmarks."""
+    from flask import current_app
+
+    return {name: connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+            for name in current_app.config.get('SQLITE_PRAGMAS', {})}
+
+
+def init_database(app):
+    pragmas = app.config.setdefault('SQLITE_PRAGMAS', {})
+    if not pragmas:
+        return
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        if engine.dialect.name == 'sqlite':
+            apply_pragmas(engine, pragmas)
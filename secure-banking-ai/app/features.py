@@ -0,0 +1,175 @@
+import math
+from datetime import timezone
+from sqlalchemy import delete, insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from .models.models import db, Account, AccountCounterparty, AccountFeatures, Transaction
+
+# Every ledger write folds its new Transaction rows in here, so reading an
+# account's fraud signals at scoring time is one primary-key lookup instead
+# of a scan of its history. Velocities decay exponentially: a transfer
+# counts 1 when made and e^-1 after one window, so no event log is kept.
+
+VELOCITY_WINDOWS = {'sent_velocity_1h': 3600.0, 'sent_velocity_24h': 86400.0}
+# weight of the newest amount in the running mean and variance
+AMOUNT_ALPHA = 0.1
+PAIR_CHUNK = 250
+REBUILD_CHUNK = 1000
+STREAM_BATCH = 10000
+
+COLUMNS = ('last_event_at', 'txn_count', 'amount_mean', 'amount_var', 'last_sent_at',
+           'sent_velocity_1h', 'sent_velocity_24h', 'distinct_counterparties')
+
+
+def _naive_utc(when):
+    if when is not None and when.tzinfo is not None:
+        when = when.astimezone(timezone.utc).replace(tzinfo=None)
+    return when
+
+
+def _empty_state(account_id):
+    return {'account_id': account_id, 'last_event_at': None, 'txn_count': 0,
+            'amount_mean': 0.0, 'amount_var': 0.0, 'last_sent_at': None,
+            'sent_velocity_1h': 0.0, 'sent_velocity_24h': 0.0,
+            'distinct_counterparties': 0}
+
+
+def _decayed(state, now):
+    elapsed = max((now - state['last_sent_at']).total_seconds(), 0.0)
+    return {column: state[column] * math.exp(-elapsed / tau)
+            for column, tau in VELOCITY_WINDOWS.items()}
+
+
+def apply_event(state, txn_type, amount, when, new_counterparty=False):
+    """Fold one transaction into an account's feature state in O(1)."""
+    when = _naive_utc(when)
+    if state['txn_count']:
+        diff = amount - state['amount_mean']
+        step = AMOUNT_ALPHA * diff
+        state['amount_mean'] += step
+        state['amount_var'] = (1 - AMOUNT_ALPHA) * (state['amount_var'] + diff * step)
+    else:
+        state['amount_mean'], state['amount_var'] = amount, 0.0
+    state['txn_count'] += 1
+    state['last_event_at'] = max(filter(None, (state['last_event_at'], when)), default=None)
+
+    if txn_type == 'transfer_sent':
+        if state['last_sent_at'] is not None and when >= state['last_sent_at']:
+            state.update(_decayed(state, when))
+        for column in VELOCITY_WINDOWS:
+            state[column] += 1.0
+        state['last_sent_at'] = max(filter(None, (state['last_sent_at'], when)))
+
+    if new_counterparty:
+        state['distinct_counterparties'] += 1
+
+
+def velocity(features, now):
+    """(1h, 24h) transfer velocity of an AccountFeatures row, decayed to `now`."""
+    if features is None or features.last_sent_at is None:
+        return 0.0, 0.0
+    decayed = _decayed({column: getattr(features, column)
+                        for column in ('last_sent_at', *VELOCITY_WINDOWS)}, _naive_utc(now))
+    return decayed['sent_velocity_1h'], decayed['sent_velocity_24h']
+
+
+def _known_pairs(pairs):
+    # Two plain IN lists keep SQLite on the (account_id, counterparty) primary
+    # key; a row-value IN would scan. The cross product is filtered here.
+    known, pairs = set(), list(pairs)
+    for start in range(0, len(pairs), PAIR_CHUNK):
+        chunk = pairs[start:start + PAIR_CHUNK]
+        rows = db.session.execute(
+            select(AccountCounterparty.account_id, AccountCounterparty.counterparty)
+            .where(AccountCounterparty.account_id.in_({a for a, _ in chunk}),
+                   AccountCounterparty.counterparty.in_({c for _, c in chunk})))
+        known.update(tuple(row) for row in rows)
+    return known & set(pairs)
+
+
+def _upsert(states):
+    statement = sqlite_insert(AccountFeatures)
+    statement = statement.on_conflict_do_update(
+        index_elements=['account_id'],
+        set_={column: getattr(statement.excluded, column) for column in COLUMNS})
+    db.session.execute(statement, states)
+
+
+def update_features(rows):
+    """Fold newly recorded Transaction rows (dicts) into the feature store.
+
+    Runs inside the caller's database transaction, after its balance
+    updates, so on SQLite the write lock is already held and the
+    read-modify-write of each account's row cannot interleave.
+    """
+    account_ids = list({row['account_id'] for row in rows})
+    states = {
+        row.account_id: dict(row._mapping)
+        for row in db.session.execute(select(AccountFeatures.__table__)
+                                      .where(AccountFeatures.account_id.in_(account_ids)))
+    }
+    pairs = {(row['account_id'], row['counterparty']) for row in rows if row.get('counterparty')}
+    fresh = pairs - _known_pairs(pairs)
+    new_pairs = list(fresh)
+
+    for row in rows:
+        state = states.setdefault(row['account_id'], _empty_state(row['account_id']))
+        pair = (row['account_id'], row.get('counterparty'))
+        apply_event(state, row['txn_type'], row['amount'], row['date'], pair in fresh)
+        fresh.discard(pair)
+
+    if new_pairs:
+        db.session.execute(insert(AccountCounterparty),
+                           [{'account_id': a, 'counterparty': c} for a, c in new_pairs])
+    _upsert(list(states.values()))
+
+
+def rebuild_features(chunk_size=REBUILD_CHUNK):
+    """Recompute the feature store from Transaction history.
+
+    Accounts are processed in id ranges of `chunk_size`, one transaction
+    each: the range's rows are deleted first, which takes SQLite's write
+    lock, so its history is read and re-inserted with no ledger write in
+    between and readers see either the old rows or the new ones. Within a
+    range, transactions stream in (account_id, date) order through
+    ix_transactions_account_date, so memory holds one range's state only.
+    Returns the number of accounts rebuilt.
+    """
+    rebuilt, last_id = 0, 0
+    while True:
+        ids = db.session.execute(select(Account.id).where(Account.id > last_id)
+                                 .order_by(Account.id).limit(chunk_size)).scalars().all()
+        if not ids:
+            break
+        first, last_id = last_id, ids[-1]
+        db.session.execute(delete(AccountCounterparty).where(AccountCounterparty.account_id > first,
+                                                             AccountCounterparty.account_id <= last_id))
+        db.session.execute(delete(AccountFeatures).where(AccountFeatures.account_id > first,
+                                                         AccountFeatures.account_id <= last_id))
+
+        history = select(Transaction.account_id, Transaction.txn_type, Transaction.amount,
+                         Transaction.counterparty, Transaction.date) \
+            .where(Transaction.account_id > first, Transaction.account_id <= last_id) \
+            .order_by(Transaction.account_id, Transaction.date, Transaction.id) \
+            .execution_options(yield_per=STREAM_BATCH)
+        states, pairs = {}, set()
+        for row in db.session.execute(history):
+            state = states.setdefault(row.account_id, _empty_state(row.account_id))
+            pair = (row.account_id, row.counterparty)
+            is_new = row.counterparty is not None and pair not in pairs
+            if is_new:
+                pairs.add(pair)
+            apply_event(state, row.txn_type, row.amount, row.date, is_new)
+
+        if pairs:
+            db.session.execute(insert(AccountCounterparty),
+                               [{'account_id': a, 'counterparty': c} for a, c in pairs])
+        if states:
+            db.session.execute(insert(AccountFeatures), list(states.values()))
+        db.session.commit()
+        rebuilt += len(states)
+
+    # rows of accounts deleted past the last one
+    db.session.execute(delete(AccountCounterparty).where(AccountCounterparty.account_id > last_id))
+    db.session.execute(delete(AccountFeatures).where(AccountFeatures.account_id > last_id))
+    db.session.commit()
+    return rebuilt
@@ -0,0 +1,156 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# Password and PIN hashing on a bounded pool.
+#
+# Argon2 (argon2-cffi) and PBKDF2 (hashlib) both release the GIL while they
+# run, so a thread pool sized to the core count runs that many KDFs in
+# parallel and no more. Requests beyond HASH_MAX_PENDING are refused with
+# HashingBusy (a 503) instead of queueing until every worker is starved.
+#
+# Stored formats:
+#   $argon2id$...              argon2-cffi
+#   pbkdf2:sha256:<n>$...      werkzeug (also how legacy hashes were written)
+#   scrypt:...                 werkzeug's default, legacy only
+# Any of them verifies; a hash not matching the configured algorithm and
+# cost is replaced after the next successful login.
+
+ALGORITHMS = ('argon2', 'pbkdf2')
+DEFAULTS = {
+    'PASSWORD_HASH_ALGORITHM': 'argon2',
+    # OWASP's argon2id minimum: 19 MiB, 2 passes, 1 lane
+    'ARGON2_TIME_COST': 2,
+    'ARGON2_MEMORY_COST': 19456,
+    'ARGON2_PARALLELISM': 1,
+    'PBKDF2_ITERATIONS': 600000,
+    'HASH_WORKERS': os.cpu_count() or 1,
+    'HASH_MAX_PENDING': None,   # default: 8 per worker
+    'HASH_TIMEOUT_SECONDS': 10,
+}
+
+
+class HashingBusy(Exception):
+    """More hashing requests are pending than HASH_MAX_PENDING allows."""
+
+
+class Hasher:
+
+    def __init__(self, algorithm='argon2', time_cost=2, memory_cost=19456, parallelism=1,
+                 iterations=600000, workers=1, max_pending=None, timeout=10):
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"PASSWORD_HASH_ALGORITHM must be one of {ALGORITHMS}, not {algorithm!r}")
+        from argon2 import PasswordHasher
+
+        self.pid = os.getpid()
+        self.algorithm = algorithm
+        self.argon2 = PasswordHasher(time_cost=time_cost, memory_cost=memory_cost,
+                                     parallelism=parallelism)
+        self.pbkdf2_method = f'pbkdf2:sha256:{iterations}'
+        self.timeout = timeout
+        self.workers = workers
+        self.slots = threading.BoundedSemaphore(max_pending or workers * 8)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hashing')
+
+    # ---------------- Blocking primitives (run on the pool) ----------------
+    def _hash(self, secret):
+        if self.algorithm == 'argon2':
+            return self.argon2.hash(secret)
+        return generate_password_hash(secret, method=self.pbkdf2_method)
+
+    def _verify(self, stored, secret):
+        from argon2.exceptions import InvalidHashError, VerificationError
+
+        if not stored:
+            return False
+        if stored.startswith('$argon2'):
+            try:
+                return self.argon2.verify(stored, secret)
+            except (VerificationError, InvalidHashError):
+                return False
+        return check_password_hash(stored, secret)
+
+    def needs_rehash(self, stored):
+        if self.algorithm == 'argon2':
+            return not stored.startswith('$argon2') or self.argon2.check_needs_rehash(stored)
+        return not stored.startswith(self.pbkdf2_method + '$')
+
+    def _verify_and_update(self, stored, secret):
+        if not self._verify(stored, secret):
+            return False, None
+        return True, self._hash(secret) if self.needs_rehash(stored) else None
+
+    # ---------------- Pool submission ----------------
+    def _run(self, fn, *args):
+        if not self.slots.acquire(blocking=False):
+            raise HashingBusy()
+        try:
+            future = self.pool.submit(fn, *args)
+        except BaseException:
+            self.slots.release()
+            raise
+        # the slot is held until the KDF finishes, not just until the caller gives up on it
+        future.add_done_callback(lambda _: self.slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            raise HashingBusy() from None
+
+    def hash(self, secret):
+        return self._run(self._hash, secret)
+
+    def verify(self, stored, secret):
+        return self._run(self._verify, stored, secret)
+
+    def verify_and_update(self, stored, secret):
+        """(valid, new_hash); new_hash is set when `stored` should be replaced."""
+        return self._run(self._verify_and_update, stored, secret)
+
+
+_hasher = None
+_hasher_lock = threading.Lock()
+
+
+def _config(key):
+    return current_app.config.get(key, DEFAULTS[key])
+
+
+def get_hasher():
+    """The process-wide hasher, created on first use (and again after a fork)."""
+    global _hasher
+    if _hasher is None or _hasher.pid != os.getpid():
+        with _hasher_lock:
+            if _hasher is None or _hasher.pid != os.getpid():
+                _hasher = Hasher(_config('PASSWORD_HASH_ALGORITHM'),
+                                 _config('ARGON2_TIME_COST'),
+                                 _config('ARGON2_MEMORY_COST'),
+                                 _config('ARGON2_PARALLELISM'),
+                                 _config('PBKDF2_ITERATIONS'),
+                                 _config('HASH_WORKERS'),
+                                 _config('HASH_MAX_PENDING'),
+                                 _config('HASH_TIMEOUT_SECONDS'))
+    return _hasher
+
+
+def hash_secret(secret):
+    return get_hasher().hash(secret)
+
+
+def verify_secret(stored, secret):
+    return get_hasher().verify(stored, secret)
+
+
+def verify_and_update(stored, secret):
+    return get_hasher().verify_and_update(stored, secret)
+
+
+def _busy(error):
+    return 'The server is busy, please try again in a moment.', 503, {'Retry-After': '1'}
+
+
+def init_hashing(app):
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+    app.register_error_handler(HashingBusy, _busy)
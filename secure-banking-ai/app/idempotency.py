@@ -0,0 +1,164 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import namedtuple
+from datetime import datetime, timedelta
+from flask import abort, current_app, flash, redirect, request
+from sqlalchemy import bindparam, delete, literal_column, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from .models.models import db, IdempotencyKey
+from . import ledger
+
+logger = logging.getLogger(__name__)
+
+# Idempotency keys for the money-movement forms.
+#
+# A client sends a key with a POST, in the Idempotency-Key header or the
+# idempotency_key form field (the deposit, withdrawal and transfer forms
+# carry a fresh one each time they are rendered). The first request to
+# succeed with a key stores it, with the transaction id and the message
+# shown, in the same database transaction that moves the money. The claim
+# is the first statement of that transaction, so a concurrent duplicate
+# waits for the write lock, finds the key and rolls back before touching a
+# balance. Retries are answered from the stored row with the original
+# message, without re-running the operation.
+#
+# Failed operations store nothing and may be retried with the same key.
+# Keys are per user and live for IDEMPOTENCY_KEY_TTL seconds.
+
+HEADER = 'Idempotency-Key'
+FORM_FIELD = 'idempotency_key'
+KEY_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,64}')
+KEY_TTL_SECONDS = 24 * 3600
+SWEEP_INTERVAL_SECONDS = 300
+SWEEP_CHUNK = 1000
+
+_keys = IdempotencyKey.__table__
+_rowid = literal_column('rowid')
+LOOKUP = select(_keys.c.fingerprint, _keys.c.txn_id, _keys.c.message, _keys.c.category) \
+    .where(_keys.c.user_id == bindparam('b_user_id'), _keys.c.key == bindparam('b_key'),
+           _keys.c.expires_at > bindparam('b_now'))
+_insert = sqlite_insert(_keys)
+# takes over an expired row still waiting for the sweeper, never a live one
+CLAIM = _insert.on_conflict_do_update(
+    index_elements=['user_id', 'key'],
+    set_={column: _insert.excluded[column]
+          for column in ('fingerprint', 'txn_id', 'message', 'category', 'expires_at')},
+    where=_keys.c.expires_at <= bindparam('b_now'))
+
+
+class DuplicateRequest(ledger.LedgerError):
+    """Another request with the same key committed first."""
+
+
+class Claim(namedtuple('Claim', ['user_id', 'key', 'fingerprint', 'message', 'category', 'ttl'])):
+
+    def store(self, txn_id):
+        """Record the key in the current transaction; raises DuplicateRequest if it is taken."""
+        now = datetime.utcnow()
+        result = db.session.execute(CLAIM, {
+            'user_id': self.user_id, 'key': self.key, 'fingerprint': self.fingerprint, 'txn_id': txn_id,
+            'message': self.message, 'category': self.category,
+            'expires_at': now + timedelta(seconds=self.ttl), 'b_now': now})
+        if result.rowcount != 1:
+            raise DuplicateRequest(self.key)
+
+
+def new_key():
+    return uuid.uuid4().hex
+
+
+def request_key():
+    """The key sent with this request, or None; a malformed key is a 400."""
+    key = request.headers.get(HEADER) or request.form.get(FORM_FIELD)
+    if key and not KEY_PATTERN.fullmatch(key):
+        abort(400, description=f"{HEADER} must be 1-64 letters, digits, '-' or '_'.")
+    return key or None
+
+
+def fingerprint():
+    """Hash of what this request asks for: its endpoint and form fields, or its JSON body."""
+    fields = sorted((name, value) for name, value in request.form.items(multi=True) if name != FORM_FIELD)
+    parts = (request.endpoint, fields, request.get_data()) if request.is_json else (request.endpoint, fields)
+    return hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+
+
+def lookup(user_id, key):
+    """The stored (fingerprint, txn_id, message, category) of a live key, or None."""
+    if not key:
+        return None
+    return db.session.execute(LOOKUP, {'b_user_id': user_id, 'b_key': key,
+                                       'b_now': datetime.utcnow()}).first()
+
+
+def replay(user_id, key, location):
+    """Redirect to `location` with the stored outcome of `key`; None if it has not been used."""
+    row = lookup(user_id, key)
+    if row is None:
+        return None
+    if row.fingerprint == fingerprint():
+        flash(row.message, row.category)
+    else:
+        flash('That request was already submitted with different details.', 'danger')
+    response = redirect(location)
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def claim(user_id, key, message, category='success'):
+    """A Claim to pass to the ledger operation, or None when the request has no key."""
+    if not key:
+        return None
+    return Claim(user_id, key, fingerprint(), message, category,
+                 current_app.config['IDEMPOTENCY_KEY_TTL'])
+
+
+# ---------------- Expiry sweeps ----------------
+def sweep_expired_keys(now=None, chunk_size=SWEEP_CHUNK):
+    """Delete expired keys in short transactions; returns the count."""
+    now = now or datetime.utcnow()
+    removed = 0
+    while True:
+        expired = select(_rowid).where(_keys.c.expires_at <= now).limit(chunk_size)
+        with db.engine.begin() as connection:
+            deleted = connection.execute(delete(_keys).where(_rowid.in_(expired))).rowcount
+        removed += deleted
+        if deleted < chunk_size:
+            return removed
+
+
+_sweeper_pid = None
+_sweeper_lock = threading.Lock()
+
+
+def _start_sweeper():
+    # one sweeper per process, started lazily so forked workers get their own
+    global _sweeper_pid
+    interval = current_app.config['IDEMPOTENCY_SWEEP_INTERVAL']
+    if _sweeper_pid == os.getpid() or not interval:
+        return
+    with _sweeper_lock:
+        if _sweeper_pid != os.getpid():
+            _sweeper_pid = os.getpid()
+            threading.Thread(target=_sweep_forever, args=(current_app._get_current_object(), interval),
+                             name='idempotency-sweeper', daemon=True).start()
+
+
+def _sweep_forever(app, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            with app.app_context():
+                sweep_expired_keys()
+        except Exception:
+            logger.exception("Idempotency key sweep failed")
+
+
+def init_idempotency(app):
+    app.config.setdefault('IDEMPOTENCY_KEY_TTL', KEY_TTL_SECONDS)
+    app.config.setdefault('IDEMPOTENCY_SWEEP_INTERVAL', SWEEP_INTERVAL_SECONDS)
+    app.before_request(_start_sweeper)
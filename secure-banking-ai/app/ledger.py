@@ -0,0 +1,283 @@
+import math
+import random
+import time
+import uuid
+from datetime import datetime, timezone
+from sqlalchemy import bindparam, insert, select, union_all, update
+from sqlalchemy.exc import OperationalError
+from .models.models import db, Account, Transaction, Upi
+from .balances import invalidate_snapshots
+from .features import update_features
+from .dashboard import dashboards_changed
+from .recipients import remember_payee
+from .rollups import update_rollups
+
+# Balances only ever change through set-based UPDATEs issued here, so two
+# workers moving money out of the same account can never overwrite each
+# other's result: the database applies `balance = balance - :amt` atomically
+# and the `balance >= :amt` guard is evaluated against the committed value.
+
+CREDIT_TYPES = ('deposit', 'transfer_received')
+DEBIT_TYPES = ('withdrawal', 'transfer_sent', 'subscription', 'card_payment')
+
+MAX_ATTEMPTS = 5
+BACKOFF_SECONDS = 0.02
+MAX_BATCH_LINES = 10000
+# stays well under SQLite's bound-parameter limit
+IN_CHUNK = 500
+
+
+_accounts = Account.__table__
+# Built once: compiled statements are cached, which keeps a debit at tens
+# of microseconds when the billing runner issues thousands per chunk.
+CREDIT = update(_accounts) \
+    .where(_accounts.c.id == bindparam('b_id')) \
+    .values(balance=_accounts.c.balance + bindparam('b_amount'))
+DEBIT = update(_accounts) \
+    .where(_accounts.c.id == bindparam('b_id'), _accounts.c.balance >= bindparam('b_amount')) \
+    .values(balance=_accounts.c.balance - bindparam('b_amount'))
+
+
+class LedgerError(Exception):
+    pass
+
+
+class InsufficientFunds(LedgerError):
+    pass
+
+
+class AccountNotFound(LedgerError):
+    pass
+
+
+class InvalidAmount(LedgerError):
+    pass
+
+
+def new_txn_id():
+    return f"TXN{uuid.uuid4().hex[:12]}"
+
+
+def is_busy_error(exc):
+    message = str(getattr(exc, 'orig', exc)).lower()
+    return 'database is locked' in message or 'database is busy' in message
+
+
+def run_in_transaction(work, attempts=MAX_ATTEMPTS):
+    """Run `work()` and commit, retrying from scratch on SQLite busy errors.
+
+    Anything `work` raised is rolled back, so a failed debit never leaves a
+    half-applied transfer behind.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            result = work()
+            db.session.commit()
+            return result
+        except OperationalError as exc:
+            db.session.rollback()
+            if attempt == attempts or not is_busy_error(exc):
+                raise
+            time.sleep(BACKOFF_SECONDS * attempt * (1 + random.random()))
+        except Exception:
+            db.session.rollback()
+            raise
+
+
+def _check_amount(amount):
+    # NaN would fail the NOT NULL on balance and inf would be stored as is
+    if not math.isfinite(amount):
+        raise InvalidAmount(amount)
+
+
+def credit(account_id, amount):
+    _check_amount(amount)
+    result = db.session.execute(CREDIT, {'b_id': account_id, 'b_amount': amount})
+    if result.rowcount != 1:
+        raise AccountNotFound(account_id)
+
+
+def debit(account_id, amount):
+    _check_amount(amount)
+    result = db.session.execute(DEBIT, {'b_id': account_id, 'b_amount': amount})
+    if result.rowcount != 1:
+        raise InsufficientFunds(account_id)
+
+
+def record(rows):
+    """Bulk insert Transaction rows given as dicts and fold them into the feature store and rollups."""
+    if rows:
+        db.session.execute(insert(Transaction), rows)
+        update_features(rows)
+        update_rollups(rows)
+        invalidate_snapshots(rows)
+        dashboards_changed(row['user_id'] for row in rows)
+
+
+def _entry(account, txn_type, amount, remarks, counterparty=None, when=None):
+    return {
+        'user_id': account.user_id,
+        'account_id': account.id,
+        'txn_id': new_txn_id(),
+        'txn_type': txn_type,
+        'amount': amount,
+        'counterparty': counterparty,
+        'remarks': remarks,
+        'date': when or datetime.now(timezone.utc),
+    }
+
+
+# ---------------- Operations ----------------
+# `idempotency` is an idempotency.Claim or None. It is stored first, so a
+# duplicate request fails before any balance changes.
+def deposit(account, amount, remarks='', idempotency=None):
+    entry = _entry(account, 'deposit', amount, remarks)
+
+    def work():
+        if idempotency is not None:
+            idempotency.store(entry['txn_id'])
+        credit(account.id, amount)
+        record([entry])
+        return entry['txn_id']
+
+    return run_in_transaction(work)
+
+
+def withdraw(account, amount, remarks='', idempotency=None):
+    entry = _entry(account, 'withdrawal', amount, remarks)
+
+    def work():
+        if idempotency is not None:
+            idempotency.store(entry['txn_id'])
+        debit(account.id, amount)
+        record([entry])
+        return entry['txn_id']
+
+    return run_in_transaction(work)
+
+
+def transfer(sender, recipient, amount, remarks='', recipient_label=None, idempotency=None):
+    """Move `amount` from `sender` to `recipient` accounts atomically.
+
+    Both balance updates are applied in ascending account id order so that
+    concurrent opposite-direction transfers acquire row locks in the same
+    order on databases that have them. `recipient` may be an Account or a
+    recipients.Recipient; it is added to the sender's recent payees.
+    """
+    now = datetime.now(timezone.utc)
+    sent = _entry(sender, 'transfer_sent', amount,
+                  f"To {recipient_label or recipient.account_number} - {remarks}",
+                  counterparty=recipient.account_number, when=now)
+    received = _entry(recipient, 'transfer_received', amount,
+                      f"From {sender.account_number} - {remarks}",
+                      counterparty=sender.account_number, when=now)
+    legs = sorted([(sender.id, debit), (recipient.id, credit)], key=lambda leg: leg[0])
+
+    def work():
+        if idempotency is not None:
+            idempotency.store(sent['txn_id'])
+        for account_id, apply in legs:
+            apply(account_id, amount)
+        record([sent, received])
+        remember_payee(sender.user_id, recipient, recipient_label or recipient.account_number, now)
+        return sent['txn_id']
+
+    return run_in_transaction(work)
+
+
+# ---------------- Batch payments ----------------
+def resolve_recipients(account_numbers, upi_ids):
+    """Map account numbers and UPI ids to (account_id, user_id, account_number).
+
+    One UNION ALL statement per chunk of keys, each arm driven by a unique index.
+    """
+    account_numbers, upi_ids = list(set(account_numbers)), list(set(upi_ids))
+    resolved = {}
+    for start in range(0, max(len(account_numbers), len(upi_ids)), IN_CHUNK):
+        numbers = account_numbers[start:start + IN_CHUNK]
+        upis = upi_ids[start:start + IN_CHUNK]
+        by_number = select(Account.account_number.label('key'), Account.id,
+                           Account.user_id, Account.account_number) \
+            .where(Account.account_number.in_(numbers))
+        by_upi = select(Upi.upi_id.label('key'), Account.id, Account.user_id,
+                        Account.account_number) \
+            .join(Account, Account.id == Upi.account_id) \
+            .where(Upi.upi_id.in_(upis))
+        for row in db.session.execute(union_all(by_number, by_upi)):
+            resolved[row.key] = (row.id, row.user_id, row.account_number)
+    return resolved
+
+
+def transfer_batch(sender, lines):
+    """Pay many recipients from `sender` in one database transaction.
+
+    `lines` are dicts with `account_number` or `upi_id`, `amount` and
+    optional `remarks`. Lines with a bad amount, a recipient that is not a
+    string or an unknown recipient are reported and skipped. The remaining
+    total is debited with a single conditional update, so either every
+    resolvable line is paid or none is; a recipient account closed before
+    the credits land fails the whole batch.
+    Returns one result dict per input line.
+    """
+    recipients = [line.get('account_number') or line.get('upi_id') for line in lines]
+    resolved = resolve_recipients(
+        [recipient for line, recipient in zip(lines, recipients)
+         if isinstance(recipient, str) and line.get('account_number')],
+        [recipient for line, recipient in zip(lines, recipients)
+         if isinstance(recipient, str) and not line.get('account_number')])
+
+    now = datetime.now(timezone.utc)
+    report, payable, rows, payouts = [], [], [], {}
+    for number, (line, recipient) in enumerate(zip(lines, recipients), start=1):
+        result = {'line': number, 'recipient': recipient, 'amount': line.get('amount')}
+        report.append(result)
+        if recipient is not None and not isinstance(recipient, str):
+            result.update(status='failed', error='account_number and upi_id must be strings')
+            continue
+        try:
+            amount = float(line.get('amount'))
+        except (TypeError, ValueError):
+            amount = 0.0
+        if not (math.isfinite(amount) and amount > 0):
+            result.update(status='failed', error='invalid amount')
+            continue
+        target = resolved.get(recipient)
+        if target is None:
+            result.update(status='failed', error='recipient not found')
+            continue
+        result['amount'] = amount
+        remarks = line.get('remarks') or ''
+
+        account_id, user_id, account_number = target
+        sent = _entry(sender, 'transfer_sent', amount, f"To {recipient} - {remarks}",
+                      counterparty=account_number, when=now)
+        rows.append(sent)
+        rows.append({**sent, 'user_id': user_id, 'account_id': account_id,
+                     'txn_id': new_txn_id(), 'txn_type': 'transfer_received',
+                     'counterparty': sender.account_number,
+                     'remarks': f"From {sender.account_number} - {remarks}"})
+        payouts[account_id] = payouts.get(account_id, 0.0) + amount
+        result.update(status='paid', txn_id=sent['txn_id'])
+        payable.append(result)
+
+    if not payable:
+        return report
+    total = sum(payouts.values())
+
+    def work():
+        debit(sender.id, total)
+        credited = db.session.execute(CREDIT, [{'b_id': account_id, 'b_amount': amount}
+                                               for account_id, amount in sorted(payouts.items())])
+        if credited.rowcount != len(payouts):
+            raise AccountNotFound(sorted(payouts))
+        record(rows)
+
+    try:
+        run_in_transaction(work)
+    except (InsufficientFunds, AccountNotFound) as exc:
+        error = 'insufficient funds for batch' if isinstance(exc, InsufficientFunds) \
+            else 'a recipient account was closed; batch not paid'
+        for result in payable:
+            result.update(status='failed', error=error)
+            result.pop('txn_id')
+    return report
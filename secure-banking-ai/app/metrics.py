@@ -0,0 +1,118 @@
+import os
+import time
+from contextvars import ContextVar
+from functools import lru_cache
+from flask import Response, g, request
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, \
+    generate_latest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Per-endpoint request metrics for Prometheus, scraped from /metrics.
+#
+# SQL statements are timed with cursor events on the Engine class, so every
+# engine the app creates is covered. Their counts and time accumulate in a
+# per-request list held in a ContextVar and are observed once, at teardown,
+# which keeps the per-statement cost to two perf_counter() calls.
+# Labels are the Flask endpoint name, never the raw path, so their number is
+# bounded by the routes.
+
+LATENCY_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100, 200)
+DB_TIME_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1)
+
+REQUEST_LATENCY = Histogram('securebank_request_duration_seconds', 'Request latency by endpoint.',
+                            ['endpoint', 'method'], buckets=LATENCY_BUCKETS)
+REQUESTS = Counter('securebank_requests_total', 'Requests by endpoint and status.',
+                   ['endpoint', 'method', 'status'])
+QUERIES_PER_REQUEST = Histogram('securebank_db_queries_per_request', 'SQL statements per request.',
+                                ['endpoint'], buckets=QUERY_BUCKETS)
+DB_TIME = Histogram('securebank_db_seconds_per_request', 'Time spent in SQL statements per request.',
+                    ['endpoint'], buckets=DB_TIME_BUCKETS)
+COMMITS = Counter('securebank_db_commits_total', 'Database commits by endpoint.', ['endpoint'])
+
+# [statements, seconds in SQL, commits] for the request being served
+_request_stats = ContextVar('request_db_stats', default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # kept on the execution context, which is discarded if the statement fails
+    context.metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _request_stats.get()
+    if stats is not None:
+        stats[0] += 1
+        stats[1] += time.perf_counter() - context.metrics_started
+
+
+def _on_commit(conn):
+    stats = _request_stats.get()
+    if stats is not None:
+        stats[2] += 1
+    else:
+        COMMITS.labels('background').inc()
+
+
+def _listen_once(target, name, fn):
+    if not event.contains(target, name, fn):
+        event.listen(target, name, fn)
+
+
+def _start_request():
+    g.metrics_started = time.perf_counter()
+    g.metrics_status = 500   # unless after_request sees a response
+    g.metrics_token = _request_stats.set([0, 0.0, 0])
+
+
+def _record_status(response):
+    g.metrics_status = response.status_code
+    return response
+
+
+@lru_cache(maxsize=None)
+def _series(endpoint, method):
+    # labels() hashes and locks on every call; resolve each child once
+    return (REQUEST_LATENCY.labels(endpoint, method), QUERIES_PER_REQUEST.labels(endpoint),
+            DB_TIME.labels(endpoint), COMMITS.labels(endpoint))
+
+
+def _finish_request(exc):
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    stats = _request_stats.get()
+    _request_stats.reset(g.pop('metrics_token'))
+    endpoint = request.endpoint or 'unmatched'
+    latency, queries, db_time, commits = _series(endpoint, request.method)
+    latency.observe(elapsed)
+    REQUESTS.labels(endpoint, request.method, str(g.pop('metrics_status'))).inc()
+    queries.observe(stats[0])
+    db_time.observe(stats[1])
+    if stats[2]:
+        commits.inc(stats[2])
+
+
+def metrics_view():
+    registry = REGISTRY
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        # several worker processes: merge what each one wrote
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+def init_metrics(app):
+    if not app.config.setdefault('METRICS_ENABLED', True):
+        return
+    _listen_once(Engine, 'before_cursor_execute', _before_cursor_execute)
+    _listen_once(Engine, 'after_cursor_execute', _after_cursor_execute)
+    _listen_once(Engine, 'commit', _on_commit)
+    app.before_request(_start_request)
+    app.after_request(_record_status)
+    app.teardown_request(_finish_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
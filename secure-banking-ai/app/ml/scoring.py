@@ -0,0 +1,197 @@
+import logging
+import math
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from datetime import datetime, timezone
+from flask import current_app
+from ..features import velocity
+
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = os.path.join(os.path.dirname(__file__), 'fraud_detector.pkl')
+
+# Column order the model is trained on; transfer_features() must match it.
+FEATURES = (
+    'amount',
+    'log_amount',
+    'amount_to_balance',
+    'balance',
+    'hour_utc',
+    'sender_account_age_days',
+    'recipient_account_age_days',
+    'same_owner',
+    'sent_velocity_1h',
+    'sent_velocity_24h',
+    'amount_zscore',
+    'distinct_counterparties',
+)
+
+FRAUD_THRESHOLD = 0.9
+MAX_BATCH = 64
+MAX_WAIT_SECONDS = 0.001
+SCORE_TIMEOUT_SECONDS = 0.05
+LATENCY_WINDOW = 10000
+
+
+def _age_days(created_at, now):
+    if created_at is None:
+        return 0.0
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return max((now - created_at).total_seconds() / 86400, 0.0)
+
+
+def transfer_features(sender_account, recipient_account, amount, features=None, now=None):
+    """Feature row for a transfer.
+
+    Built only from rows the view already loaded plus the sender's
+    AccountFeatures row (one primary-key lookup, may be None).
+    """
+    now = now or datetime.now(timezone.utc)
+    balance = sender_account.balance or 0.0
+    velocity_1h, velocity_24h = velocity(features, now)
+    mean = features.amount_mean if features else amount
+    spread = math.sqrt(features.amount_var) if features else 0.0
+    return [
+        amount,
+        math.log1p(amount),
+        amount / (balance + 1.0),
+        balance,
+        float(now.hour),
+        _age_days(sender_account.created_at, now),
+        _age_days(recipient_account.created_at, now),
+        float(sender_account.user_id == recipient_account.user_id),
+        velocity_1h,
+        velocity_24h,
+        (amount - mean) / (spread + 1.0),
+        float(features.distinct_counterparties if features else 0),
+    ]
+
+
+class MicroBatcher:
+    """Scores concurrent requests together through one predict_proba call.
+
+    The worker thread blocks for the first request, then collects whatever
+    else arrives within `max_wait` (up to `max_batch` rows). Under light load
+    a request is scored alone almost immediately; under heavy load requests
+    pile up while the previous batch runs and are scored together.
+    """
+
+    def __init__(self, model, max_batch=MAX_BATCH, max_wait=MAX_WAIT_SECONDS):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.pending = queue.SimpleQueue()
+        self.batch_sizes = deque(maxlen=LATENCY_WINDOW)
+        threading.Thread(target=self._run, name='fraud-scoring', daemon=True).start()
+
+    def submit(self, features):
+        future = Future()
+        self.pending.put((features, future))
+        return future
+
+    def _collect(self):
+        batch = [self.pending.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self.pending.get(timeout=remaining) if remaining > 0
+                             else self.pending.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        import numpy as np
+
+        while True:
+            batch = self._collect()
+            self.batch_sizes.append(len(batch))
+            try:
+                scores = self.model.predict_proba(np.asarray([row for row, _ in batch]))[:, 1]
+            except Exception as exc:  # a bad batch must not kill the scoring thread
+                for _, future in batch:
+                    future.set_exception(exc)
+                continue
+            for (_, future), score in zip(batch, scores):
+                future.set_result(float(score))
+
+
+class FraudScorer:
+    """Per-process fraud scorer; disabled (scores are None) when no model loads."""
+
+    def __init__(self, model_path, timeout=SCORE_TIMEOUT_SECONDS):
+        self.pid = os.getpid()
+        self.timeout = timeout
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.timeouts = 0
+        self.batcher = None
+        model = self._load(model_path)
+        if model is not None:
+            self.batcher = MicroBatcher(model)
+
+    @staticmethod
+    def _load(model_path):
+        try:
+            import joblib
+            model = joblib.load(model_path)
+        except Exception as exc:  # missing, empty or incompatible pickle
+            logger.warning("Fraud scoring disabled: cannot load %s (%r)", model_path, exc)
+            return None
+        expected = getattr(model, 'n_features_in_', len(FEATURES))
+        if not hasattr(model, 'predict_proba') or expected != len(FEATURES):
+            logger.warning("Fraud scoring disabled: %s does not take the %d transfer features",
+                           model_path, len(FEATURES))
+            return None
+        return model
+
+    @property
+    def enabled(self):
+        return self.batcher is not None
+
+    def score(self, features):
+        """Fraud probability for one feature row, or None if unavailable in time.
+
+        Waits at most `timeout`, so the latency added to a transfer is bounded
+        even if the scoring thread falls behind; late scores fail open.
+        """
+        if not self.enabled:
+            return None
+        started = time.perf_counter()
+        try:
+            return self.batcher.submit(features).result(timeout=self.timeout)
+        except FutureTimeout:
+            self.timeouts += 1
+            return None
+        except Exception:
+            logger.exception("Fraud scoring failed")
+            return None
+        finally:
+            self.latencies.append(time.perf_counter() - started)
+
+    def latency_percentiles(self, percentiles=(50, 95, 99)):
+        """Recent scoring latency in milliseconds, keyed by percentile."""
+        samples = sorted(self.latencies)
+        if not samples:
+            return {}
+        return {p: samples[min(len(samples) - 1, int(len(samples) * p / 100))] * 1000
+                for p in percentiles}
+
+
+_scorer = None
+_scorer_lock = threading.Lock()
+
+
+def get_scorer():
+    """The process-wide scorer, created on first use (and again after a fork)."""
+    global _scorer
+    if _scorer is None or _scorer.pid != os.getpid():
+        with _scorer_lock:
+            if _scorer is None or _scorer.pid != os.getpid():
+                _scorer = FraudScorer(current_app.config.get('FRAUD_MODEL_PATH', MODEL_PATH))
+    return _scorer
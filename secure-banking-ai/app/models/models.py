@@ -25,7 +25,7 @@ class Login(db.Model):
 class Account(db.Model):
     __tablename__ = 'account'
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('login.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('login.id'), nullable=False, index=True)
     account_number = db.Column(db.String(20), unique=True, nullable=False)
     balance = db.Column(db.Float, default=0.0, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -38,6 +38,16 @@ class Account(db.Model):
 # ---------------- Transactions ----------------
 class Transaction(db.Model):
     __tablename__ = 'transactions'
+    __table_args__ = (
+        # per-type history lists (dashboard) and the filtered history page
+        db.Index('ix_transactions_user_type_date', 'user_id', 'txn_type', 'date'),
+        # unfiltered history page, keyset ordered by (date, id)
+        db.Index('ix_transactions_user_date', 'user_id', 'date'),
+        # per-account replays: feature rebuilds, statements, reconciliation
+        db.Index('ix_transactions_account_date', 'account_id', 'date'),
+        # a card's spend over the last 24h, and the ON DELETE SET NULL when a card goes
+        db.Index('ix_transactions_card_date', 'card_id', 'date'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('login.id'), nullable=False)
     account_id = db.Column(db.Integer, db.ForeignKey('account.id'), nullable=False)
@@ -45,6 +55,8 @@ class Transaction(db.Model):
     txn_type = db.Column(db.String(20), nullable=False)
     amount = db.Column(db.Float, nullable=False)
     counterparty = db.Column(db.String(120), nullable=True)
+    # the card charged, on card payments; ids are reused once a card is deleted
+    card_id = db.Column(db.Integer, db.ForeignKey('card.id', ondelete='SET NULL'), nullable=True)
     remarks = db.Column(db.String(255), nullable=True)
     date = db.Column(db.DateTime, default=datetime.utcnow)
 
@@ -52,7 +64,7 @@ class Transaction(db.Model):
 class Upi(db.Model):
     __tablename__ = 'upi'
     id = db.Column(db.Integer, primary_key=True)
-    account_id = db.Column(db.Integer, db.ForeignKey('account.id'), nullable=False)
+    account_id = db.Column(db.Integer, db.ForeignKey('account.id'), nullable=False, index=True)
     upi_id = db.Column(db.String(120), unique=True, nullable=False)
     verified = db.Column(db.Boolean, default=False)
 
@@ -60,7 +72,7 @@ class Upi(db.Model):
 class Card(db.Model):
     __tablename__ = 'card'
     id = db.Column(db.Integer, primary_key=True)
-    account_id = db.Column(db.Integer, db.ForeignKey('account.id'), nullable=False)
+    account_id = db.Column(db.Integer, db.ForeignKey('account.id'), nullable=False, index=True)
     card_number = db.Column(db.String(20), unique=True)
     card_type = db.Column(db.String(20), default='debit')
     expiry = db.Column(db.String(10))
@@ -68,13 +80,19 @@ class Card(db.Model):
     blocked = db.Column(db.Boolean, default=False)
     limit = db.Column(db.Float, default=5000.0)
     pin = db.Column(db.String(128))  # store hashed PIN
+    # wrong PINs since the last right one; the card is blocked at cards.MAX_PIN_ATTEMPTS
+    failed_pins = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
 
 # ---------------- Subscriptions ----------------
 class Subscription(db.Model):
     __tablename__ = 'subscription'
+    __table_args__ = (
+        # billing runner: due active subscriptions in next_billing_date order
+        db.Index('ix_subscription_due', 'active', 'next_billing_date'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('login.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('login.id'), nullable=False, index=True)
     name = db.Column(db.String(120), nullable=False)
     amount = db.Column(db.Float, nullable=False)
     frequency = db.Column(db.String(20), nullable=False)
@@ -83,4 +101,114 @@ class Subscription(db.Model):
     next_billing_date = db.Column(db.DateTime, nullable=True)
     last_billed_date = db.Column(db.DateTime, nullable=True)
 
-    
\ No newline at end of file
+    
+
+# ---------------- Recent Payees ----------------
+class RecentPayee(db.Model):
+    __tablename__ = 'recent_payee'
+    __table_args__ = (
+        # the transfer form's most recent payees of a user
+        db.Index('ix_recent_payee_user_paid', 'user_id', 'last_paid_at'),
+    )
+    user_id = db.Column(db.Integer, db.ForeignKey('login.id'), primary_key=True)
+    account_id = db.Column(db.Integer, db.ForeignKey('account.id'), primary_key=True)
+    # copied from the payee's account so the form can pay it without a lookup
+    payee_user_id = db.Column(db.Integer, nullable=False)
+    account_number = db.Column(db.String(20), nullable=False)
+    account_created_at = db.Column(db.DateTime, nullable=True)
+    label = db.Column(db.String(120), nullable=False)   # account number or UPI id last paid to
+    times_paid = db.Column(db.Integer, nullable=False, default=1)
+    last_paid_at = db.Column(db.DateTime, nullable=False)
+
+# ---------------- Fraud Features ----------------
+class AccountFeatures(db.Model):
+    __tablename__ = 'account_features'
+    account_id = db.Column(db.Integer, db.ForeignKey('account.id'), primary_key=True)
+    last_event_at = db.Column(db.DateTime, nullable=True)
+    txn_count = db.Column(db.Integer, default=0, nullable=False)
+    amount_mean = db.Column(db.Float, default=0.0, nullable=False)   # exponentially weighted
+    amount_var = db.Column(db.Float, default=0.0, nullable=False)
+    last_sent_at = db.Column(db.DateTime, nullable=True)
+    sent_velocity_1h = db.Column(db.Float, default=0.0, nullable=False)   # decayed transfer counts
+    sent_velocity_24h = db.Column(db.Float, default=0.0, nullable=False)
+    distinct_counterparties = db.Column(db.Integer, default=0, nullable=False)
+
+
+class AccountCounterparty(db.Model):
+    __tablename__ = 'account_counterparty'
+    account_id = db.Column(db.Integer, db.ForeignKey('account.id'), primary_key=True)
+    counterparty = db.Column(db.String(120), primary_key=True)
+
+
+# ---------------- Sessions ----------------
+class UserSession(db.Model):
+    __tablename__ = 'user_session'
+    sid = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)   # bumped on every write
+    data = db.Column(db.LargeBinary, nullable=False)   # msgpack-encoded session dict
+    expiry = db.Column(db.DateTime, nullable=False, index=True)
+
+
+# ---------------- Idempotency Keys ----------------
+class IdempotencyKey(db.Model):
+    __tablename__ = 'idempotency_key'
+    user_id = db.Column(db.Integer, db.ForeignKey('login.id'), primary_key=True)
+    key = db.Column(db.String(64), primary_key=True)
+    fingerprint = db.Column(db.String(32), nullable=False)   # hash of the endpoint and form fields
+    txn_id = db.Column(db.String(64), nullable=False)
+    message = db.Column(db.String(255), nullable=False)   # what the original request flashed
+    category = db.Column(db.String(20), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+# ---------------- Reconciliation ----------------
+class ReconciliationRun(db.Model):
+    __tablename__ = 'reconciliation_run'
+    id = db.Column(db.Integer, primary_key=True)
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    incremental = db.Column(db.Boolean, nullable=False, default=False)
+    watermark = db.Column(db.Integer, nullable=False, default=0)   # highest transactions.id covered
+    accounts_checked = db.Column(db.Integer, nullable=False, default=0)
+    accounts_drifted = db.Column(db.Integer, nullable=False, default=0)
+    total_drift = db.Column(db.Float, nullable=False, default=0.0)   # sum of |stored - ledger|
+    seconds = db.Column(db.Float, nullable=True)
+
+
+# ---------------- Spending Rollups ----------------
+class DailyRollup(db.Model):
+    """One row per account and UTC day with activity: amount and count of each transaction type."""
+    __tablename__ = 'daily_rollup'
+    account_id = db.Column(db.Integer, db.ForeignKey('account.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    deposit_total = db.Column(db.Float, nullable=False, default=0.0)
+    deposit_count = db.Column(db.Integer, nullable=False, default=0)
+    withdrawal_total = db.Column(db.Float, nullable=False, default=0.0)
+    withdrawal_count = db.Column(db.Integer, nullable=False, default=0)
+    transfer_sent_total = db.Column(db.Float, nullable=False, default=0.0)
+    transfer_sent_count = db.Column(db.Integer, nullable=False, default=0)
+    transfer_received_total = db.Column(db.Float, nullable=False, default=0.0)
+    transfer_received_count = db.Column(db.Integer, nullable=False, default=0)
+    subscription_total = db.Column(db.Float, nullable=False, default=0.0)
+    subscription_count = db.Column(db.Integer, nullable=False, default=0)
+    card_payment_total = db.Column(db.Float, nullable=False, default=0.0)
+    card_payment_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class CounterpartyRollup(db.Model):
+    """Amount and count per account, calendar month, counterparty and transaction type."""
+    __tablename__ = 'counterparty_rollup'
+    account_id = db.Column(db.Integer, db.ForeignKey('account.id'), primary_key=True)
+    month = db.Column(db.Date, primary_key=True)   # first day of the month
+    counterparty = db.Column(db.String(120), primary_key=True)
+    txn_type = db.Column(db.String(20), primary_key=True)
+    total = db.Column(db.Float, nullable=False, default=0.0)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+# ---------------- Balance Snapshots ----------------
+class BalanceSnapshot(db.Model):
+    __tablename__ = 'balance_snapshot'
+    account_id = db.Column(db.Integer, db.ForeignKey('account.id'), primary_key=True)
+    as_of = db.Column(db.DateTime, primary_key=True)   # includes every transaction dated before this
+    balance = db.Column(db.Float, nullable=False)
@@ -0,0 +1,56 @@
+import base64
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import tuple_
+
+Page = namedtuple('Page', ['items', 'next_cursor'])
+
+
+def encode_cursor(date, row_id):
+    raw = f"{date.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Return (date, id) for a cursor token, or None if it is missing or malformed."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        date_part, id_part = raw.rsplit('|', 1)
+        return datetime.fromisoformat(date_part), int(id_part)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def encode_id_cursor(row_id):
+    return base64.urlsafe_b64encode(str(row_id).encode()).decode().rstrip('=')
+
+
+def decode_id_cursor(token):
+    """Return the id for an id-only cursor token, or None if it is missing or malformed."""
+    if not token:
+        return None
+    try:
+        return int(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode())
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def keyset_page(query, date_col, id_col, cursor, page_size):
+    """Newest-first page of `query` ordered by (date, id), starting after `cursor`.
+
+    Fetches one extra row to decide whether an older page exists, so the cost
+    depends on the page size only, never on how much history sits behind it.
+    """
+    position = decode_cursor(cursor)
+    if position:
+        query = query.filter(tuple_(date_col, id_col) < tuple_(*position))
+
+    rows = query.order_by(date_col.desc(), id_col.desc()).limit(page_size + 1).all()
+    if len(rows) <= page_size:
+        return Page(rows, None)
+
+    rows = rows[:page_size]
+    last = rows[-1]
+    return Page(rows, encode_cursor(getattr(last, date_col.key), getattr(last, id_col.key)))
@@ -0,0 +1,95 @@
+import re
+from datetime import datetime
+from sqlalchemy import func, tuple_
+from .models.models import db, Login, Account, Transaction, Card, Upi, Subscription, RecentPayee, \
+    CounterpartyRollup, DailyRollup
+from .balances import LATEST as LATEST_SNAPSHOTS, LATEST_BEFORE as SNAPSHOTS_BEFORE
+from .cards import SPENT
+from .dashboard import ACTIVITY_TYPES, RECENT_TXNS
+from .recipients import BY_ACCOUNT_NUMBER, BY_UPI_ID
+
+# "SCAN transactions" is a full table scan; "SCAN t USING INDEX ..." and
+# "SEARCH t USING ..." are index driven and fine.
+FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+
+# Paged listings walk their driving table in order and stop at the LIMIT;
+# substring search cannot use a b-tree index at all.
+PAGED_SCANS = {'admin: user page': {'login'}, 'admin: user search': {'login'}}
+
+
+def _history_page(*criteria):
+    return Transaction.query.filter(Transaction.user_id == 1, *criteria) \
+        .order_by(Transaction.date.desc(), Transaction.id.desc()).limit(26)
+
+
+def route_queries():
+    """(name, query) for every query the routes issue, with sample parameters."""
+    from . import analytics
+    from .routes import admin_user_query
+
+    now = datetime.utcnow()
+    return [
+        ('signup: existing user', Login.query.filter(
+            (Login.username == 'alice') | (Login.email == 'alice@example.com'))),
+        ('login: user by username', Login.query.filter_by(username='alice')),
+        ('session user by id', Login.query.filter_by(id=1)),
+        ('primary account by user', Account.query.filter_by(user_id=1)),
+        ('dashboard: activity totals', db.session.query(
+            Transaction.txn_type, func.sum(Transaction.amount), func.count())
+            .filter(Transaction.user_id == 1, Transaction.txn_type.in_(ACTIVITY_TYPES))
+            .group_by(Transaction.txn_type)),
+        ('dashboard: recent deposits', Transaction.query.filter_by(user_id=1, txn_type='deposit')
+            .order_by(Transaction.date.desc()).limit(RECENT_TXNS)),
+        ('dashboard: subscriptions', Subscription.query.filter_by(user_id=1)),
+        ('dashboard: cards', Card.query.filter_by(account_id=1)),
+        ('dashboard: upis', Upi.query.filter_by(account_id=1)),
+        ('transactions: first page', _history_page()),
+        ('transactions: next page', _history_page(
+            tuple_(Transaction.date, Transaction.id) < tuple_(now, 1000))),
+        ('transactions: by type and range', _history_page(
+            Transaction.txn_type == 'deposit', Transaction.date >= now, Transaction.date < now)),
+        ('transfer: recipient by account number', BY_ACCOUNT_NUMBER.params(b_key='123456789012')),
+        ('transfer: recipient by upi', BY_UPI_ID.params(b_key='alice@bank')),
+        ('transfer: recent payees', RecentPayee.query.filter_by(user_id=1)
+            .order_by(RecentPayee.last_paid_at.desc()).limit(8)),
+        ('transfer: payee by id', RecentPayee.query.filter_by(user_id=1, account_id=2)),
+        ('cards: card by id', Card.query.filter_by(id=1)),
+        ('cards: authorize by card number', Card.query.filter_by(card_number='4000000000000002')),
+        ('cards: spend window seed', Transaction.query.filter(
+            Transaction.card_id == 1, Transaction.date > now).order_by(Transaction.date)),
+        ('cards: spend in the approval', SPENT.params(b_id=1, b_since=now)),
+        ('subscription: by id', Subscription.query.filter_by(id=1)),
+        ('analytics: daily rollup range', DailyRollup.query.filter(
+            DailyRollup.account_id == 1, DailyRollup.day >= now.date(), DailyRollup.day <= now.date())),
+        ('balances: latest snapshots', LATEST_SNAPSHOTS.params(b_ids=[1, 2], b_when=now)),
+        ('balances: snapshots before a retake', SNAPSHOTS_BEFORE.params(b_ids=[1, 2], b_when=now)),
+        ('balances: transactions since snapshot', Transaction.query.filter(
+            Transaction.account_id == 1, Transaction.date >= now, Transaction.date < now)),
+        ('analytics: top counterparties', CounterpartyRollup.query.filter(
+            CounterpartyRollup.account_id == 1, CounterpartyRollup.month >= now.date(),
+            CounterpartyRollup.txn_type.in_(analytics.DIRECTIONS['out']))),
+        ('admin: user page', admin_user_query().limit(50)),
+        ('admin: user search', admin_user_query('alice').limit(50)),
+    ]
+
+
+def explain(connection, query):
+    # ORM queries and the prebuilt Core statements alike; IN lists expanded to one ? per value
+    compiled = getattr(query, 'statement', query).compile(dialect=connection.dialect)
+    expanded = compiled.construct_expanded_state()
+    params = tuple(expanded.parameters[name] for name in expanded.positiontup)
+    rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + expanded.statement, params).all()
+    return [row[-1] for row in rows]
+
+
+def audit_query_plans():
+    """Return [(name, plan, full_scans)] for each route query."""
+    results = []
+    with db.engine.connect() as connection:
+        for name, query in route_queries():
+            plan = explain(connection, query)
+            allowed = PAGED_SCANS.get(name, set())
+            scans = [m.group(1) for m in map(FULL_SCAN.match, plan)
+                     if m and m.group(1) not in allowed]
+            results.append((name, plan, scans))
+    return results
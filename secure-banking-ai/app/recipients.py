@@ -0,0 +1,143 @@
+from collections import namedtuple
+from sqlalchemy import bindparam, delete, event, func, insert, inspect, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import object_session
+from .cache import TTLCache
+from .models.models import db, Account, RecentPayee, Transaction, Upi
+from .replica import RoutingSession
+
+# Transfer recipients.
+#
+# resolve() maps an account number or a UPI id to the recipient account in
+# one indexed query and caches the answer per process (never a miss: a
+# recipient created later must be found). A Recipient carries what the
+# ledger and the fraud features read from an Account, so it is passed to
+# them in its place.
+#
+# Flushed updates and deletes of Account and Upi rows drop the keys those
+# rows had once the transaction commits. Changes made by another process
+# show up after RECIPIENT_CACHE_TTL seconds; until then a transfer to an
+# account deleted there fails in the ledger's credit.
+#
+# Every transfer also upserts the (sender, recipient account) pair into
+# recent_payee with the same fields, so the transfer form lists recent
+# payees and pays one without resolving it again.
+
+CACHE_SIZE = 20000
+CACHE_TTL_SECONDS = 300
+RECENT_PAYEES = 8
+
+Recipient = namedtuple('Recipient', ['id', 'user_id', 'account_number', 'created_at'])
+
+_accounts, _upis, _payees = Account.__table__, Upi.__table__, RecentPayee.__table__
+_recipient = (_accounts.c.id, _accounts.c.user_id, _accounts.c.account_number, _accounts.c.created_at)
+BY_ACCOUNT_NUMBER = select(*_recipient).where(_accounts.c.account_number == bindparam('b_key'))
+BY_UPI_ID = select(*_recipient).join_from(_upis, _accounts, _upis.c.account_id == _accounts.c.id) \
+    .where(_upis.c.upi_id == bindparam('b_key'))
+LOOKUPS = {'account_number': BY_ACCOUNT_NUMBER, 'upi_id': BY_UPI_ID}
+UPIS_OF_ACCOUNT = select(_upis.c.upi_id).where(_upis.c.account_id == bindparam('b_id'))
+
+_remember = sqlite_insert(_payees)
+REMEMBER = _remember.on_conflict_do_update(
+    index_elements=['user_id', 'account_id'],
+    set_={'label': _remember.excluded.label, 'last_paid_at': _remember.excluded.last_paid_at,
+          'times_paid': _payees.c.times_paid + 1})
+
+recipient_cache = TTLCache(CACHE_SIZE, CACHE_TTL_SECONDS)
+
+
+def resolve(kind, key):
+    """The Recipient for `key`, an 'account_number' or a 'upi_id' as `kind` says; None if unknown."""
+    recipient = recipient_cache.get((kind, key))
+    if recipient is None:
+        row = db.session.execute(LOOKUPS[kind], {'b_key': key}).first()
+        if row is None:
+            return None
+        recipient = Recipient(*row)
+        recipient_cache.set((kind, key), recipient)
+    return recipient
+
+
+def forget(kind, key):
+    recipient_cache.pop((kind, key))
+
+
+# ---------------- Invalidation ----------------
+def _values(target, attribute):
+    history = inspect(target).attrs[attribute].history
+    return {value for value in (*history.deleted, *history.unchanged, *history.added) if value}
+
+
+def _stale(target, keys):
+    object_session(target).info.setdefault('stale_recipients', set()).update(keys)
+
+
+@event.listens_for(Account, 'after_update')
+@event.listens_for(Account, 'after_delete')
+def _account_changed(mapper, connection, target):
+    keys = {('account_number', number) for number in _values(target, 'account_number')}
+    # its UPI ids resolve to it as well
+    upi_ids = connection.execute(UPIS_OF_ACCOUNT, {'b_id': target.id}).scalars()
+    keys.update(('upi_id', upi_id) for upi_id in upi_ids)
+    _stale(target, keys)
+
+
+@event.listens_for(Upi, 'after_update')
+@event.listens_for(Upi, 'after_delete')
+def _upi_changed(mapper, connection, target):
+    _stale(target, {('upi_id', upi_id) for upi_id in _values(target, 'upi_id')})
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _drop_committed(session):
+    for key in session.info.pop('stale_recipients', ()):
+        recipient_cache.pop(key)
+
+
+@event.listens_for(RoutingSession, 'after_soft_rollback')
+def _forget_rolled_back(session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop('stale_recipients', None)
+
+
+# ---------------- Recent payees ----------------
+def remember_payee(user_id, recipient, label, when):
+    """Upsert `recipient` into the sender's recent payees, inside the transfer's transaction."""
+    db.session.execute(REMEMBER, {
+        'user_id': user_id, 'account_id': recipient.id, 'payee_user_id': recipient.user_id,
+        'account_number': recipient.account_number, 'account_created_at': recipient.created_at,
+        'label': label, 'times_paid': 1, 'last_paid_at': when})
+
+
+def recent_payees(user_id, limit=RECENT_PAYEES):
+    return db.session.execute(select(RecentPayee).where(RecentPayee.user_id == user_id)
+                              .order_by(RecentPayee.last_paid_at.desc()).limit(limit)).scalars().all()
+
+
+def payee_recipient(user_id, account_id):
+    """(Recipient, label) for one of the user's recent payees, or (None, None)."""
+    payee = db.session.get(RecentPayee, (user_id, account_id))
+    if payee is None:
+        return None, None
+    return Recipient(payee.account_id, payee.payee_user_id, payee.account_number,
+                     payee.account_created_at), payee.label
+
+
+def rebuild_payees():
+    """Rebuild recent_payee from transfer history; returns the number of payees."""
+    db.session.execute(delete(RecentPayee))
+    history = select(Transaction.user_id, Account.id, Account.user_id, Account.account_number,
+                     Account.created_at, Account.account_number, func.count(), func.max(Transaction.date)) \
+        .join(Account, Account.account_number == Transaction.counterparty) \
+        .where(Transaction.txn_type == 'transfer_sent') \
+        .group_by(Transaction.user_id, Account.id)
+    db.session.execute(insert(RecentPayee).from_select(
+        ['user_id', 'account_id', 'payee_user_id', 'account_number', 'account_created_at', 'label',
+         'times_paid', 'last_paid_at'], history))
+    db.session.commit()
+    return db.session.execute(select(func.count()).select_from(RecentPayee)).scalar()
+
+
+def init_recipients(app):
+    recipient_cache.maxsize = app.config.setdefault('RECIPIENT_CACHE_SIZE', CACHE_SIZE)
+    recipient_cache.ttl = app.config.setdefault('RECIPIENT_CACHE_TTL', CACHE_TTL_SECONDS)
@@ -0,0 +1,152 @@
+import csv
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, select
+from .models.models import db, Account, ReconciliationRun, Transaction
+from .ledger import CREDIT_TYPES, DEBIT_TYPES
+
+# Balance reconciliation: every account's stored balance against the signed
+# sum of its transactions.
+#
+# Accounts are checked in id ranges, one range per worker task. A task reads
+# the range's balances and then streams its transactions in chunks inside a
+# single read transaction, so both come from the same snapshot even while
+# money is moving. Amounts are summed per account with np.bincount in whole
+# cents, which makes the comparison exact: any non-zero difference is drift.
+#
+# Each run records the highest transactions.id it covered. An incremental
+# run only re-checks accounts with transactions above the last watermark.
+
+RANGE_SIZE = 20000   # accounts per task
+FETCH_CHUNK = 50000   # transaction rows per fetch
+IN_CHUNK = 500   # account ids per IN (...) in incremental runs
+SIGNS = {**{txn_type: 1 for txn_type in CREDIT_TYPES}, **{txn_type: -1 for txn_type in DEBIT_TYPES}}
+
+Drift = namedtuple('Drift', ['account_id', 'stored', 'ledger', 'drift', 'unknown_rows'])
+
+
+def _cents(values):
+    return np.rint(np.asarray(values, dtype=np.float64) * 100)
+
+
+def _check(cursor, where, params):
+    """(accounts checked, [Drift]) for the accounts selected by `where`.
+
+    `where` is a condition on "{column}", filled in with the account id column of each table.
+    """
+    cursor.execute(f"SELECT id, balance FROM account WHERE {where.format(column='id')} ORDER BY id", params)
+    accounts = cursor.fetchall()
+    if not accounts:
+        return 0, []
+    ids = np.fromiter((row[0] for row in accounts), dtype=np.int64, count=len(accounts))
+    stored = _cents([row[1] for row in accounts])
+    ledger = np.zeros(len(ids))
+    unknown = np.zeros(len(ids), dtype=np.int64)
+
+    cursor.execute(f"SELECT account_id, txn_type, amount FROM transactions "
+                   f"WHERE {where.format(column='account_id')}", params)
+    while True:
+        rows = cursor.fetchmany(FETCH_CHUNK)
+        if not rows:
+            break
+        frame = pd.DataFrame.from_records(rows, columns=['account_id', 'txn_type', 'amount'])
+        account_ids = frame['account_id'].to_numpy()
+        positions = np.minimum(np.searchsorted(ids, account_ids), len(ids) - 1)
+        # rows of a missing account (impossible with foreign keys on) are left out
+        signs = np.where(ids[positions] == account_ids,
+                         frame['txn_type'].map(SIGNS).to_numpy(dtype=np.float64), 0.0)
+        known = ~np.isnan(signs)
+        ledger += np.bincount(positions[known], weights=_cents(frame['amount'].to_numpy()[known]) * signs[known],
+                              minlength=len(ids))
+        unknown += np.bincount(positions[~known], minlength=len(ids))
+
+    drifted = np.flatnonzero((stored != ledger) | (unknown > 0))
+    return len(ids), [Drift(int(ids[i]), stored[i] / 100, ledger[i] / 100, (stored[i] - ledger[i]) / 100,
+                            int(unknown[i])) for i in drifted]
+
+
+def check_accounts(lo=None, hi=None, account_ids=None):
+    """(accounts checked, [Drift]) for ids in [lo, hi) or the given ids, from one snapshot."""
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute('BEGIN')   # balances and transactions from the same snapshot
+        if account_ids is None:
+            return _check(cursor, '{column} >= ? AND {column} < ?', (lo, hi))
+        checked, drifts = 0, []
+        for first in range(0, len(account_ids), IN_CHUNK):
+            chunk = account_ids[first:first + IN_CHUNK]
+            count, found = _check(cursor, f"{{column}} IN ({', '.join('?' * len(chunk))})", chunk)
+            checked += count
+            drifts += found
+        return checked, drifts
+    finally:
+        connection.rollback()
+        connection.close()
+
+
+def _check_in_worker(uri, lo, hi, account_ids):
+    from . import create_app
+
+    with create_app({'SQLALCHEMY_DATABASE_URI': uri}).app_context():
+        return check_accounts(lo, hi, account_ids)
+
+
+def _tasks(incremental, watermark, range_size):
+    """(lo, hi, account_ids) per task; the account ids only in incremental runs."""
+    if incremental:
+        last = db.session.execute(select(ReconciliationRun.watermark)
+                                  .order_by(ReconciliationRun.id.desc()).limit(1)).scalar() or 0
+        touched = db.session.execute(select(Transaction.account_id).distinct()
+                                     .where(Transaction.id > last, Transaction.id <= watermark)
+                                     .order_by(Transaction.account_id)).scalars().all()
+        return [(None, None, touched[first:first + range_size])
+                for first in range(0, len(touched), range_size)]
+    lo, hi = db.session.execute(select(func.min(Account.id), func.max(Account.id))).one()
+    if lo is None:
+        return []
+    return [(first, first + range_size, None) for first in range(lo, hi + 1, range_size)]
+
+
+def reconcile(incremental=False, workers=1, range_size=RANGE_SIZE):
+    """Check balances against transactions and record the run.
+
+    Returns (ReconciliationRun, [Drift] ordered by account id).
+    """
+    started = time.perf_counter()
+    run = ReconciliationRun(started_at=datetime.utcnow(), incremental=incremental)
+    # transactions committed after this are left for the next run
+    run.watermark = db.session.execute(select(func.max(Transaction.id))).scalar() or 0
+    tasks = _tasks(incremental, run.watermark, range_size)
+
+    if workers <= 1 or len(tasks) <= 1:
+        results = [check_accounts(*task) for task in tasks]
+    else:
+        uri = db.engine.url.render_as_string(hide_password=False)
+        db.session.remove()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_check_in_worker, uri, *task) for task in tasks]
+            results = [future.result() for future in futures]
+
+    drifts = sorted((drift for _, found in results for drift in found), key=lambda drift: drift.account_id)
+    run.accounts_checked = sum(checked for checked, _ in results)
+    run.accounts_drifted = len(drifts)
+    run.total_drift = round(sum(abs(drift.drift) for drift in drifts), 2)
+    run.finished_at = datetime.utcnow()
+    run.seconds = time.perf_counter() - started
+    db.session.add(run)
+    db.session.commit()
+    return run, drifts
+
+
+def write_drift_report(path, drifts):
+    with open(path, 'w', encoding='utf-8', newline='') as handle:
+        writer = csv.writer(handle)
+        writer.writerow(Drift._fields)
+        for drift in drifts:
+            writer.writerow([drift.account_id, f"{drift.stored:.2f}", f"{drift.ledger:.2f}",
+                             f"{drift.drift:.2f}", drift.unknown_rows])
@@ -0,0 +1,164 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from functools import wraps
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Read replica routing.
+#
+# With REPLICA_DATABASE_URI set, views wrapped in @read_only send their
+# SELECTs to the 'replica' bind while everything else (writes, flushes, and
+# every request outside those views) stays on the primary. The local replica
+# is a copy of the primary file refreshed with SQLite's online backup every
+# REPLICA_REFRESH_SECONDS, stamped with the time the copy started in its
+# user_version header field.
+#
+# Read-your-writes: a request that writes stores its time in the user's
+# session (see last_write_at), and that user's read-only views keep using the
+# primary until the replica holds a copy started after that write. Other
+# users' writes (an incoming transfer, say) show up at the next refresh.
+
+REPLICA_BIND = 'replica'
+REFRESH_SECONDS = 30
+MARKER_CACHE_SECONDS = 1.0
+SESSION_KEY = 'wrote_at'
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that reads from the replica inside @read_only views."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_request_context() and g.get('read_replica') \
+                and clause is not None and clause.is_select:
+            return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_only(view):
+    """Serve GET requests of `view` from the replica when it has caught up with the user."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        replica = current_app.extensions.get('replica')
+        if replica and request.method in ('GET', 'HEAD') \
+                and replica.synced_at() > last_write_at():
+            g.read_replica = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def refresh_replica(primary_path, replica_path):
+    """Copy the primary database over the replica file; returns the copy's timestamp."""
+    # anything committed after this moment may be missing from the copy
+    started = int(time.time())
+    source = sqlite3.connect(primary_path)
+    try:
+        target = sqlite3.connect(replica_path, timeout=30)
+        try:
+            # one step: a consistent snapshot of the primary, and readers of
+            # the replica keep their own snapshot until it is committed
+            source.backup(target)
+            target.execute(f"PRAGMA user_version={started}")
+        finally:
+            target.close()
+    finally:
+        source.close()
+    return started
+
+
+class Replica:
+
+    def __init__(self, app, refresh_interval=REFRESH_SECONDS):
+        self.app = app
+        self.refresh_interval = refresh_interval
+        self._marker = (float('-inf'), 0)   # (checked at, user_version)
+        self._refresher_pid = None
+        self._refresher_lock = threading.Lock()
+
+    def _engines(self):
+        from . import db
+
+        return db.engines[None], db.engines[REPLICA_BIND]
+
+    def synced_at(self):
+        """Start time (epoch seconds) of the copy the replica holds, re-read at most once a second."""
+        checked_at, marker = self._marker
+        now = time.monotonic()
+        if now - checked_at >= MARKER_CACHE_SECONDS:
+            with self._engines()[1].connect() as connection:
+                marker = connection.exec_driver_sql('PRAGMA user_version').scalar() or 0
+            self._marker = (now, marker)
+        return marker
+
+    def refresh(self, force=False):
+        """Refresh the copy if it is older than the interval (or `force`); returns True if it did."""
+        primary, replica = self._engines()
+        if not force and time.time() - self.synced_at() < self.refresh_interval:
+            return False   # another worker has just refreshed it
+        synced = refresh_replica(primary.url.database, replica.url.database)
+        self._marker = (time.monotonic(), synced)
+        return True
+
+    # ---------------- Periodic refresh ----------------
+    def start_refresher(self):
+        # one refresher per process, started lazily so forked workers get their
+        # own; they share the replica's timestamp, so only one of them copies
+        if self._refresher_pid == os.getpid() or not self.refresh_interval:
+            return
+        with self._refresher_lock:
+            if self._refresher_pid != os.getpid():
+                self._refresher_pid = os.getpid()
+                threading.Thread(target=self._refresh_forever, name='replica-refresher',
+                                 daemon=True).start()
+
+    def _refresh_forever(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    self.refresh()
+            except Exception:
+                logger.exception("Replica refresh failed")
+            time.sleep(self.refresh_interval)
+
+
+def _note_write(*args):
+    if has_request_context():
+        g.db_wrote = True
+
+
+def _note_statement(orm_execute_state):
+    if not orm_execute_state.is_select:
+        _note_write()
+
+
+def _remember_write(response):
+    if g.pop('db_wrote', False) and 'user_id' in session:
+        session[SESSION_KEY] = time.time()
+    return response
+
+
+def last_write_at():
+    """Epoch time of the signed-in user's last writing request, in any worker; 0 if none."""
+    return session.get(SESSION_KEY, 0)
+
+
+def init_replica(app):
+    """Add the replica bind and the request hooks; call before db.init_app."""
+    # write tracking also backs the dashboard cache, so it is on with or without a replica
+    for name, fn in (('after_flush', _note_write), ('do_orm_execute', _note_statement)):
+        if not event.contains(RoutingSession, name, fn):
+            event.listen(RoutingSession, name, fn)
+    app.after_request(_remember_write)
+
+    uri = app.config.setdefault('REPLICA_DATABASE_URI', None)
+    if not uri:
+        return
+    app.config['SQLALCHEMY_BINDS'] = {**app.config.get('SQLALCHEMY_BINDS', {}), REPLICA_BIND: uri}
+    replica = app.extensions['replica'] = Replica(
+        app, app.config.get('REPLICA_REFRESH_SECONDS', REFRESH_SECONDS))
+    app.before_request(replica.start_refresher)
@@ -0,0 +1,121 @@
+from datetime import timezone
+from sqlalchemy import case, delete, func, insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from .models.models import db, Account, CounterpartyRollup, DailyRollup, Transaction
+
+# Spending rollups behind the analytics endpoints (app/analytics.py).
+#
+# daily_rollup has one row per account and UTC day with activity, holding the
+# amount and count of every transaction type in its own columns. A year of
+# an account's history is therefore at most 366 rows, however many
+# transactions it had. counterparty_rollup keeps amount and count per
+# account, month, counterparty and type, for the top-counterparty lists.
+#
+# ledger.record() adds every write to both tables inside the write's own
+# transaction, with additive upserts. rebuild_rollups() recomputes them from
+# history one account-id range per transaction, so it can run while the app
+# is taking writes.
+
+REBUILD_CHUNK = 1000
+
+_daily, _counterparties, _txns = DailyRollup.__table__, CounterpartyRollup.__table__, Transaction.__table__
+# the transaction types that have a pair of daily columns
+TYPES = tuple(column.name[:-len('_total')] for column in _daily.c if column.name.endswith('_total'))
+DAILY_COLUMNS = tuple(f'{txn_type}_{measure}' for txn_type in TYPES for measure in ('total', 'count'))
+
+_add_daily = sqlite_insert(_daily)
+ADD_DAILY = _add_daily.on_conflict_do_update(
+    index_elements=['account_id', 'day'],
+    set_={column: _daily.c[column] + _add_daily.excluded[column] for column in DAILY_COLUMNS})
+_add_counterparty = sqlite_insert(_counterparties)
+ADD_COUNTERPARTY = _add_counterparty.on_conflict_do_update(
+    index_elements=['account_id', 'month', 'counterparty', 'txn_type'],
+    set_={column: _counterparties.c[column] + _add_counterparty.excluded[column]
+          for column in ('total', 'count')})
+
+
+def _utc_day(when):
+    if when.tzinfo is not None:
+        when = when.astimezone(timezone.utc)
+    return when.date()
+
+
+def update_rollups(rows):
+    """Add newly recorded Transaction rows (dicts) to the rollups, in the caller's transaction."""
+    days, counterparties = {}, {}
+    for row in rows:
+        day = _utc_day(row['date'])
+        totals = days.get((row['account_id'], day))
+        if totals is None:
+            totals = days[(row['account_id'], day)] = {'account_id': row['account_id'], 'day': day,
+                                                       **dict.fromkeys(DAILY_COLUMNS, 0)}
+        totals[f"{row['txn_type']}_total"] += row['amount']
+        totals[f"{row['txn_type']}_count"] += 1
+        if row.get('counterparty'):
+            key = (row['account_id'], day.replace(day=1), row['counterparty'], row['txn_type'])
+            total, count = counterparties.get(key, (0.0, 0))
+            counterparties[key] = (total + row['amount'], count + 1)
+
+    if days:
+        db.session.execute(ADD_DAILY, list(days.values()))
+    if counterparties:
+        db.session.execute(ADD_COUNTERPARTY, [
+            {'account_id': account_id, 'month': month, 'counterparty': counterparty, 'txn_type': txn_type,
+             'total': total, 'count': count}
+            for (account_id, month, counterparty, txn_type), (total, count) in counterparties.items()])
+
+
+# ---------------- Backfill ----------------
+def _in_range(column, after, last):
+    return (column > after) & (column <= last)
+
+
+def _daily_history(after, last):
+    day = func.date(_txns.c.date)
+    sums = []
+    for txn_type in TYPES:
+        is_type = _txns.c.txn_type == txn_type
+        sums += [func.sum(case((is_type, _txns.c.amount), else_=0.0)), func.sum(case((is_type, 1), else_=0))]
+    return select(_txns.c.account_id, day, *sums) \
+        .where(_in_range(_txns.c.account_id, after, last)) \
+        .group_by(_txns.c.account_id, day)
+
+
+def _counterparty_history(after, last):
+    month = func.date(_txns.c.date, 'start of month')
+    return select(_txns.c.account_id, month, _txns.c.counterparty, _txns.c.txn_type,
+                  func.sum(_txns.c.amount), func.count()) \
+        .where(_in_range(_txns.c.account_id, after, last), _txns.c.counterparty.is_not(None)) \
+        .group_by(_txns.c.account_id, month, _txns.c.counterparty, _txns.c.txn_type)
+
+
+def rebuild_rollups(chunk_size=REBUILD_CHUNK):
+    """Recompute both rollups from Transaction history; returns the number of accounts.
+
+    Each range of `chunk_size` account ids is deleted and re-aggregated in one
+    transaction. Under SQLite's single write lock, a transfer committed
+    meanwhile is either already in the aggregate or added after it, never both.
+    """
+    rebuilt, last_id = 0, 0
+    while True:
+        ids = db.session.execute(select(Account.id).where(Account.id > last_id)
+                                 .order_by(Account.id).limit(chunk_size)).scalars().all()
+        if not ids:
+            break
+        db.session.execute(delete(_daily).where(_in_range(_daily.c.account_id, last_id, ids[-1])))
+        db.session.execute(delete(_counterparties)
+                           .where(_in_range(_counterparties.c.account_id, last_id, ids[-1])))
+        db.session.execute(insert(_daily).from_select(['account_id', 'day', *DAILY_COLUMNS],
+                                                      _daily_history(last_id, ids[-1])))
+        db.session.execute(insert(_counterparties).from_select(
+            ['account_id', 'month', 'counterparty', 'txn_type', 'total', 'count'],
+            _counterparty_history(last_id, ids[-1])))
+        db.session.commit()
+        rebuilt += len(ids)
+        last_id = ids[-1]
+
+    # rows of accounts deleted past the last one
+    db.session.execute(delete(_daily).where(_daily.c.account_id > last_id))
+    db.session.execute(delete(_counterparties).where(_counterparties.c.account_id > last_id))
+    db.session.commit()
+    return rebuilt
@@ -1,11 +1,94 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
-from werkzeug.security import generate_password_hash, check_password_hash
-from .models.models import db, Login, Account, Transaction, Card, Upi, Subscription
-from datetime import datetime, timezone, timedelta
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, current_app, \
+    Response, abort, stream_with_context
+from .models.models import db, Login, Account, AccountFeatures, Transaction, Card, Upi, Subscription
+from .pagination import keyset_page
+from . import ledger
+from .hashing import hash_secret, verify_and_update
+from .billing import next_billing_date
+from .cards import authorize, card_index, valid_api_key
+from .dashboard import NO_ACTIVITY, get_dashboard, invalidate_dashboard
+from .recipients import forget, payee_recipient, recent_payees, resolve
+from .idempotency import DuplicateRequest, claim, new_key, replay, request_key
+from .replica import read_only
+from .statements import WRITERS, statement_filename, stream_statement
+from .ml.scoring import FRAUD_THRESHOLD, get_scorer, transfer_features
+from datetime import datetime, timedelta
+from sqlalchemy import func, select
+import csv
+import io
+import json
+import math
 import uuid
 
 main = Blueprint('main', __name__)
 
+TRANSACTIONS_PAGE_SIZE = 25
+TRANSACTION_TYPES = ('deposit', 'withdrawal', 'transfer_sent', 'transfer_received', 'subscription',
+                     'card_payment')
+ADMIN_PAGE_SIZE = 50
+ADMIN_SORT_COLUMNS = ('id', 'fullname', 'email', 'username', 'balance', 'num_cards', 'num_subscriptions')
+
+
+def _parse_day(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d') if value else None
+    except ValueError:
+        return None
+
+
+def _admin_search_filter(search):
+    return (Login.fullname.icontains(search, autoescape=True) |
+            Login.username.icontains(search, autoescape=True) |
+            Login.email.icontains(search, autoescape=True) |
+            Login.id.in_(select(Account.user_id).where(Account.account_number == search)))
+
+
+def admin_user_query(search='', sort='id', descending=False):
+    """Admin user table as one query.
+
+    The primary account, card count and subscription count are correlated
+    subqueries, so SQLite only evaluates them for the rows of the requested
+    page instead of lazy-loading three relationships per user.
+    """
+    primary_account_id = select(func.min(Account.id)) \
+        .where(Account.user_id == Login.id).correlate(Login).scalar_subquery()
+    num_cards = select(func.count(Card.id)) \
+        .where(Card.account_id == Account.id).correlate(Account).scalar_subquery()
+    num_subscriptions = select(func.count(Subscription.id)) \
+        .where(Subscription.user_id == Login.id).correlate(Login).scalar_subquery()
+
+    columns = {
+        'id': Login.id,
+        'fullname': Login.fullname,
+        'email': Login.email,
+        'username': Login.username,
+        'balance': func.coalesce(Account.balance, 0.0).label('balance'),
+        'num_cards': num_cards.label('num_cards'),
+        'num_subscriptions': num_subscriptions.label('num_subscriptions'),
+    }
+    query = db.session.query(
+        Login.id, Login.fullname, Login.email, Login.username,
+        func.coalesce(Login.phone, 'N/A').label('phone'),
+        func.coalesce(Account.account_number, 'N/A').label('account_number'),
+        columns['balance'], columns['num_cards'], columns['num_subscriptions'],
+        Login.is_admin,
+    ).outerjoin(Account, Account.id == primary_account_id)
+
+    if search:
+        query = query.filter(_admin_search_filter(search))
+
+    order = columns.get(sort, Login.id)
+    if descending:
+        return query.order_by(order.desc(), Login.id.desc())
+    return query.order_by(order, Login.id)
+
+
+def admin_user_count(search=''):
+    query = db.session.query(func.count(Login.id))
+    if search:
+        query = query.filter(_admin_search_filter(search))
+    return query.scalar()
+
 # ---------------- Home ----------------
 @main.route('/')
 def index_view():
@@ -31,7 +114,7 @@ def signup_view():
             flash('Username or email already taken.', 'danger')
             return redirect(url_for('main.signup_view'))
 
-        hashed_password = generate_password_hash(password)
+        hashed_password = hash_secret(password)
         new_user = Login(fullname=fullname, email=email, username=username,
                          phone=phone, password=hashed_password)
         db.session.add(new_user)
@@ -61,7 +144,12 @@ def login_view():
         username=request.form.get('username')
         password=request.form.get('password')
         user = Login.query.filter_by(username=username).first()
-        if user and check_password_hash(user.password,password):
+        valid, new_hash = verify_and_update(user.password, password) if user else (False, None)
+        if valid:
+            if new_hash:
+                # legacy or weaker hash: upgrade it now that we have the password
+                user.password = new_hash
+                db.session.commit()
             session['user_id']=user.id
             session['username']=user.username
             session['is_admin']=user.is_admin
@@ -82,32 +170,31 @@ def logout_view():
 
 # ---------------- Dashboard ----------------
 @main.route('/dashboard')
+@read_only
 def dashboard_view():
     if 'user_id' not in session:
         flash('Please login first.', 'warning')
         return redirect(url_for('main.login_view'))
     
-    user = Login.query.get(session['user_id'])
-    account = Account.query.filter_by(user_id=user.id).first()
-    balance = account.balance if account else 0.0
+    summary = get_dashboard(session['user_id'])   # see app/dashboard.py
+    if summary is None:
+        session.clear()
+        flash('Please login first.', 'warning')
+        return redirect(url_for('main.login_view'))
+    user, account = summary.user, summary.account
 
     if user.is_admin:
-        all_users = Login.query.all()
-        user_details = []
-        for u in all_users:
-            primary_account = u.accounts[0] if u.accounts else None
-            user_details.append({
-                "id": u.id,
-                "fullname": u.fullname,
-                "email": u.email,
-                "username": u.username,
-                "phone": u.phone or "N/A",
-                "account_number": primary_account.account_number if primary_account else "N/A",
-                "balance": primary_account.balance if primary_account else 0.0,
-                "num_cards": len(primary_account.cards) if primary_account else 0,
-                "num_subscriptions": len(u.subscriptions),
-                "is_admin": u.is_admin
-            })
+        search = request.args.get('q', '').strip()
+        sort = request.args.get('sort', 'id')
+        if sort not in ADMIN_SORT_COLUMNS:
+            sort = 'id'
+        descending = request.args.get('dir') == 'desc'
+        total = admin_user_count(search)
+        pages = max(math.ceil(total / ADMIN_PAGE_SIZE), 1)
+        page = min(max(request.args.get('page', 1, type=int), 1), pages)
+
+        user_details = admin_user_query(search, sort, descending) \
+            .limit(ADMIN_PAGE_SIZE).offset((page - 1) * ADMIN_PAGE_SIZE).all()
 
         # Pass placeholder values for admin to avoid UndefinedError in template
         return render_template(
@@ -115,37 +202,34 @@ def dashboard_view():
             username=user.fullname.upper(),
             is_admin=True,
             all_users=user_details,
+            admin_page={'q': search, 'sort': sort, 'dir': 'desc' if descending else 'asc',
+                        'page': page, 'pages': pages, 'total': total},
             balance=0.0,             # placeholder
-            deposits=[],             # placeholder
-            withdrawals=[],          # placeholder
+            deposits=NO_ACTIVITY,    # placeholder
+            withdrawals=NO_ACTIVITY, # placeholder
             subscriptions=[],        # placeholder
             cards=[],                # placeholder
             upis=[]                  # placeholder
         )
 
     # Regular user logic
-    deposits = Transaction.query.filter_by(user_id=user.id, txn_type='deposit').all()
-    withdrawals = Transaction.query.filter_by(user_id=user.id, txn_type='withdrawal').all()
-    subscriptions = Subscription.query.filter_by(user_id=user.id).all()
-    cards = Card.query.filter_by(account_id=account.id).all() if account else []
-    upis = Upi.query.filter_by(account_id=account.id).all() if account else []
-
     return render_template(
         'dashboard.html',
         username=user.fullname.upper(),
         is_admin=False,
         user=user,
         account=account,
-        deposits=deposits,
-        withdrawals=withdrawals,
-        balance=balance,
-        subscriptions=subscriptions,
-        cards=cards,
-        upis=upis
+        deposits=summary.deposits,
+        withdrawals=summary.withdrawals,
+        balance=account.balance if account else 0.0,
+        subscriptions=summary.subscriptions,
+        cards=summary.cards,
+        upis=summary.upis
     )
 
 # ---------------- Transactions ----------------
 @main.route('/transactions')
+@read_only
 def transactions_view():
     
     if 'user_id' not in session:
@@ -156,20 +240,61 @@ def transactions_view():
     account = Account.query.filter_by(user_id=user_id).first()
     balance = account.balance if account else 0.0
 
-    deposits = Transaction.query.filter_by(user_id=user_id, txn_type='deposit').all()
-    withdrawals = Transaction.query.filter_by(user_id=user_id, txn_type='withdrawal').all()
-    transfers_sent = Transaction.query.filter_by(user_id=user_id, txn_type='transfer_sent').all()
-    transfers_received = Transaction.query.filter_by(user_id=user_id, txn_type='transfer_received').all()
+    txn_type = request.args.get('type')
+    if txn_type not in TRANSACTION_TYPES:
+        txn_type = None
+    start = _parse_day(request.args.get('start'))
+    end = _parse_day(request.args.get('end'))
+
+    query = Transaction.query.filter(Transaction.user_id == user_id)
+    if txn_type:
+        query = query.filter(Transaction.txn_type == txn_type)
+    if start:
+        query = query.filter(Transaction.date >= start)
+    if end:
+        query = query.filter(Transaction.date < end + timedelta(days=1))
+
+    page = keyset_page(query, Transaction.date, Transaction.id,
+                       request.args.get('cursor'), TRANSACTIONS_PAGE_SIZE)
 
     return render_template('transactions.html',
-                           deposits=deposits,
-                           withdrawals=withdrawals,
-                           transfers_sent=transfers_sent,
-                           transfers_received=transfers_received,
+                           transactions=page.items,
+                           next_cursor=page.next_cursor,
+                           txn_types=TRANSACTION_TYPES,
+                           filters={'type': txn_type or '',
+                                    'start': request.args.get('start', '') if start else '',
+                                    'end': request.args.get('end', '') if end else ''},
                            balance=balance,
                            username=session['username'])
 
 
+@main.route('/statement.<fmt>')
+@read_only
+def statement_view(fmt):
+    if 'user_id' not in session:
+        flash('Please login first.', 'warning')
+        return redirect(url_for('main.login_view'))
+    if fmt not in WRITERS:
+        abort(404)
+
+    account = Account.query.filter_by(user_id=session['user_id']).first()
+    if not account:
+        flash('No account found.', 'danger')
+        return redirect(url_for('main.transactions_view'))
+    start = _parse_day(request.args.get('start'))
+    end = _parse_day(request.args.get('end'))
+    txn_type = request.args.get('type')
+    if txn_type not in TRANSACTION_TYPES:
+        txn_type = None
+
+    # Rows are pulled from the cursor as the client reads, so the first
+    # bytes go out immediately and memory does not grow with the period.
+    filename = statement_filename(account, fmt, start, end, txn_type)
+    return Response(stream_with_context(stream_statement(account, fmt, start, end, txn_type)),
+                    mimetype=WRITERS[fmt][1],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+
 # ---------------- Transfer ----------------
 @main.route('/transfer', methods=['GET','POST'])
 def transfer_view():
@@ -181,64 +306,114 @@ def transfer_view():
     sender_account = Account.query.filter_by(user_id=sender.id).first()
 
     if request.method=='POST':
+        # a retry of a transfer that went through gets its original result (app/idempotency.py)
+        key = request_key()
+        replayed = replay(sender.id, key, url_for('main.transfer_view'))
+        if replayed:
+            return replayed
+
+        payee = request.form.get('payee', type=int)
         recipient_account_number = request.form.get('account_number')
         recipient_upi_id = request.form.get('upi_id')
-        amount = float(request.form.get('amount'))
+        try:
+            amount = float(request.form.get('amount'))
+        except (TypeError, ValueError):
+            amount = 0.0
         remarks = request.form.get('remarks', '')
 
-        if amount <=0:
+        if not (math.isfinite(amount) and amount > 0):
             flash('Amount must be greater than zero.', 'danger')
             return redirect(url_for('main.transfer_view'))
         if amount>sender_account.balance:
             flash('Insufficient balance!', 'danger')
             return redirect(url_for('main.transfer_view'))
 
-        recipient_account = None
-        if recipient_account_number:
-            recipient_account = Account.query.filter_by(account_number=recipient_account_number).first()
+        # a Recipient, resolved through app/recipients.py
+        recipient_account, recipient_key = None, None
+        if payee:
+            recipient_account, label = payee_recipient(sender.id, payee)
+        elif recipient_account_number:
+            recipient_key, label = ('account_number', recipient_account_number), recipient_account_number
         elif recipient_upi_id:
-            upi = Upi.query.filter_by(upi_id=recipient_upi_id).first()
-            if upi:
-                recipient_account = upi.account
+            recipient_key, label = ('upi_id', recipient_upi_id), recipient_upi_id
+        if recipient_key:
+            recipient_account = resolve(*recipient_key)
 
         if not recipient_account:
             flash('Recipient not found!', 'danger')
             return redirect(url_for('main.transfer_view'))
 
-        sender_account.balance -= amount
-        recipient_account.balance += amount
-        now = datetime.now(timezone.utc)
-
-        txn_sender = Transaction(
-            user_id=sender.id,
-            account_id=sender_account.id,
-            txn_id=f"TXN{uuid.uuid4().hex[:12]}",
-            txn_type='transfer_sent',
-            amount=amount,
-            remarks=f"To {recipient_account_number or recipient_upi_id} - {remarks}",
-            date=now
-        )
-        txn_recipient = Transaction(
-            user_id=recipient_account.user_id,
-            account_id=recipient_account.id,
-            txn_id=f"TXN{uuid.uuid4().hex[:12]}",
-            txn_type='transfer_received',
-            amount=amount,
-            remarks=f"From {sender_account.account_number} - {remarks}",
-            date=now
-        )
+        features = db.session.get(AccountFeatures, sender_account.id)
+        risk = get_scorer().score(transfer_features(sender_account, recipient_account, amount, features))
+        if risk is not None and risk >= current_app.config.get('FRAUD_THRESHOLD', FRAUD_THRESHOLD):
+            flash('Transfer blocked: it was flagged as potentially fraudulent.', 'danger')
+            return redirect(url_for('main.transfer_view'))
 
-        db.session.add_all([sender_account, recipient_account, txn_sender, txn_recipient])
-        db.session.commit()
+        message = f'Transferred ${amount} successfully!'
+        try:
+            ledger.transfer(sender_account, recipient_account, amount, remarks, recipient_label=label,
+                            idempotency=claim(sender.id, key, message))
+        except DuplicateRequest:
+            return replay(sender.id, key, url_for('main.transfer_view'))
+        except ledger.InsufficientFunds:
+            flash('Insufficient balance!', 'danger')
+            return redirect(url_for('main.transfer_view'))
+        except ledger.AccountNotFound:
+            # closed since it was cached or remembered
+            if recipient_key:
+                forget(*recipient_key)
+            flash('Recipient not found!', 'danger')
+            return redirect(url_for('main.transfer_view'))
 
-        flash(f'Transferred ${amount} successfully!', 'success')
+        flash(message, 'success')
         return redirect(url_for('main.transfer_view'))
 
-    return render_template('transfer.html', balance=sender_account.balance, username=sender.username)
+    return render_template('transfer.html', balance=sender_account.balance, username=sender.username,
+                           payees=recent_payees(sender.id), idempotency_key=new_key())
+
+
+@main.route('/transfer/batch', methods=['POST'])
+def transfer_batch_view():
+    """Pay many recipients at once from a JSON body or an uploaded CSV/JSON file.
+
+    Each payment has `account_number` or `upi_id`, `amount` and optional
+    `remarks`; the response is a per-line result report.
+    """
+    if 'user_id' not in session:
+        return jsonify(error='Please login first.'), 401
+
+    sender_account = Account.query.filter_by(user_id=session['user_id']).first()
+    if not sender_account:
+        return jsonify(error='Account not found.'), 404
+
+    upload = request.files.get('file')
+    try:
+        if upload:
+            text = upload.read().decode('utf-8-sig')
+            if upload.filename.lower().endswith('.json'):
+                payments = json.loads(text)
+            else:
+                payments = list(csv.DictReader(io.StringIO(text)))
+        else:
+            payments = request.get_json(silent=True)
+    except (UnicodeDecodeError, ValueError):
+        return jsonify(error='Could not parse the payment file.'), 400
+    if isinstance(payments, dict):
+        payments = payments.get('payments')
+    if not isinstance(payments, list) or not all(isinstance(p, dict) for p in payments):
+        return jsonify(error='Expected a list of payments.'), 400
+    if not payments or len(payments) > ledger.MAX_BATCH_LINES:
+        return jsonify(error=f'A batch must have 1 to {ledger.MAX_BATCH_LINES} payments.'), 400
+
+    report = ledger.transfer_batch(sender_account, payments)
+    paid = [line for line in report if line['status'] == 'paid']
+    return jsonify(paid=len(paid), failed=len(report) - len(paid),
+                   total_paid=sum(line['amount'] for line in paid), lines=report)
 
 
 # ---------------- Subscription ----------------
 @main.route('/subscription', methods=['GET','POST'])
+@read_only
 def subscription_view():
     if 'user_id' not in session:
         flash('Please login first.', 'warning')
@@ -248,18 +423,17 @@ def subscription_view():
 
     if request.method == 'POST':
         name = request.form.get('name')
-        amount = float(request.form.get('amount'))
+        try:
+            amount = float(request.form.get('amount'))
+        except (TypeError, ValueError):
+            amount = 0.0
         frequency = request.form.get('frequency')
+        if not (math.isfinite(amount) and amount > 0):
+            flash('Amount must be greater than zero.', 'danger')
+            return redirect(url_for('main.subscription_view'))
 
         now = datetime.utcnow()
-        if frequency == 'Weekly':
-            next_billing = now + timedelta(weeks=1)
-        elif frequency == 'Monthly':
-            next_billing = now + timedelta(days=30)
-        elif frequency == 'Yearly':
-            next_billing = now + timedelta(days=365)
-        else:
-            next_billing = None
+        next_billing = next_billing_date(frequency, now)
 
         new_sub = Subscription(
             user_id=user_id,
@@ -272,6 +446,7 @@ def subscription_view():
         )
         db.session.add(new_sub)
         db.session.commit()
+        invalidate_dashboard(user_id)
         flash('Subscription added successfully!', 'success')
         return redirect(url_for('main.subscription_view'))
 
@@ -292,6 +467,7 @@ def delete_subscription_view(sub_id):
 
     db.session.delete(sub)
     db.session.commit()
+    invalidate_dashboard(sub.user_id)
     flash('Subscription cancelled successfully.', 'success')
     return redirect(url_for('main.subscription_view'))
 
@@ -305,6 +481,7 @@ def delete_user_view(user_id):
     user = Login.query.get_or_404(user_id)
     db.session.delete(user)
     db.session.commit()
+    invalidate_dashboard(user_id)
     flash('User deleted successfully.', 'success')
     return redirect(url_for('main.dashboard_view'))
 
@@ -317,11 +494,13 @@ def make_admin_view(user_id):
     user = Login.query.get_or_404(user_id)
     user.is_admin=True
     db.session.commit()
+    invalidate_dashboard(user_id)
     flash(f'{user.fullname} is now an admin.', 'success')
     return redirect(url_for('main.dashboard_view'))
 
 # ---------------- Card Management ----------------
 @main.route('/cards')
+@read_only
 def cards_view():
     if 'user_id' not in session:
         flash('Please login first.', 'warning')
@@ -357,7 +536,7 @@ def add_card_view():
         return redirect(url_for('main.cards_view'))
 
     cvv = str(uuid.uuid4().int)[:3]
-    hashed_pin = generate_password_hash(pin)
+    hashed_pin = hash_secret(pin)
 
     new_card = Card(
         account_id=account.id,
@@ -369,6 +548,8 @@ def add_card_view():
     )
     db.session.add(new_card)
     db.session.commit()
+    card_index.invalidate(card_number)
+    invalidate_dashboard(session['user_id'])
     flash(f'{card_type.capitalize()} card added successfully!', 'success')
     return redirect(url_for('main.cards_view'))
 
@@ -389,8 +570,10 @@ def set_pin_view(card_id):
     if not new_pin.isdigit() or len(new_pin) != 4:
         flash('PIN must be 4 digits!', 'danger')
         return redirect(url_for('main.cards_view'))
-    card.pin = generate_password_hash(new_pin)
+    card.pin = hash_secret(new_pin)
+    card.failed_pins = 0
     db.session.commit()
+    card_index.invalidate(card.card_number)
     flash('PIN updated successfully!', 'success')
     return redirect(url_for('main.cards_view'))
 
@@ -409,6 +592,8 @@ def delete_card_view(card_id):
 
     db.session.delete(card)
     db.session.commit()
+    card_index.invalidate(card.card_number)
+    invalidate_dashboard(session['user_id'])
     flash('Card deleted successfully.', 'success')
     return redirect(url_for('main.cards_view'))
 
@@ -426,11 +611,36 @@ def toggle_card_view(card_id):
         return redirect(url_for('main.cards_view'))
 
     card.blocked = not card.blocked
+    if not card.blocked:
+        card.failed_pins = 0   # or the next wrong PIN would block it again
     db.session.commit()
+    card_index.invalidate(card.card_number)
     status = 'unblocked' if not card.blocked else 'blocked'
     flash(f'Card {status} successfully.', 'success')
     return redirect(url_for('main.cards_view'))
 
+@main.route('/cards/authorize', methods=['POST'])
+def authorize_card_view():
+    """Approve or decline a card payment: JSON `card_number`, `amount`, `pin`, optional `merchant`.
+
+    For merchants and acquirers: the X-API-Key header must carry one of CARD_AUTH_API_KEYS.
+    """
+    if not valid_api_key(request.headers.get('X-API-Key')):
+        return jsonify(error='A valid X-API-Key header is required.'), 401
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify(error='Expected a JSON object.'), 400
+    card_number = str(payload.get('card_number') or '').strip()
+    pin = str(payload.get('pin') or '')
+    amount = payload.get('amount')
+    if not card_number.isdigit() or len(card_number) != 16 or not pin.isdigit() or len(pin) != 4:
+        return jsonify(error='card_number must be 16 digits and pin 4 digits.'), 400
+    if isinstance(amount, bool) or not isinstance(amount, (int, float)):
+        return jsonify(error='amount must be a number.'), 400
+
+    decision = authorize(card_number, float(amount), pin, str(payload.get('merchant') or '')[:80])
+    return jsonify(decision._asdict())
+
 # ---------------- Deposit ----------------
 @main.route('/deposit', methods=['GET','POST'])
 def deposit_view():
@@ -445,6 +655,11 @@ def deposit_view():
         return redirect(url_for('main.dashboard_view'))
 
     if request.method=='POST':
+        key = request_key()
+        replayed = replay(user.id, key, url_for('main.deposit_view'))
+        if replayed:
+            return replayed
+
         try:
             amount = float(request.form.get('amount'))
             remarks = request.form.get('remarks','')
@@ -452,30 +667,21 @@ def deposit_view():
             flash('Invalid amount.', 'danger')
             return redirect(url_for('main.deposit_view'))
 
-        if amount <=0:
+        if not (math.isfinite(amount) and amount > 0):
             flash('Amount must be > 0', 'danger')
             return redirect(url_for('main.deposit_view'))
 
-        account.balance += amount
-        now = datetime.now(timezone.utc)
-
-        txn = Transaction(
-            user_id=user.id,
-            account_id=account.id,
-            txn_id=f"TXN{uuid.uuid4().hex[:12]}",
-            txn_type='deposit',
-            amount=amount,
-            remarks=remarks,
-            date=now
-        )
-        db.session.add(account)
-        db.session.add(txn)
-        db.session.commit()
+        message = f'Deposited ${amount} successfully!'
+        try:
+            ledger.deposit(account, amount, remarks, idempotency=claim(user.id, key, message))
+        except DuplicateRequest:
+            return replay(user.id, key, url_for('main.deposit_view'))
 
-        flash(f'Deposited ${amount} successfully!', 'success')
+        flash(message, 'success')
         return redirect(url_for('main.deposit_view'))
 
-    return render_template('deposit.html', balance=account.balance, username=user.username)
+    return render_template('deposit.html', balance=account.balance, username=user.username,
+                           idempotency_key=new_key())
 
 
 # ---------------- Withdrawal ----------------
@@ -492,6 +698,11 @@ def withdrawal_view():
         return redirect(url_for('main.dashboard_view'))
 
     if request.method=='POST':
+        key = request_key()
+        replayed = replay(user.id, key, url_for('main.withdrawal_view'))
+        if replayed:
+            return replayed
+
         try:
             amount = float(request.form.get('amount'))
             remarks = request.form.get('remarks','')
@@ -499,30 +710,24 @@ def withdrawal_view():
             flash('Invalid amount.', 'danger')
             return redirect(url_for('main.withdrawal_view'))
 
-        if amount <=0:
+        if not (math.isfinite(amount) and amount > 0):
             flash('Amount must be > 0', 'danger')
             return redirect(url_for('main.withdrawal_view'))
         if amount > account.balance:
             flash('Insufficient balance!', 'danger')
             return redirect(url_for('main.withdrawal_view'))
 
-        account.balance -= amount
-        now = datetime.now(timezone.utc)
-
-        txn = Transaction(
-            user_id=user.id,
-            account_id=account.id,
-            txn_id=f"TXN{uuid.uuid4().hex[:12]}",
-            txn_type='withdrawal',
-            amount=amount,
-            remarks=remarks,
-            date=now
-        )
-        db.session.add(account)
-        db.session.add(txn)
-        db.session.commit()
+        message = f'Withdrawn ${amount} successfully!'
+        try:
+            ledger.withdraw(account, amount, remarks, idempotency=claim(user.id, key, message))
+        except DuplicateRequest:
+            return replay(user.id, key, url_for('main.withdrawal_view'))
+        except ledger.InsufficientFunds:
+            flash('Insufficient balance!', 'danger')
+            return redirect(url_for('main.withdrawal_view'))
 
-        flash(f'Withdrawn ${amount} successfully!', 'success')
+        flash(message, 'success')
         return redirect(url_for('main.withdrawal_view'))
 
-    return render_template('withdrawal.html', balance=account.balance, username=user.username)
+    return render_template('withdrawal.html', balance=account.balance, username=user.username,
+                           idempotency_key=new_key())
@@ -0,0 +1,241 @@
+import logging
+import os
+import secrets
+import threading
+import time
+from datetime import datetime
+import msgspec
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+from sqlalchemy import bindparam, delete, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from werkzeug.datastructures import CallbackDict
+from .cache import TTLCache
+from .models.models import db, UserSession
+
+logger = logging.getLogger(__name__)
+
+# SESSION_BACKEND picks where session data lives:
+#   'sqlite'     - user_session table with a per-process LRU front cache (default)
+#   'cookie'     - Flask's signed cookie; nothing stored server-side
+#   'filesystem' - the old Flask-Session file store, kept for comparison
+SESSION_BACKENDS = ('sqlite', 'cookie', 'filesystem')
+CACHE_SIZE = 10000
+CACHE_TTL_SECONDS = 300
+SWEEP_INTERVAL_SECONDS = 300
+SWEEP_CHUNK = 1000
+
+_encoder = msgspec.msgpack.Encoder()
+_decoder = msgspec.msgpack.Decoder()
+_sessions = UserSession.__table__
+# Built once so the per-request write reuses the compiled statements.
+LOAD = select(_sessions.c.version, _sessions.c.data, _sessions.c.expiry) \
+    .where(_sessions.c.sid == bindparam('b_sid'))
+_insert = sqlite_insert(_sessions).values(sid=bindparam('b_sid'), version=bindparam('b_version'),
+                                          data=bindparam('b_data'), expiry=bindparam('b_expiry'))
+STORE = _insert.on_conflict_do_update(index_elements=['sid'], set_={
+    'version': _insert.excluded.version,
+    'data': _insert.excluded.data,
+    'expiry': _insert.excluded.expiry,
+})
+TOUCH = update(_sessions).where(_sessions.c.sid == bindparam('b_sid')) \
+    .values(expiry=bindparam('b_expiry'))
+DROP = delete(_sessions).where(_sessions.c.sid == bindparam('b_sid'))
+
+
+class ServerSession(CallbackDict, SessionMixin):
+
+    def __init__(self, initial=None, sid=None, version=0, expiry=None, new=False):
+        def on_update(self):
+            self.modified = True
+            self.accessed = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.version = version
+        self.expiry = expiry
+        self.new = new
+        self.modified = False
+        self.accessed = False
+
+
+class SqliteSessionInterface(SessionInterface):
+    """Sessions stored in the user_session table, read through an LRU cache.
+
+    The cookie carries the signed session id and the version of the data
+    the client last saw. A cached copy is only used when its version matches
+    the cookie, so a worker holding an older copy (another process wrote the
+    session since) falls through to the table instead of serving stale data.
+    Rows are only written when the session changes, or to push the expiry
+    forward once half the lifetime has passed.
+    """
+
+    def __init__(self, cache_size=CACHE_SIZE, cache_ttl=CACHE_TTL_SECONDS,
+                 sweep_interval=SWEEP_INTERVAL_SECONDS):
+        self.cache = TTLCache(cache_size, cache_ttl)
+        self.sweep_interval = sweep_interval
+        self._sweeper_pid = None
+        self._sweeper_lock = threading.Lock()
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt='user-session')
+
+    def _lifetime(self, app):
+        return app.permanent_session_lifetime
+
+    def _new_session(self):
+        return ServerSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def _parse_cookie(self, app, cookie):
+        """(sid, version) from the cookie value, or None if it is missing or forged."""
+        if not cookie:
+            return None
+        try:
+            sid, _, version = self._signer(app).unsign(cookie).decode().rpartition('.')
+            return sid, int(version)
+        except (BadSignature, ValueError):
+            return None
+
+    def _cached(self, sid, version):
+        cached = self.cache.get(sid)
+        return cached if cached is not None and cached[0] == version else None
+
+    def _from_row(self, sid, row):
+        """ServerSession for a (version, data, expiry) row; a new session if it expired."""
+        stored_version, payload, expiry = row
+        if expiry <= datetime.utcnow():
+            self.cache.pop(sid)
+            return self._new_session()
+        return ServerSession(_decoder.decode(payload), sid, stored_version, expiry)
+
+    def open_session(self, app, request):
+        self._start_sweeper(app)
+        parsed = self._parse_cookie(app, request.cookies.get(self.get_cookie_name(app)))
+        if parsed is None:
+            return self._new_session()
+        sid, version = parsed
+        cached = self._cached(sid, version)
+        if cached is None:
+            with db.engine.connect() as connection:
+                row = connection.execute(LOAD, {'b_sid': sid}).first()
+            if row is None:
+                return self._new_session()
+            cached = tuple(row)
+            self.cache.set(sid, cached)
+        return self._from_row(sid, cached)
+
+    async def open_session_async(self, app, cookie, connection):
+        """open_session for the async server (app/asgi.py): `connection` is an AsyncConnection.
+
+        Read-only: the expiry is pushed forward by the next synchronous request.
+        """
+        parsed = self._parse_cookie(app, cookie)
+        if parsed is None:
+            return self._new_session()
+        sid, version = parsed
+        cached = self._cached(sid, version)
+        if cached is None:
+            row = (await connection.execute(LOAD, {'b_sid': sid})).first()
+            if row is None:
+                return self._new_session()
+            cached = tuple(row)
+            self.cache.set(sid, cached)
+        return self._from_row(sid, cached)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if not session:
+            if session.modified and not session.new:
+                self.cache.pop(session.sid)
+                with db.engine.begin() as connection:
+                    connection.execute(DROP, {'b_sid': session.sid})
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app),
+                                       httponly=self.get_cookie_httponly(app))
+                response.vary.add('Cookie')
+            return
+
+        now = datetime.utcnow()
+        lifetime = self._lifetime(app)
+        expiry = now + lifetime
+        if session.modified or session.new:
+            session.version += 1
+            payload = _encoder.encode(dict(session))
+            with db.engine.begin() as connection:
+                connection.execute(STORE, {'b_sid': session.sid, 'b_version': session.version,
+                                           'b_data': payload, 'b_expiry': expiry})
+            self.cache.set(session.sid, (session.version, payload, expiry))
+        elif session.expiry - now < lifetime / 2:
+            with db.engine.begin() as connection:
+                connection.execute(TOUCH, {'b_sid': session.sid, 'b_expiry': expiry})
+            cached = self.cache.get(session.sid)
+            if cached is not None:
+                self.cache.set(session.sid, (cached[0], cached[1], expiry))
+        elif not self.should_set_cookie(app, session):
+            return
+
+        value = self._signer(app).sign(f"{session.sid}.{session.version}").decode()
+        response.set_cookie(name, value,
+                            expires=self.get_expiration_time(app, session),
+                            httponly=self.get_cookie_httponly(app),
+                            domain=domain, path=path,
+                            secure=self.get_cookie_secure(app),
+                            samesite=self.get_cookie_samesite(app))
+        response.vary.add('Cookie')
+
+    # ---------------- Expiry sweeps ----------------
+    def _start_sweeper(self, app):
+        # one sweeper per process, started lazily so forked workers get their own
+        if self._sweeper_pid == os.getpid() or not self.sweep_interval:
+            return
+        with self._sweeper_lock:
+            if self._sweeper_pid != os.getpid():
+                self._sweeper_pid = os.getpid()
+                threading.Thread(target=self._sweep_forever, args=(app,),
+                                 name='session-sweeper', daemon=True).start()
+
+    def _sweep_forever(self, app):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                with app.app_context():
+                    sweep_expired_sessions()
+                self.cache.purge_expired()
+            except Exception:
+                logger.exception("Session expiry sweep failed")
+
+
+def sweep_expired_sessions(now=None, chunk_size=SWEEP_CHUNK):
+    """Delete expired session rows in short transactions; returns the count."""
+    now = now or datetime.utcnow()
+    removed = 0
+    while True:
+        expired = select(_sessions.c.sid).where(_sessions.c.expiry <= now).limit(chunk_size)
+        with db.engine.begin() as connection:
+            deleted = connection.execute(delete(_sessions).where(_sessions.c.sid.in_(expired))).rowcount
+        removed += deleted
+        if deleted < chunk_size:
+            return removed
+
+
+def init_sessions(app):
+    backend = app.config.setdefault('SESSION_BACKEND', 'sqlite')
+    if backend not in SESSION_BACKENDS:
+        raise ValueError(f"SESSION_BACKEND must be one of {SESSION_BACKENDS}, not {backend!r}")
+    if backend == 'sqlite':
+        app.session_interface = SqliteSessionInterface(
+            app.config.get('SESSION_CACHE_SIZE', CACHE_SIZE),
+            app.config.get('SESSION_CACHE_TTL', CACHE_TTL_SECONDS),
+            app.config.get('SESSION_SWEEP_INTERVAL', SWEEP_INTERVAL_SECONDS))
+    elif backend == 'filesystem':
+        from flask_session import Session
+
+        app.config.setdefault('SESSION_TYPE', 'filesystem')
+        Session(app)
+    # 'cookie' keeps Flask's default SecureCookieSessionInterface
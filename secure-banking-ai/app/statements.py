@@ -0,0 +1,107 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from sqlalchemy import func, select
+from .models.models import db, Account, Transaction
+from .utils.pdf_generator import csv_statement, pdf_statement
+
+STREAM_BATCH = 1000
+EXPORT_CHUNK = 200
+
+# format: (writer, mimetype, open() arguments for exported files)
+WRITERS = {
+    'csv': (csv_statement, 'text/csv', {'mode': 'w', 'encoding': 'utf-8', 'newline': ''}),
+    'pdf': (pdf_statement, 'application/pdf', {'mode': 'wb'}),
+}
+
+
+def statement_rows(account_id, start=None, end=None, txn_type=None, batch=STREAM_BATCH):
+    """Yield (date, txn_id, txn_type, amount, counterparty, remarks) oldest first.
+
+    Walks ix_transactions_account_date with a server-side cursor, holding at
+    most `batch` rows in memory however long the statement is.
+    `end` is inclusive (the whole day); `txn_type` keeps one type only.
+    """
+    query = select(Transaction.date, Transaction.txn_id, Transaction.txn_type,
+                   Transaction.amount, Transaction.counterparty, Transaction.remarks) \
+        .where(Transaction.account_id == account_id)
+    if start:
+        query = query.where(Transaction.date >= start)
+    if end:
+        query = query.where(Transaction.date < end + timedelta(days=1))
+    if txn_type:
+        query = query.where(Transaction.txn_type == txn_type)
+    query = query.order_by(Transaction.date, Transaction.id) \
+        .execution_options(yield_per=batch)
+    for row in db.session.execute(query):
+        yield tuple(row)
+
+
+def statement_title(account, start=None, end=None, txn_type=None):
+    period = f"{start:%Y-%m-%d} to {end:%Y-%m-%d}" if start and end else \
+        f"from {start:%Y-%m-%d}" if start else f"until {end:%Y-%m-%d}" if end else 'all time'
+    title = f"SecureBank statement - account {account.account_number} - {period}"
+    return f"{title} - {txn_type} only" if txn_type else title
+
+
+def statement_filename(account, fmt, start=None, end=None, txn_type=None):
+    parts = [f"statement_{account.account_number}"]
+    if txn_type:
+        parts.append(txn_type)
+    if start:
+        parts.append(f"{start:%Y%m%d}")
+    if end:
+        parts.append(f"{end:%Y%m%d}")
+    return '_'.join(parts) + '.' + fmt
+
+
+def stream_statement(account, fmt, start=None, end=None, txn_type=None):
+    writer = WRITERS[fmt][0]
+    rows = statement_rows(account.id, start, end, txn_type)
+    if fmt == 'pdf':
+        return writer(rows, statement_title(account, start, end, txn_type))
+    return writer(rows)
+
+
+# ---------------- Bulk export ----------------
+def _export_accounts(lo, hi, out_dir, fmt, start, end):
+    file_args = WRITERS[fmt][2]
+    accounts = db.session.execute(
+        select(Account.id, Account.account_number)
+        .where(Account.id >= lo, Account.id < hi)
+        .order_by(Account.id)).all()
+    for account in accounts:
+        path = os.path.join(out_dir, statement_filename(account, fmt, start, end))
+        with open(path, **file_args) as handle:
+            for chunk in stream_statement(account, fmt, start, end):
+                handle.write(chunk)
+    return len(accounts)
+
+
+def _export_range(uri, lo, hi, out_dir, fmt, start, end):
+    from . import create_app
+
+    with create_app({'SQLALCHEMY_DATABASE_URI': uri}).app_context():
+        return _export_accounts(lo, hi, out_dir, fmt, start, end)
+
+
+def export_statements(out_dir, fmt='pdf', start=None, end=None, workers=1, chunk_size=EXPORT_CHUNK):
+    """Write one statement file per account into `out_dir`.
+
+    Accounts are split into id ranges of `chunk_size`; each range is exported
+    by a worker process with its own connection. Returns the file count.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    lo, hi = db.session.execute(select(func.min(Account.id), func.max(Account.id))).one()
+    if lo is None:
+        return 0
+    bounds = [(first, first + chunk_size) for first in range(lo, hi + 1, chunk_size)]
+    if workers <= 1:
+        return sum(_export_accounts(first, last, out_dir, fmt, start, end) for first, last in bounds)
+
+    uri = db.engine.url.render_as_string(hide_password=False)
+    db.session.remove()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_export_range, uri, first, last, out_dir, fmt, start, end)
+                   for first, last in bounds]
+        return sum(future.result() for future in futures)
@@ -0,0 +1,121 @@
+import csv
+import io
+
+# Statement writers. Both take an iterable of transaction rows
+# (date, txn_id, txn_type, amount, counterparty, remarks) and are generators,
+# so a view can stream them straight to the client: the first chunk goes out
+# before the query has produced its second row and memory does not grow
+# with the length of the statement.
+
+CSV_HEADER = ('date', 'txn_id', 'type', 'amount', 'counterparty', 'remarks')
+CSV_FLUSH_ROWS = 500
+
+PAGE_WIDTH, PAGE_HEIGHT = 612, 792   # US Letter, points
+MARGIN = 40
+FONT_SIZE = 8
+LEADING = 11
+LINES_PER_PAGE = (PAGE_HEIGHT - 2 * MARGIN) // LEADING - 3   # minus title and header
+LINE_FORMAT = '{:<16}  {:<15}  {:<17}  {:>12}  {:<20}  {}'
+
+
+def csv_statement(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    for count, (date, txn_id, txn_type, amount, counterparty, remarks) in enumerate(rows, start=1):
+        writer.writerow((date.strftime('%Y-%m-%d %H:%M:%S') if date else '', txn_id, txn_type,
+                         f'{amount:.2f}', counterparty or '', remarks or ''))
+        if count % CSV_FLUSH_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _pdf_text(value):
+    text = str(value).replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+    return text.encode('latin-1', 'replace')
+
+
+def _format_line(date, txn_id, txn_type, amount, counterparty, remarks):
+    return LINE_FORMAT.format(date.strftime('%Y-%m-%d %H:%M') if date else '', txn_id[:15],
+                              txn_type[:17], f'{amount:,.2f}', (counterparty or '')[:20],
+                              (remarks or '')[:28])
+
+
+class _PdfWriter:
+    """Writes PDF objects in order, remembering only their byte offsets."""
+
+    def __init__(self):
+        self.offset = 0
+        self.offsets = {}
+
+    def raw(self, data):
+        self.offset += len(data)
+        return data
+
+    def obj(self, number, body):
+        self.offsets[number] = self.offset
+        return self.raw(b'%d 0 obj\n' % number + body + b'\nendobj\n')
+
+    def stream(self, number, content):
+        return self.obj(number, b'<< /Length %d >>\nstream\n' % len(content) + content + b'\nendstream')
+
+    def xref(self):
+        start = self.offset
+        size = max(self.offsets) + 1
+        entries = [b'xref\n0 %d\n0000000000 65535 f \n' % size]
+        entries += [b'%010d 00000 n \n' % self.offsets[number] for number in range(1, size)]
+        entries.append(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (size, start))
+        return b''.join(entries)
+
+
+def _page_content(title, header, lines, page_number):
+    y = PAGE_HEIGHT - MARGIN
+    parts = [b'BT /F1 %d Tf %d TL %d %d Td' % (FONT_SIZE, LEADING, MARGIN, y),
+             b'(' + _pdf_text(f'{title}  -  page {page_number}') + b') Tj T* T*',
+             b'(' + _pdf_text(header) + b') Tj T*']
+    parts += [b'(' + _pdf_text(line) + b') Tj T*' for line in lines]
+    parts.append(b'ET')
+    return b'\n'.join(parts)
+
+
+def pdf_statement(rows, title='Account statement'):
+    """Stream a plain monospaced PDF statement, one page per LINES_PER_PAGE rows.
+
+    Object 2 (the page tree) is written last because it lists every page;
+    until then only the page object numbers and byte offsets are kept.
+    """
+    writer = _PdfWriter()
+    header = LINE_FORMAT.format('Date', 'Txn ID', 'Type', 'Amount', 'Counterparty', 'Remarks')
+    yield writer.raw(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    yield writer.obj(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+    yield writer.obj(3, b'<< /Type /Font /Subtype /Type1 /BaseFont /Courier >>')
+
+    pages, lines, number = [], [], 4
+
+    def flush():
+        nonlocal number
+        content = _page_content(title, header, lines, len(pages) + 1)
+        chunk = writer.stream(number, content) + writer.obj(
+            number + 1,
+            b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] '
+            b'/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>'
+            % (PAGE_WIDTH, PAGE_HEIGHT, number))
+        pages.append(number + 1)
+        number += 2
+        lines.clear()
+        return chunk
+
+    for row in rows:
+        lines.append(_format_line(*row))
+        if len(lines) == LINES_PER_PAGE:
+            yield flush()
+    if lines or not pages:
+        if not pages and not lines:
+            lines.append('No transactions in this period.')
+        yield flush()
+
+    kids = b' '.join(b'%d 0 R' % page for page in pages)
+    yield writer.obj(2, b'<< /Type /Pages /Kids [' + kids + b'] /Count %d >>' % len(pages))
+    yield writer.xref()
@@ -0,0 +1,132 @@
+"""Sync (gunicorn) against async (uvicorn) serving under concurrent reads.
+
+    python benchmarks/async_serving.py [--users 2000] [--clients 64] [--seconds 20] \\
+        [--workers 2] [--modes sync asgi]
+
+Builds the load-test dataset in a scratch database, then for each mode
+starts serve.py on it and runs `--clients` concurrent customers. Each logs
+in and alternates between GET /dashboard and GET /api/v1/transactions for
+`--seconds`. Reports throughput and p50/p95/p99 per route and mode.
+
+Both modes get the same worker processes and the same thread count; in the
+asgi mode the transaction list is served on async reads and the dashboard
+still by Flask, so the dashboard row shows what the bridge costs.
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app import create_app, db  # noqa: E402
+from load_test import HttpSession, PASSWORD, build_dataset, percentile  # noqa: E402
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+PATHS = {'dashboard': '/dashboard', 'transactions': '/api/v1/transactions?limit=20'}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start(mode, database, workers, threads):
+    port = free_port()
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + database)
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'serve.py'), '--mode', mode, '--bind', f'127.0.0.1:{port}',
+         '--workers', str(workers), '--threads', str(threads)],
+        env=env, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(base_url + '/login') as response:
+                response.read()
+            return process, base_url
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"{mode} server did not start")
+
+
+def customer(base_url, user_index, stop_at, samples, errors):
+    client = HttpSession(base_url)
+    if client.post('/login', {'username': f'user{user_index}', 'password': PASSWORD}) != 302:
+        errors['login'] += 1
+        return
+    routes = list(PATHS.items())
+    n = user_index
+    while time.monotonic() < stop_at:
+        route, path = routes[n % len(routes)]
+        n += 1
+        started = time.perf_counter()
+        status = client.get(path)
+        samples[route].append(time.perf_counter() - started)
+        if status >= 400:
+            errors[route] += 1
+
+
+def run_mode(mode, database, args):
+    process, base_url = start(mode, database, args.workers, args.threads)
+    try:
+        samples, errors = defaultdict(list), defaultdict(int)
+        stop_at = time.monotonic() + args.seconds
+        threads = [threading.Thread(target=customer, args=(base_url, user_index, stop_at, samples, errors))
+                   for user_index in range(1, args.clients + 1)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        process.terminate()
+        process.wait()
+    return samples, errors, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--txns-per-user', type=int, default=50)
+    parser.add_argument('--clients', type=int, default=64, help='Concurrent customers.')
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--modes', nargs='+', choices=['sync', 'asgi'], default=['sync', 'asgi'])
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        database = os.path.join(workdir, 'serving.db')
+        app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + database, 'SESSION_SWEEP_INTERVAL': 0})
+        build_dataset(app, args.users, args.txns_per_user, args.seed)
+        with app.app_context():
+            db.engine.dispose()
+        print(f"{args.clients} clients, {args.workers} workers x {args.threads} threads, {args.seconds:g}s")
+        print(f"{'mode':6} {'route':14} {'count':>7} {'err':>4} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+              f"{'p99 ms':>8}")
+        for mode in args.modes:
+            samples, errors, elapsed = run_mode(mode, database, args)
+            for route in PATHS:
+                values = sorted(samples[route])
+                if not values:
+                    print(f"{mode:6} {route:14} no samples ({errors['login']} failed logins)")
+                    continue
+                print(f"{mode:6} {route:14} {len(values):7d} {errors[route]:4d} {len(values) / elapsed:8.1f} "
+                      f"{percentile(values, 50) * 1000:8.1f} {percentile(values, 95) * 1000:8.1f} "
+                      f"{percentile(values, 99) * 1000:8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Login verification throughput per core for each hashing setting.
+
+    python benchmarks/hashing.py [--logins 200] [--concurrency 32]
+
+Each run verifies `--logins` passwords from `--concurrency` caller threads
+through app.hashing.Hasher, the way concurrent login requests would.
+The legacy row is werkzeug's default scrypt hash checked inline, which is
+what login_view used to do.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from werkzeug.security import check_password_hash, generate_password_hash  # noqa: E402
+from app.hashing import Hasher, HashingBusy  # noqa: E402
+
+PASSWORD = 'Correct-Horse-9'
+SETTINGS = (
+    ('argon2id t=2 m=19MiB', {'algorithm': 'argon2', 'time_cost': 2, 'memory_cost': 19456}),
+    ('argon2id t=3 m=64MiB', {'algorithm': 'argon2', 'time_cost': 3, 'memory_cost': 65536}),
+    ('pbkdf2-sha256 600k', {'algorithm': 'pbkdf2', 'iterations': 600000}),
+)
+
+
+def run(verify, logins, concurrency):
+    latencies, busy = [], 0
+
+    def login(_):
+        started = time.perf_counter()
+        try:
+            assert verify()
+        except HashingBusy:
+            return None
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as callers:
+        for latency in callers.map(login, range(logins)):
+            if latency is None:
+                busy += 1
+            else:
+                latencies.append(latency)
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000 if latencies else 0
+    return len(latencies) / elapsed, p99, busy
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    cores = os.cpu_count() or 1
+
+    print(f"{cores} cores, {args.workers} hashing workers, {args.concurrency} concurrent logins")
+    print(f"{'setting':24} {'logins/s':>9} {'per core':>9} {'p99 ms':>8} {'rejected':>9}")
+
+    legacy = generate_password_hash(PASSWORD)
+    rate, p99, _ = run(lambda: check_password_hash(legacy, PASSWORD), args.logins, args.concurrency)
+    print(f"{'legacy scrypt, inline':24} {rate:9.1f} {rate / cores:9.1f} {p99:8.1f} {'-':>9}")
+
+    for name, options in SETTINGS:
+        # room for every caller, so the numbers measure throughput rather than shedding
+        hasher = Hasher(workers=args.workers, max_pending=args.concurrency, **options)
+        stored = hasher.hash(PASSWORD)
+        rate, p99, busy = run(lambda: hasher.verify(stored, PASSWORD), args.logins, args.concurrency)
+        print(f"{name:24} {rate:9.1f} {rate / cores:9.1f} {p99:8.1f} {busy:9d}")
+        hasher.pool.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,300 @@
+"""Load test for the main routes: throughput and p50/p95/p99 per route.
+
+    python benchmarks/load_test.py --users 2000 --sessions 32 --actions 50 \\
+        --out results.json [--baseline baseline.json] [--mode server]
+
+Builds a dataset of `--users` customers in a scratch database, then drives
+the app with `--sessions` concurrent simulated customers. Each one logs in
+and performs `--actions` requests drawn from a weighted mix of dashboard,
+transaction history, deposit, withdrawal and transfer. The default mode
+uses the Flask test client; `--mode server` goes over HTTP to a threaded
+werkzeug server on localhost.
+
+Results are written as JSON. With `--baseline`, every route is compared with
+the stored run and the exit status is 1 if any p95 or throughput regressed
+by more than `--tolerance`. Use `--save-baseline` to store the current run.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import insert  # noqa: E402
+from app import create_app, db  # noqa: E402
+from app.models.models import Login, Account, Transaction, Upi  # noqa: E402
+
+PASSWORD = 'Load-Test-123!'
+ROUTES = ('login', 'dashboard', 'transactions', 'deposit', 'withdraw', 'transfer')
+ACTION_WEIGHTS = {'dashboard': 30, 'transactions': 30, 'deposit': 15, 'withdraw': 10, 'transfer': 15}
+INSERT_CHUNK = 5000
+
+
+# ---------------- Dataset ----------------
+def account_number(user_index):
+    return f"LT{user_index:010d}"
+
+
+def build_dataset(app, users, txns_per_user, seed, block=500):
+    """Create `users` customers with an account, a UPI id and some history."""
+    from app.hashing import hash_secret
+
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    with app.app_context():
+        db.create_all()
+        password = hash_secret(PASSWORD)   # one KDF run; every customer shares it
+        for first in range(1, users + 1, block):
+            logins, accounts, upis, txns = [], [], [], []
+            for i in range(first, min(first + block, users + 1)):
+                balance = 100000.0   # enough that withdrawals and transfers rarely fail
+                for n in range(txns_per_user):
+                    amount = round(rng.lognormvariate(4, 1), 2)
+                    txn_type = 'withdrawal' if rng.random() < 0.4 else 'deposit'
+                    balance += amount if txn_type == 'deposit' else -amount
+                    txns.append({'user_id': i, 'account_id': i, 'txn_id': f'LT{i}-{n}',
+                                 'txn_type': txn_type, 'amount': amount, 'remarks': 'seed',
+                                 'date': now - timedelta(minutes=rng.randint(0, 365 * 24 * 60))})
+                logins.append({'id': i, 'fullname': f'Load User {i}', 'email': f'user{i}@load.test',
+                               'username': f'user{i}', 'password': password, 'is_admin': False,
+                               'created_at': now})
+                accounts.append({'id': i, 'user_id': i, 'account_number': account_number(i),
+                                 'balance': balance,
+                                 'created_at': now - timedelta(days=rng.randint(30, 900))})
+                upis.append({'account_id': i, 'upi_id': f'user{i}@bank', 'verified': True})
+            for table, rows in ((Login, logins), (Account, accounts), (Upi, upis), (Transaction, txns)):
+                for start in range(0, len(rows), INSERT_CHUNK):
+                    db.session.execute(insert(table), rows[start:start + INSERT_CHUNK])
+        db.session.commit()
+
+
+# ---------------- Clients ----------------
+class TestClientSession:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def get(self, path):
+        return self.client.get(path).status_code
+
+    def post(self, path, data):
+        return self.client.post(path, data=data).status_code
+
+
+class HttpSession:
+    """urllib client that keeps cookies and, like the test client, does not follow redirects."""
+
+    def __init__(self, base_url):
+        import http.cookiejar
+        import urllib.request
+
+        class NoRedirect(urllib.request.HTTPRedirectHandler):
+            def redirect_request(self, *args, **kwargs):
+                return None
+
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), NoRedirect())
+
+    def _open(self, path, body=None):
+        import urllib.error
+        import urllib.parse
+
+        data = urllib.parse.urlencode(body).encode() if body is not None else None
+        try:
+            with self.opener.open(self.base_url + path, data) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as exc:   # 3xx (not followed) and errors
+            exc.read()
+            return exc.code
+
+    def get(self, path):
+        return self._open(path)
+
+    def post(self, path, data):
+        return self._open(path, data)
+
+
+def start_server(app):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+# ---------------- Workload ----------------
+def simulate(client, user_index, users, actions, seed, samples, errors):
+    rng = random.Random(seed + user_index)
+    names, weights = zip(*ACTION_WEIGHTS.items())
+
+    def timed(route, call, *args):
+        started = time.perf_counter()
+        status = call(*args)
+        samples[route].append(time.perf_counter() - started)
+        if status >= 400:
+            errors[route] += 1
+        return status
+
+    status = timed('login', client.post, '/login',
+                   {'username': f'user{user_index}', 'password': PASSWORD})
+    if status != 302:
+        return
+    for route in rng.choices(names, weights, k=actions):
+        amount = f"{rng.uniform(1, 200):.2f}"
+        if route == 'dashboard':
+            timed(route, client.get, '/dashboard')
+        elif route == 'transactions':
+            timed(route, client.get, '/transactions')
+        elif route == 'deposit':
+            timed(route, client.post, '/deposit', {'amount': amount, 'remarks': 'load test'})
+        elif route == 'withdraw':
+            timed(route, client.post, '/withdraw', {'amount': amount, 'remarks': 'load test'})
+        else:
+            recipient = rng.randrange(1, users + 1)
+            if recipient == user_index:
+                recipient = recipient % users + 1
+            timed(route, client.post, '/transfer', {'account_number': account_number(recipient),
+                                                    'amount': amount, 'remarks': 'load test'})
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+def summarize(samples, errors, elapsed):
+    routes = {}
+    for route in ROUTES:
+        values = sorted(samples.get(route, ()))
+        if not values:
+            continue
+        routes[route] = {
+            'count': len(values),
+            'errors': errors.get(route, 0),
+            'throughput_rps': len(values) / elapsed,
+            'mean_ms': sum(values) / len(values) * 1000,
+            'p50_ms': percentile(values, 50) * 1000,
+            'p95_ms': percentile(values, 95) * 1000,
+            'p99_ms': percentile(values, 99) * 1000,
+        }
+    total = sum(route['count'] for route in routes.values())
+    return routes, {'requests': total, 'throughput_rps': total / elapsed, 'elapsed_s': elapsed}
+
+
+def compare(results, baseline, tolerance):
+    """[(route, message)] for every regression beyond `tolerance`."""
+    regressions = []
+    for key in ('mode', 'users', 'sessions', 'actions'):
+        if baseline.get('meta', {}).get(key) != results['meta'][key]:
+            print(f"note: baseline {key} is {baseline.get('meta', {}).get(key)!r}, "
+                  f"this run used {results['meta'][key]!r}")
+    for route, current in results['routes'].items():
+        before = baseline.get('routes', {}).get(route)
+        if not before:
+            continue
+        if current['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append((route, f"p95 {before['p95_ms']:.1f} -> {current['p95_ms']:.1f} ms"))
+        if current['throughput_rps'] < before['throughput_rps'] * (1 - tolerance):
+            regressions.append((route, f"throughput {before['throughput_rps']:.1f} -> "
+                                       f"{current['throughput_rps']:.1f} req/s"))
+    return regressions
+
+
+def run(args):
+    with tempfile.TemporaryDirectory() as workdir:
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(workdir, 'load.db'),
+            'SESSION_SWEEP_INTERVAL': 0,
+        })
+        started = time.perf_counter()
+        build_dataset(app, args.users, args.txns_per_user, args.seed)
+        print(f"Dataset: {args.users} users, {args.users * args.txns_per_user} transactions "
+              f"in {time.perf_counter() - started:.1f}s")
+
+        server = None
+        if args.mode == 'server':
+            server, base_url = start_server(app)
+            make_client = lambda: HttpSession(base_url)  # noqa: E731
+        else:
+            make_client = lambda: TestClientSession(app)  # noqa: E731
+
+        samples, errors = defaultdict(list), defaultdict(int)
+        rng = random.Random(args.seed)
+        customers = rng.sample(range(1, args.users + 1), min(args.sessions, args.users))
+        threads = [threading.Thread(target=simulate, args=(make_client(), user_index, args.users,
+                                                           args.actions, args.seed, samples, errors))
+                   for user_index in customers]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        if server:
+            server.shutdown()
+        with app.app_context():
+            db.engine.dispose()
+
+    routes, total = summarize(samples, errors, elapsed)
+    return {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(timespec='seconds'),
+            'mode': args.mode, 'users': args.users, 'txns_per_user': args.txns_per_user,
+            'sessions': args.sessions, 'actions': args.actions, 'seed': args.seed,
+            'python': platform.python_version(), 'cpus': os.cpu_count(),
+        },
+        'routes': routes,
+        'total': total,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--txns-per-user', type=int, default=20)
+    parser.add_argument('--sessions', type=int, default=32, help='Concurrent simulated customers.')
+    parser.add_argument('--actions', type=int, default=50, help='Requests per customer after login.')
+    parser.add_argument('--mode', choices=['testclient', 'server'], default='testclient')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', default='load_test_results.json')
+    parser.add_argument('--baseline', help='Earlier results to compare against.')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed regression (0.2 = 20%%).')
+    parser.add_argument('--save-baseline', metavar='PATH', help='Also store this run as a baseline.')
+    args = parser.parse_args()
+
+    results = run(args)
+    print(f"{'route':14} {'count':>6} {'err':>4} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for route, stats in results['routes'].items():
+        print(f"{route:14} {stats['count']:6d} {stats['errors']:4d} {stats['throughput_rps']:8.1f} "
+              f"{stats['p50_ms']:8.1f} {stats['p95_ms']:8.1f} {stats['p99_ms']:8.1f}")
+    print(f"total: {results['total']['requests']} requests, "
+          f"{results['total']['throughput_rps']:.1f} req/s")
+
+    for path in filter(None, (args.out, args.save_baseline)):
+        with open(path, 'w', encoding='utf-8') as handle:
+            json.dump(results, handle, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as handle:
+            regressions = compare(results, json.load(handle), args.tolerance)
+        for route, message in regressions:
+            print(f"REGRESSION {route}: {message}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Per-request cost of the Prometheus instrumentation.
+
+    python benchmarks/metrics.py [--requests 3000] [--rounds 5]
+
+Times a route issuing a few SQL statements with METRICS_ENABLED off and on,
+against a throwaway database. The SQL cursor listeners are installed on the
+Engine class for the whole process, so each measurement runs in its own
+interpreter; off and on alternate and the best round of each is reported.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+STATEMENTS_PER_REQUEST = 5
+
+
+def measure(enabled, requests):
+    from sqlalchemy import text
+    from app import create_app, db
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(workdir, 'bench.db'),
+            'SESSION_BACKEND': 'cookie',
+            'METRICS_ENABLED': enabled,
+        })
+
+        @app.route('/_bench/queries')
+        def bench_queries():
+            for _ in range(STATEMENTS_PER_REQUEST):
+                db.session.execute(text('SELECT 1')).scalar()
+            return 'ok'
+
+        client = app.test_client()
+        for _ in range(100):   # warm up
+            client.get('/_bench/queries')
+        started = time.perf_counter()
+        for _ in range(requests):
+            client.get('/_bench/queries')
+        return (time.perf_counter() - started) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=3000)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--child', choices=['off', 'on'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(measure(args.child == 'on', args.requests))
+        return
+
+    best = {'off': float('inf'), 'on': float('inf')}
+    for _ in range(args.rounds):
+        for mode in best:
+            output = subprocess.run([sys.executable, __file__, '--child', mode,
+                                     '--requests', str(args.requests)],
+                                    capture_output=True, text=True, check=True).stdout
+            best[mode] = min(best[mode], float(output.split()[-1]))
+    print(f"metrics off: {best['off']:8.1f} us/request")
+    print(f"metrics on:  {best['on']:8.1f} us/request ({best['on'] - best['off']:+.1f} us, "
+          f"{STATEMENTS_PER_REQUEST} statements per request)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Per-request overhead of each session backend.
+
+    python benchmarks/sessions.py [--requests 5000]
+
+Runs a read-only and a writing request against a throwaway database and
+session directory, so the real securebank.db is never touched.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flask import session  # noqa: E402
+from app import create_app, db  # noqa: E402
+
+BACKENDS = (
+    ('filesystem', {'SESSION_BACKEND': 'filesystem'}),
+    ('sqlite', {'SESSION_BACKEND': 'sqlite'}),
+    ('sqlite, no cache', {'SESSION_BACKEND': 'sqlite', 'SESSION_CACHE_SIZE': 0}),
+    ('cookie', {'SESSION_BACKEND': 'cookie'}),
+)
+
+
+def build_app(workdir, overrides):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(workdir, 'bench.db'),
+        'SESSION_FILE_DIR': os.path.join(workdir, 'flask_session'),
+        'SESSION_SWEEP_INTERVAL': 0,
+        **overrides,
+    })
+
+    @app.route('/_bench/read')
+    def bench_read():
+        return str(session.get('user_id'))
+
+    @app.route('/_bench/write')
+    def bench_write():
+        session['hits'] = session.get('hits', 0) + 1
+        return 'ok'
+
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def per_request_us(client, path, requests):
+    client.get(path)   # warm up
+    started = time.perf_counter()
+    for _ in range(requests):
+        client.get(path)
+    return (time.perf_counter() - started) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args()
+    warnings.simplefilter('ignore', DeprecationWarning)
+
+    print(f"{'backend':18} {'read us/req':>12} {'write us/req':>13}")
+    for name, overrides in BACKENDS:
+        with tempfile.TemporaryDirectory() as workdir:
+            app = build_app(workdir, overrides)
+            client = app.test_client()
+            with client.session_transaction() as sess:
+                sess['user_id'] = 1
+                sess['username'] = 'bench'
+            read = per_request_us(client, '/_bench/read', args.requests)
+            write = per_request_us(client, '/_bench/write', args.requests)
+            with app.app_context():
+                db.engine.dispose()
+        print(f"{name:18} {read:12.1f} {write:13.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""Read/write concurrency of the SQLite engine profile against SQLite defaults.
+
+    python benchmarks/sqlite_concurrency.py [--readers 8] [--writers 4] [--seconds 10]
+
+For each profile, seeds a throwaway database, then runs reader processes
+(balance plus the 20 latest transactions of a random account, like the
+dashboard) alongside writer processes (ledger deposits, one commit each)
+for `--seconds`. Reports throughput, p50/p95 latency and how many operations
+failed with "database is locked".
+
+    defaults  rollback journal, synchronous=FULL, SQLAlchemy's default pool
+    tuned     SQLITE_PRAGMAS and SQLALCHEMY_ENGINE_OPTIONS from config.Config
+    tuned+replica  the same, with reads on a replica file refreshed every 2s
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import insert, select  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from app import create_app, db, ledger  # noqa: E402
+from app.database import sqlite_pragmas  # noqa: E402
+from app.replica import REPLICA_BIND  # noqa: E402
+from app.models.models import Login, Account, Transaction  # noqa: E402
+from config import Config  # noqa: E402
+
+PROFILES = (
+    ('defaults', {'SQLITE_PRAGMAS': {}, 'SQLALCHEMY_ENGINE_OPTIONS': {}}),
+    ('tuned', {'SQLITE_PRAGMAS': Config.SQLITE_PRAGMAS,
+               'SQLALCHEMY_ENGINE_OPTIONS': Config.SQLALCHEMY_ENGINE_OPTIONS}),
+    ('tuned+replica', {'SQLITE_PRAGMAS': Config.SQLITE_PRAGMAS,
+                       'SQLALCHEMY_ENGINE_OPTIONS': Config.SQLALCHEMY_ENGINE_OPTIONS,
+                       'REPLICA_REFRESH_SECONDS': 2}),
+)
+STARTUP_SECONDS = 3   # workers build their app, then start together
+
+
+def seed(app, accounts, txns_per_account):
+    now = datetime.utcnow()
+    with app.app_context():
+        db.create_all()
+        db.session.execute(insert(Login), [
+            {'id': i, 'fullname': f'User {i}', 'email': f'u{i}@bench', 'username': f'u{i}', 'password': '-'}
+            for i in range(1, accounts + 1)])
+        db.session.execute(insert(Account), [
+            {'id': i, 'user_id': i, 'account_number': f'BENCH{i:08d}', 'balance': 1000.0}
+            for i in range(1, accounts + 1)])
+        db.session.execute(insert(Transaction), [
+            {'user_id': i, 'account_id': i, 'txn_id': f'B{i}-{n}', 'txn_type': 'deposit', 'amount': 10.0,
+             'date': now - timedelta(minutes=n)}
+            for i in range(1, accounts + 1) for n in range(txns_per_account)])
+        db.session.commit()
+
+
+def read_once(accounts, rng):
+    account_id = rng.randint(1, accounts)
+    # what @read_only does for the dashboard, without a request
+    bind = {'bind': db.engines[REPLICA_BIND]} if REPLICA_BIND in db.engines else None
+    db.session.execute(select(Account.balance).where(Account.id == account_id),
+                       bind_arguments=bind).scalar()
+    db.session.execute(select(Transaction).where(Transaction.account_id == account_id)
+                       .order_by(Transaction.date.desc()).limit(20), bind_arguments=bind).all()
+    db.session.rollback()   # end the read, as a request teardown would
+
+
+def write_once(accounts, rng):
+    ledger.deposit(db.session.get(Account, rng.randint(1, accounts)), 1.0, 'bench')
+
+
+def worker(kind, index, config, accounts, begin, seconds):
+    """One worker process: run `kind` operations from `begin` for `seconds`."""
+    app = create_app(config)
+    operation = read_once if kind == 'read' else write_once
+    rng = random.Random(index)
+    samples, errors = [], 0
+    with app.app_context():
+        if kind == 'write' and index == 0 and 'replica' in app.extensions:
+            app.extensions['replica'].start_refresher()
+        time.sleep(max(0.0, begin - time.time()))
+        deadline = begin + seconds
+        while time.time() < deadline:
+            started = time.perf_counter()
+            try:
+                operation(accounts, rng)
+            except OperationalError:
+                db.session.rollback()
+                errors += 1
+                continue
+            samples.append(time.perf_counter() - started)
+    return kind, samples, errors
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] * 1000 if values else float('nan')
+
+
+def run(name, overrides, args):
+    with tempfile.TemporaryDirectory() as workdir:
+        config = {
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(workdir, 'bench.db'),
+            'SESSION_SWEEP_INTERVAL': 0,
+            'METRICS_ENABLED': False,
+            **overrides,
+        }
+        if 'REPLICA_REFRESH_SECONDS' in overrides:
+            config['REPLICA_DATABASE_URI'] = 'sqlite:///' + os.path.join(workdir, 'replica.db')
+        app = create_app(config)
+        seed(app, args.accounts, args.txns)
+        with app.app_context():
+            if 'replica' in app.extensions:
+                app.extensions['replica'].refresh(force=True)
+            with db.engine.connect() as connection:
+                pragmas = sqlite_pragmas(connection) or "SQLite defaults"
+            db.engine.dispose()   # before forking the workers
+
+        # worker processes, like the app's own behind gunicorn: no shared GIL or pool
+        begin = time.time() + STARTUP_SECONDS
+        results = {'read': ([], [0]), 'write': ([], [0])}
+        jobs = [('read', i) for i in range(args.readers)] + [('write', i) for i in range(args.writers)]
+        with ProcessPoolExecutor(len(jobs)) as pool:
+            futures = [pool.submit(worker, kind, i, config, args.accounts, begin, args.seconds)
+                       for kind, i in jobs]
+            for future in futures:
+                kind, samples, errors = future.result()
+                results[kind][0].extend(samples)
+                results[kind][1][0] += errors
+
+    print(f"{name}: {pragmas}")
+    for kind, (samples, errors) in results.items():
+        print(f"  {kind:5} {len(samples) / args.seconds:8.0f} ops/s   p50 {percentile(samples, 50):7.2f} ms   "
+              f"p95 {percentile(samples, 95):7.2f} ms   locked {errors[0]}")
+    return {kind: len(samples) / args.seconds for kind, (samples, _) in results.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--accounts', type=int, default=2000)
+    parser.add_argument('--txns', type=int, default=50, help='Seed transactions per account.')
+    args = parser.parse_args()
+
+    rates = {name: run(name, overrides, args) for name, overrides in PROFILES}
+    for name in ('tuned', 'tuned+replica'):
+        for kind in ('read', 'write'):
+            before, after = rates['defaults'][kind], rates[name][kind]
+            print(f"{kind}s: {after / before if before else float('inf'):.1f}x with {name}")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,13 +3,88 @@ import os
 # Base directory of the project
 basedir = os.path.abspath(os.path.dirname(__file__))
 
+
 class Config:
-    # SQLite DB stored inside /instance/SecureBank.db
-    SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(basedir, "instance", "SecureBank.db")
+    SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL", "sqlite:///" + os.path.join(basedir, "securebank.db"))
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
     # Secret key for sessions, CSRF, etc.
-    SECRET_KEY = os.getenv("SECRET_KEY", "supersecurekey123")
+    SECRET_KEY = os.getenv("SECRET_KEY", "supersecretkey")
 
     # Optional: limit query echo for debugging
     SQLALCHEMY_ECHO = False
+
+    # 'sqlite' (default), 'cookie' or 'filesystem', see app/sessions.py
+    SESSION_BACKEND = os.getenv("SESSION_BACKEND", "sqlite")
+
+    # Applied to every new SQLite connection, see app/database.py.
+    # WAL lets readers run alongside the single writer instead of waiting for
+    # it; synchronous=NORMAL is durable across application crashes in WAL mode
+    # and only syncs at checkpoints. cache_size is per connection (negative
+    # means KiB); mmap_size is shared through the OS page cache.
+    SQLITE_PRAGMAS = {
+        "journal_mode": "wal",
+        "synchronous": "normal",
+        "busy_timeout": 5000,          # ms to wait for the write lock before "database is locked"
+        "cache_size": -16000,
+        "mmap_size": 256 * 1024 * 1024,
+        "foreign_keys": "on",
+        "temp_store": "memory",
+        "journal_size_limit": 64 * 1024 * 1024,   # truncate the WAL back to this after checkpoints
+    }
+
+    # Optional read replica for the read-only views, see app/replica.py.
+    # Point it at a second SQLite file: the app keeps it refreshed from the primary.
+    REPLICA_DATABASE_URI = os.getenv("REPLICA_DATABASE_URL")
+    REPLICA_REFRESH_SECONDS = int(os.getenv("REPLICA_REFRESH_SECONDS", "30"))
+
+    # A connection per busy thread; SQLite connections are cheap, so the pool
+    # mostly bounds how many threads can hold one at once.
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "pool_size": 8,
+        "max_overflow": 8,
+        "pool_timeout": 10,
+    }
+
+    # Threads per worker for the Flask routes under serve.py --mode asgi, see app/asgi.py
+    WSGI_THREADS = int(os.getenv("WSGI_THREADS", "16"))
+
+    # Keys merchants and acquirers send as X-API-Key to POST /cards/authorize,
+    # comma-separated. With none set the endpoint refuses every call.
+    CARD_AUTH_API_KEYS = tuple(key.strip() for key in os.getenv("CARD_AUTH_API_KEYS", "").split(",")
+                               if key.strip())
+
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+
+
+class ProductionConfig(Config):
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "pool_size": 16,
+        "max_overflow": 16,
+        "pool_timeout": 10,
+    }
+
+
+class TestingConfig(Config):
+    TESTING = True
+    # in-memory database on a single shared connection (Flask-SQLAlchemy picks the pool)
+    SQLALCHEMY_DATABASE_URI = os.getenv("TEST_DATABASE_URL", "sqlite://")
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+    SQLITE_PRAGMAS = {
+        "journal_mode": "memory",
+        "synchronous": "off",
+        "foreign_keys": "on",
+    }
+    SESSION_SWEEP_INTERVAL = 0
+    IDEMPOTENCY_SWEEP_INTERVAL = 0
+
+
+# Picked with SECUREBANK_CONFIG; create_app(config_name=...) overrides it.
+CONFIGS = {
+    "development": DevelopmentConfig,
+    "production": ProductionConfig,
+    "testing": TestingConfig,
+    "default": Config,
+}
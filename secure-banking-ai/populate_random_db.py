@@ -1,175 +1,317 @@
+"""Populate the database with synthetic customers and transaction history.
+
+    python populate_random_db.py --users 100000 --txns 10000000 --seed 7
+
+Resets the database, then generates `--users` customers, each with an
+account, a UPI id, cards and subscriptions, and `--txns` transactions
+in total over the `--days` before `--end`. Blocks of customers are generated
+in parallel worker processes and inserted by this one with executemany in
+large chunks; the transactions indexes are dropped during the load and
+rebuilt once at the end. Balances are recomputed from the inserted history,
+then the fraud feature store is rebuilt (skip with --skip-features).
+
+The same --seed, --users, --txns, --days and --end always produce the same
+data (password hash salts aside), whatever the number of workers. The first
+six customers are the demo logins (alice/alice123 ... admin/admin123);
+every other customer `userN` signs in with SYNTHETIC_PASSWORD and every
+card PIN is SYNTHETIC_PIN.
+"""
+import argparse
+import itertools
+import os
 import random
-from datetime import datetime, timedelta, timezone
-from werkzeug.security import generate_password_hash
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from operator import itemgetter
+from sqlalchemy import func, select, update
 from app import create_app, db
+from config import Config
 from app.models.models import Login, Account, Transaction, Upi, Card, Subscription
 
-# ------------------- Flask app context -------------------
-app = create_app()
-with app.app_context():
+SYNTHETIC_PASSWORD = 'Password123!'
+SYNTHETIC_PIN = '1234'
+DEMO_USERS = [
+    ("Alice Smith", "alice@example.com", "alice", "alice123"),
+    ("Bob Smith", "bob@example.com", "bob", "bob123"),
+    ("Charlie Smith", "charlie@example.com", "charlie", "charlie123"),
+    ("David Smith", "david@example.com", "david", "david123"),
+    ("Eve Smith", "eve@example.com", "eve", "eve123"),
+    ("Admin User", "admin@gmail.com", "admin", "admin123"),
+]
+FIRST_NAMES = ["Aarav", "Priya", "Rahul", "Ananya", "Vikram", "Sneha", "Arjun", "Divya", "Karan",
+               "Meera", "Rohan", "Isha", "Nikhil", "Pooja", "Sameer", "Kavya", "Aditya", "Neha"]
+LAST_NAMES = ["Sharma", "Patel", "Iyer", "Reddy", "Gupta", "Nair", "Singh", "Das", "Mehta",
+              "Rao", "Joshi", "Kapoor", "Menon", "Verma", "Bose", "Pillai"]
+MERCHANTS = ["Amazon", "Flipkart", "Swiggy", "Zomato", "BigBasket", "Uber", "Ola", "Reliance Fresh",
+             "DMart", "Myntra", "BookMyShow", "Indian Oil", "Apollo Pharmacy", "Croma", "IRCTC"]
+# (name, amount, frequency); the amount stays fixed for each subscriber
+PLANS = [("Netflix", 649.0, "Monthly"), ("Spotify", 119.0, "Monthly"),
+         ("Amazon Prime", 1499.0, "Yearly"), ("Disney+ Hotstar", 299.0, "Monthly"),
+         ("YouTube Premium", 129.0, "Monthly"), ("Gym Membership", 1800.0, "Monthly"),
+         ("Newspaper", 90.0, "Weekly"), ("Cloud Storage", 1300.0, "Yearly")]
+PERIODS = {"Weekly": timedelta(weeks=1), "Monthly": timedelta(days=30), "Yearly": timedelta(days=365)}
+# share of the non-subscription events; a transfer writes two rows
+EVENT_WEIGHTS = {'deposit': 20, 'withdrawal': 20, 'transfer_sent': 15, 'card_payment': 45}
+# busier in the day and evening than at night
+HOUR_WEIGHTS = [1, 1, 1, 1, 1, 2, 4, 7, 9, 10, 10, 10, 11, 10, 10, 10, 10, 11, 12, 12, 11, 8, 5, 2]
+HOUR_CUMULATIVE = list(itertools.accumulate(HOUR_WEIGHTS))
+BLOCK_USERS = 1000   # customers per generation task; fixed so output does not depend on --workers
+CARDS_PER_USER = 2   # at most; card ids are allotted per customer, so any worker count gives the same ids
+INSERT_CHUNK = 50000
+
+COLUMNS = {
+    Login: ('id', 'fullname', 'email', 'username', 'phone', 'password', 'is_admin', 'created_at'),
+    Account: ('id', 'user_id', 'account_number', 'balance', 'created_at'),
+    Upi: ('account_id', 'upi_id', 'verified'),
+    Card: ('id', 'account_id', 'card_number', 'card_type', 'expiry', 'cvv', 'blocked', 'limit', 'pin'),
+    Subscription: ('user_id', 'name', 'amount', 'frequency', 'active', 'created_at',
+                   'next_billing_date', 'last_billed_date'),
+    Transaction: ('user_id', 'account_id', 'txn_id', 'txn_type', 'amount', 'counterparty',
+                  'remarks', 'date', 'card_id'),
+}
+
+
+def account_number(user_id):
+    return f"AC{user_id:010d}"
+
+
+# ---------------- Generation (worker processes) ----------------
+def _activity(seed, users, total):
+    """Transactions per customer: heavy-tailed, so a few customers are very busy."""
+    rng = random.Random(f"{seed}-activity")
+    weights = [min(rng.paretovariate(1.5), 50.0) for _ in range(users)]   # capped at 50x typical
+    scale = total / sum(weights)
+    counts = [int(weight * scale) for weight in weights]
+    for i in rng.sample(range(users), total - sum(counts)):
+        counts[i] += 1
+    return counts
+
+
+def _text(when):
+    # the text SQLAlchemy stores for a DateTime on SQLite
+    return when.isoformat(' ', 'microseconds')
+
+
+def generate_block(task):
+    """Rows for customers first_id .. first_id + len(counts) - 1, per table."""
+    seed, first_id, counts, users, end, days, hashes = task
+    rng = random.Random(f"{seed}-{first_id}")
+    start = end - timedelta(days=days)
+    rows = {table: [] for table in COLUMNS}
+    logins, accounts, upis, cards = rows[Login], rows[Account], rows[Upi], rows[Card]
+    subscriptions, txns = rows[Subscription], rows[Transaction]
+    event_types = list(EVENT_WEIGHTS)
+    event_cumulative = list(itertools.accumulate(EVENT_WEIGHTS.values()))
+
+    for user_id, budget in enumerate(counts, first_id):
+        opened = start - timedelta(days=rng.randrange(1, 1500))
+        if user_id <= len(DEMO_USERS):
+            fullname, email, username, _ = DEMO_USERS[user_id - 1]
+            password, is_admin = hashes[username], username == 'admin'
+        else:
+            fullname = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+            email, username = f"user{user_id}@example.com", f"user{user_id}"
+            password, is_admin = hashes[None], False
+        number = account_number(user_id)
+        logins.append((user_id, fullname, email, username, f"+91{6000000000 + user_id}", password,
+                       is_admin, _text(opened)))
+        accounts.append((user_id, user_id, number, 0.0, _text(opened)))
+        upis.append((user_id, f"{username}@bank", rng.random() < 0.9))
+
+        usable_cards = []   # (card id, card number)
+        for k in range(rng.choices(range(CARDS_PER_USER + 1), (15, 60, 25))[0]):
+            card_id, card_number = (user_id - 1) * CARDS_PER_USER + k + 1, f"4{user_id:09d}{k:06d}"
+            blocked = rng.random() < 0.03
+            if not blocked:
+                usable_cards.append((card_id, card_number))
+            cards.append((card_id, user_id, card_number, rng.choice(('debit', 'debit', 'credit')),
+                          f"{rng.randint(1, 12):02d}/{end.year % 100 + rng.randint(1, 5):02d}",
+                          f"{rng.randint(100, 999)}", blocked,
+                          float(rng.choice((10000, 25000, 50000, 100000))), hashes['pin']))
+
+        # subscription charges on their billing schedule, up to a fifth of the budget
+        events = []
+        for name, amount, frequency in rng.sample(PLANS, rng.choices(range(5), (25, 30, 25, 15, 5))[0]):
+            period = PERIODS[frequency]
+            created = start - timedelta(days=rng.randrange(0, 400))
+            billed = created + period
+            while billed < start:
+                billed += period
+            active = rng.random() < 0.85
+            while active and billed <= end and len(events) < budget // 5:
+                events.append(((billed - start).total_seconds(), 'subscription', (name, amount, frequency)))
+                billed += period
+            last = billed - period
+            subscriptions.append((user_id, name, amount, frequency, active, _text(created),
+                                  _text(billed) if active else None,
+                                  _text(last) if last >= created + period else None))
+
+        # everything else at random times, drawn in bulk: (seconds after start, kind, None)
+        remaining = budget - len(events)
+        hours = rng.choices(range(24), cum_weights=HOUR_CUMULATIVE, k=remaining)
+        for kind, hour in zip(rng.choices(event_types, cum_weights=event_cumulative, k=remaining), hours):
+            if remaining <= 0:
+                break
+            if kind == 'card_payment' and not usable_cards or kind == 'transfer_sent' and remaining < 2:
+                kind = 'deposit'
+            day = int(rng.random() * days)
+            events.append(((day * 24 + hour + rng.random()) * 3600, kind, None))
+            remaining -= 2 if kind == 'transfer_sent' else 1
+        events.sort(key=itemgetter(0))
+
+        # running balance over this customer's own events only; transfers
+        # received from others arrive on top and can only raise it
+        balance = 0.0
+        income = rng.lognormvariate(10.0, 0.6)
+        txn_ids = (f"SYN{user_id:07x}{n:05x}" for n in itertools.count())
+        for offset, kind, plan in events:
+            date = _text(start + timedelta(seconds=offset))
+            if kind == 'subscription':
+                amount = plan[1]
+            elif kind == 'card_payment':
+                amount = round(rng.lognormvariate(6.5, 1.1), 2)
+            elif kind != 'deposit':
+                amount = round(rng.lognormvariate(7.8, 1.0), 2)
+            if kind == 'deposit' or amount > balance:
+                # an unaffordable debit becomes the salary coming in instead
+                # (twice for a transfer, which was budgeted two rows)
+                for _ in range(2 if kind == 'transfer_sent' else 1):
+                    salary = rng.random() < 0.6 or kind != 'deposit'
+                    amount = round(income * rng.uniform(0.8, 1.2) if salary
+                                   else rng.lognormvariate(7.5, 1.2), 2)
+                    balance += amount
+                    txns.append((user_id, user_id, next(txn_ids), 'deposit', amount, None,
+                                 'Salary' if salary else 'Cash deposit', date, None))
+                continue
+
+            balance -= amount
+            if kind == 'withdrawal':
+                txns.append((user_id, user_id, next(txn_ids), kind, amount, None, 'ATM withdrawal', date,
+                             None))
+            elif kind == 'subscription':
+                name, _, frequency = plan
+                txns.append((user_id, user_id, next(txn_ids), kind, amount, name,
+                             f"{name} ({frequency}) due {date[:10]}", date, None))
+            elif kind == 'card_payment':
+                merchant = rng.choice(MERCHANTS)
+                card_id, card_number = rng.choice(usable_cards)
+                txns.append((user_id, user_id, next(txn_ids), kind, amount, merchant,
+                             f"Card ending {card_number[-4:]} - {merchant}", date, card_id))
+            else:
+                recipient = rng.randrange(1, users)
+                recipient += recipient >= user_id   # anyone but the sender
+                other = account_number(recipient)
+                txns.append((user_id, user_id, next(txn_ids), kind, amount, other,
+                             f"To {other} - Transfer", date, None))
+                txns.append((recipient, recipient, next(txn_ids), 'transfer_received', amount, number,
+                             f"From {number} - Transfer", date, None))
+    return rows
 
-    # ---------------- Reset database -------------------
+
+# ---------------- Loading (this process) ----------------
+def _insert_sql(table):
+    columns = COLUMNS[table]
+    quote = db.engine.dialect.identifier_preparer.quote
+    return (f"INSERT INTO {table.__tablename__} ({', '.join(quote(column) for column in columns)}) "
+            f"VALUES ({', '.join('?' * len(columns))})")
+
+
+def _tasks(args, counts, hashes):
+    end = datetime.combine(args.end, datetime.min.time())
+    for first in range(0, args.users, BLOCK_USERS):
+        yield (args.seed, first + 1, counts[first:first + BLOCK_USERS], args.users, end, args.days, hashes)
+
+
+def populate(args):
+    from flask_migrate import stamp
+    from app.features import rebuild_features
+    from app.balances import due_boundaries, take_snapshots
+    from app.recipients import rebuild_payees
+    from app.rollups import rebuild_rollups
+    from app.hashing import hash_secret
+
+    started = time.perf_counter()
     db.drop_all()
     db.create_all()
-    print("✅ Database reset. Tables created!")
-
-    # ------------------- Users -------------------
-    users_data = [
-        ("Alice Smith", "alice@example.com", "alice", "alice123"),
-        ("Bob Smith", "bob@example.com", "bob", "bob123"),
-        ("Charlie Smith", "charlie@example.com", "charlie", "charlie123"),
-        ("David Smith", "david@example.com", "david", "david123"),
-        ("Eve Smith", "eve@example.com", "eve", "eve123"),
-        ("Admin User", "admin@gmail.com", "admin", "admin123"),
-    ]
-
-    users = []
-    for fullname, email, username, password in users_data:
-        user = Login(
-            fullname=fullname,
-            email=email,
-            username=username,
-            phone=f"+91{random.randint(6000000000, 9999999999)}",
-            password=generate_password_hash(password, method="pbkdf2:sha256"),
-            is_admin=(username == "admin"),
-            created_at=datetime.now(timezone.utc),
-        )
-        db.session.add(user)
-        users.append(user)
-
-    db.session.commit()
-    print("👤 Users added!")
-
-    # ------------------- Accounts -------------------
-    accounts = []
-    for user in users:
-        account = Account(
-            user_id=user.id,
-            account_number=f"AC{random.randint(10000000, 99999999)}",
-            balance=0.0,
-            created_at=datetime.now(timezone.utc),
-        )
-        db.session.add(account)
-        accounts.append(account)
-    db.session.commit()
-    print("🏦 Accounts added!")
-
-    # ------------------- Transactions -------------------
-    for account in accounts:
-        for _ in range(random.randint(5, 10)):
-            txn_type = random.choice(["deposit", "withdrawal"])
-            amount = round(random.uniform(50, 1000), 2)
-
-            if txn_type == "withdrawal" and account.balance < amount:
-                txn_type = "deposit"
-
-            txn_date = datetime.now(timezone.utc) - timedelta(
-                days=random.randint(0, 90),
-                hours=random.randint(0, 23),
-                minutes=random.randint(0, 59),
-            )
-
-            txn = Transaction(
-                user_id=account.user_id,
-                account_id=account.id,
-                txn_id=f"TXN{random.randint(1000000, 9999999)}",
-                txn_type=txn_type,
-                amount=amount,
-                counterparty=None,
-                remarks=random.choice(["Payment", "Bill", "Salary", "Shopping"]),
-                date=txn_date,
-            )
-            db.session.add(txn)
-
-            if txn_type == "deposit":
-                account.balance += amount
-            else:
-                account.balance -= amount
-    db.session.commit()
-    print("💰 Deposits & Withdrawals added!")
-
-    # ------------------- Transfers -------------------
-    for _ in range(random.randint(5, 10)):
-        sender, receiver = random.sample(accounts, 2)
-        if sender.balance > 20:
-            amount = round(random.uniform(20, sender.balance), 2)
-            sender.balance -= amount
-            receiver.balance += amount
-
-            transfer_date = datetime.now(timezone.utc) - timedelta(
-                days=random.randint(0, 90),
-                hours=random.randint(0, 23),
-                minutes=random.randint(0, 59),
-            )
-
-            txn_sender = Transaction(
-                user_id=sender.user_id,
-                account_id=sender.id,
-                txn_id=f"TXN{random.randint(1000000, 9999999)}",
-                txn_type="transfer",
-                amount=amount,
-                counterparty=receiver.account_number,
-                remarks="Transfer to another account",
-                date=transfer_date,
-            )
-            txn_receiver = Transaction(
-                user_id=receiver.user_id,
-                account_id=receiver.id,
-                txn_id=f"TXN{random.randint(1000000, 9999999)}",
-                txn_type="transfer",
-                amount=amount,
-                counterparty=sender.account_number,
-                remarks="Received from another account",
-                date=transfer_date,
-            )
-            db.session.add(txn_sender)
-            db.session.add(txn_receiver)
-
-    db.session.commit()
-    print("🔄 Transfers added!")
-
-    # ------------------- UPI -------------------
-    for account in accounts:
-        upi = Upi(
-            account_id=account.id,
-            upi_id=f"{account.user_id}_{random.randint(1000,9999)}@bank",
-            verified=random.choice([True, False]),
-        )
-        db.session.add(upi)
-    db.session.commit()
-    print("📱 UPI IDs added!")
-
-    # ------------------- Cards -------------------
-    for account in accounts:
-        card = Card(
-            account_id=account.id,
-            card_number=f"{random.randint(4000000000000000, 4999999999999999)}",
-            card_type=random.choice(["debit", "credit"]),
-            expiry=f"{random.randint(1,12):02d}/{random.randint(25,30)}",
-            cvv=f"{random.randint(100,999)}",
-            blocked=random.choice([True, False]),
-            limit=round(random.uniform(1000, 10000), 2),
-            pin=generate_password_hash(f"{random.randint(1000,9999)}")  # PIN hashed
-        )
-        db.session.add(card)
-    db.session.commit()
-    print("💳 Cards with PINs added!")
-
-    # ------------------- Subscriptions -------------------
-    for user in users:
-        now = datetime.now(timezone.utc)
-        sub = Subscription(
-            user_id=user.id,
-            name=random.choice(["Netflix", "Spotify", "Amazon Prime", "Disney+", "YouTube Premium"]),
-            amount=round(random.uniform(5, 50), 2),
-            frequency=random.choice(["Monthly", "Yearly"]),
-            active=random.choice([True, False]),
-            created_at=now,
-            last_billed_date=now - timedelta(days=random.randint(0, 30)),
-            next_billing_date=now + timedelta(days=random.randint(10, 40)),
-        )
-        db.session.add(sub)
-    db.session.commit()
-    print("📺 Subscriptions added!")
-
-    print("🎉 Database populated successfully with timezone-aware datetimes!")
+    stamp(directory=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations'))
+
+    # a KDF run costs tens of milliseconds: hash each distinct secret once
+    hashes = {username: hash_secret(password) for _, _, username, password in DEMO_USERS}
+    hashes[None] = hash_secret(SYNTHETIC_PASSWORD)
+    hashes['pin'] = hash_secret(SYNTHETIC_PIN)
+
+    statements = {table: _insert_sql(table) for table in COLUMNS}
+    txn_indexes = list(Transaction.__table__.indexes)
+    counts = _activity(args.seed, args.users, args.txns)
+    totals = dict.fromkeys(COLUMNS, 0)
+    with db.engine.begin() as connection:
+        # index every row once, at the end
+        for index in txn_indexes:
+            index.drop(connection)
+
+    with ProcessPoolExecutor(args.workers) as pool:
+        for rows in pool.map(generate_block, _tasks(args, counts, hashes)):
+            with db.engine.begin() as connection:
+                for table, table_rows in rows.items():
+                    for first in range(0, len(table_rows), INSERT_CHUNK):
+                        connection.exec_driver_sql(statements[table], table_rows[first:first + INSERT_CHUNK])
+                    totals[table] += len(table_rows)
+            print(f"\r{totals[Login]}/{args.users} customers, {totals[Transaction]} transactions "
+                  f"({time.perf_counter() - started:.0f}s)", end='', flush=True)
+    print()
+
+    with db.engine.begin() as connection:
+        print("Building transaction indexes...")
+        for index in txn_indexes:
+            index.create(connection)
+        print("Computing balances...")
+        signed = func.sum(func.iif(Transaction.txn_type.in_(('deposit', 'transfer_received')),
+                                   Transaction.amount, -Transaction.amount))
+        connection.execute(update(Account).values(balance=func.round(func.coalesce(
+            select(signed).where(Transaction.account_id == Account.id).scalar_subquery(), 0.0), 2)))
+        connection.exec_driver_sql('ANALYZE')
+
+    print("Rebuilding recent payees...")
+    rebuild_payees()
+    print("Rebuilding spending rollups...")
+    rebuild_rollups()
+    print("Taking balance snapshots...")
+    for boundary in due_boundaries(backfill=True):
+        take_snapshots(boundary)
+    if not args.skip_features:
+        print("Rebuilding fraud features...")
+        rebuild_features()
+
+    elapsed = time.perf_counter() - started
+    print(", ".join(f"{count} {table.__tablename__}" for table, count in totals.items()))
+    print(f"Done in {elapsed:.1f}s ({totals[Transaction] / elapsed:.0f} transactions/s overall).")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--txns', type=int, default=100000, help='Transactions in total.')
+    parser.add_argument('--days', type=int, default=365, help='Length of the history.')
+    parser.add_argument('--end', type=lambda value: datetime.strptime(value, '%Y-%m-%d').date(),
+                        default=datetime.utcnow().date(), help='Last day of the history (YYYY-MM-DD).')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--database', help='SQLAlchemy URI; defaults to the app database.')
+    parser.add_argument('--skip-features', action='store_true', help='Do not rebuild the fraud features.')
+    args = parser.parse_args()
+    if args.users < len(DEMO_USERS):
+        parser.error(f"--users must be at least {len(DEMO_USERS)}")
+
+    # a scratch load: no per-commit sync, and transfers may reference
+    # customers of blocks that are not inserted yet
+    overrides = {'SQLITE_PRAGMAS': {**Config.SQLITE_PRAGMAS, 'synchronous': 'off', 'foreign_keys': 'off'}}
+    if args.database:
+        overrides['SQLALCHEMY_DATABASE_URI'] = args.database
+    app = create_app(overrides)
+    with app.app_context():
+        populate(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Production launcher; run.py stays the development server.
+
+    python serve.py [--mode sync|asgi] [--bind 0.0.0.0:8000] [--workers N] [--threads T]
+
+sync   gunicorn with threaded workers running the Flask app as is.
+asgi   uvicorn running app.asgi: the balance and transaction-list JSON
+       endpoints on async database reads, everything else on Flask in a
+       thread pool (see app/asgi.py).
+
+Each worker is a separate process with its own caches and connection pool;
+--workers defaults to the number of CPUs. Settings come from config.py as
+usual (SECUREBANK_CONFIG, DATABASE_URL, ...); SECUREBANK_CONFIG defaults to
+production here.
+"""
+import argparse
+import os
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def serve_sync(args):
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', args.bind)
+            self.cfg.set('workers', args.workers)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('threads', args.threads)
+            self.cfg.set('accesslog', '-' if args.access_log else None)
+
+        def load(self):
+            from app import create_app
+            return create_app()
+
+    Server().run()
+
+
+def serve_asgi(args):
+    import uvicorn
+
+    host, _, port = args.bind.rpartition(':')
+    os.environ['WSGI_THREADS'] = str(args.threads)   # read by config.py in each worker
+    uvicorn.run('app.asgi:create_asgi_app', factory=True, host=host or '127.0.0.1', port=int(port),
+                workers=args.workers, app_dir=ROOT, access_log=args.access_log, lifespan='on')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mode', choices=['sync', 'asgi'], default='sync')
+    parser.add_argument('--bind', default='127.0.0.1:8000', help='host:port')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes.')
+    parser.add_argument('--threads', type=int, default=16,
+                        help='Request threads per worker (asgi: for the Flask routes).')
+    parser.add_argument('--access-log', action='store_true')
+    args = parser.parse_args()
+
+    os.environ.setdefault('SECUREBANK_CONFIG', 'production')
+    if args.mode == 'sync':
+        serve_sync(args)
+    else:
+        serve_asgi(args)
+
+
+if __name__ == '__main__':
+    main()